@@ -1,59 +1,106 @@
 #!/usr/bin/env python3
-import subprocess
-import re
+import argparse
 import os
 import statistics
 import csv
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import harnessProfile
+from counterStore import parse_counter_set
+from gemmVariant import VARIANT_COLUMNS, add_variant_args, layout_tag, variant_from_args
+from getKernelTime import BACKENDS
+from sweepScheduler import run_sweep, stat_columns, stat_values, visible_devices
+from resultStore import ResultStore, current_env
+from stability import ORDERS, SENTINEL_EVERY, WINDOW, parse_sentinel
+from analyzeResults import load_device_profile
+from perfModel import active_learn, prediction_rows, write_predictions
+from shapeSpace import AUTOPERF_SPACE, dense_size, explore, parse_grid, parse_space
+
+# === 命令行参数 ===
+parser = argparse.ArgumentParser(description="Cijk vs lightop gemm 性能 sweep")
+parser.add_argument("--backend", choices=sorted(BACKENDS), default="hipprof",
+                    help="计时后端；hipprof 以外的后端在进程内对 benchGemm.py 的 OPS 计时")
+parser.add_argument("--space", help="shape space 文件（见 shapeSpace.py），默认 16 个尺寸的网格且 M*K*N < 1024*1024")
+# 自适应探索和主动学习二选一
+search = parser.add_mutually_exclusive_group()
+search.add_argument("--adaptive", action="store_true",
+                    help="自适应探索：先测粗网格，只在 Cijk/gemm 胜者翻转或时间比不平滑处二分加密（使用 space 中第一行 grid）")
+parser.add_argument("--stride", type=int, default=4, help="自适应探索的粗网格步长（轴上每隔几个值取一个）")
+search.add_argument("--active", action="store_true",
+                    help="主动学习：用性能模型（见 perfModel.py）预测未测 shape，只测预测不确定或 Cijk/gemm 胜者可能翻转的 shape")
+parser.add_argument("--budget", type=int, help="主动学习最多测量的 shape 数")
+parser.add_argument("--counters", help="hipprof 额外采集的硬件计数器：计数器组名或计数器名，逗号分隔（见 counterStore.py）")
+parser.add_argument("--counter-store", help="把每次 kernel launch 的全部计数器写入这个 Parquet 库，如 temp/counters")
+# 测量稳定性（见 stability.py）：交错/随机的运行顺序、哨兵 shape 漂移校正、CPU 绑核
+parser.add_argument("--order", choices=ORDERS, default="sequential",
+                    help="运行顺序：sequential 每个 shape 连续测完；interleave 在一个窗口内的 shape 之间轮流各跑一次；random 再打乱每轮顺序")
+parser.add_argument("--window", type=int, default=WINDOW, help="交错顺序下每张卡同时在测的 shape 数")
+parser.add_argument("--sentinel", help="哨兵 shape 'M K N'，每 --sentinel-every 次运行重测一次，用于检测并校正漂移")
+parser.add_argument("--sentinel-every", type=int, default=SENTINEL_EVERY)
+parser.add_argument("--pin-cpus", help="worker 绑核：auto、'0-7' 或每个 worker 一组 '0-3;4-7'")
+parser.add_argument("--seed", type=int, help="随机顺序的种子")
+parser.add_argument("--harness-profile", help="测量框架自身的耗时分解（启动、hipprof、等文件、解析、写 CSV 等，见 harnessProfile.py），"
+                    "Chrome trace 和汇总表写入这个目录，如 temp/harness_profile")
+# dtype / 转置 / batch / ld padding / alpha beta（见 gemmVariant.py），lightop 不支持的组合记为 N/A
+add_variant_args(parser, "fp16")
+ARGS = parser.parse_args()
+VARIANT = variant_from_args(ARGS)
+harnessProfile.start(ARGS.harness_profile)
 
 # === 配置参数 ===
-SIZES = []
-
-# === 不同 K 值 sweep ===
-for M in [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 7168, 8192, 9216]:
-    for K in [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 7168, 8192, 9216]:
-        for N in [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 7168, 8192, 9216]:
-            if M*K*N < 1024*1024:
-                SIZES.append((M, K, N))
+if ARGS.space:
+    with open(ARGS.space, "r") as f:
+        SPACE = f.read()
+else:
+    SPACE = AUTOPERF_SPACE
+SIZES = parse_space(SPACE)
 
 print(f"Total test cases: {len(SIZES)}")
 
-REPEAT = 10
+# 自适应重复次数：中位数 95% 置信区间宽度 < 2% 即停止，最少 5 次、最多 30 次
+MIN_REPEAT = 5
+REPEAT = 30
+REL_CI = 0.02
 TEMP_DIR = "temp"
 CSV_FILE = os.path.join(TEMP_DIR, "gemm_benchmark.csv")
+PREDICTED_CSV_FILE = os.path.join(TEMP_DIR, "gemm_predicted.csv")
+DEVICE_PROFILE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "device_profile.json")
 
 os.makedirs(TEMP_DIR, exist_ok=True)
 
-# 正则匹配 kernel time
-RE_GEMM = re.compile(r'kernel-name:"[^"]*gemm[^"]*".*?kernel time\s+([\d.]+)\(s\)', re.S | re.I)
-RE_CIJK = re.compile(r'kernel-name:"Cijk_Ailk_Bljk[^"]*".*?kernel time\s+([\d.]+)\(s\)', re.S)
-
-def run_benchmark(m, k, n):
-    """运行一次 hipprof 并解析结果"""
-    print(f"==> Running M={m}, K={k}, N={n}")
-    cmd = ["hipprof", "--pmc", "python", "benchGemm.py", str(m), str(k), str(n)]
-    subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-    # 找到 pmc_results 文件
-    pmc_files = [f for f in os.listdir(".") if f.startswith("pmc_results_") and f.endswith(".txt")]
-    if not pmc_files:
-        print("No pmc_results file found.")
-        return None, None
-
-    pmc_file = max(pmc_files, key=os.path.getmtime)
-    target_path = os.path.join(TEMP_DIR, f"M{m}_K{k}_N{n}_{len(os.listdir(TEMP_DIR))}.txt")
-    os.rename(pmc_file, target_path)
-
-    with open(target_path, "r") as f:
-        text = f.read()
-
-    # 提取两个kernel的时间
-    cijk_times = [float(x) for x in RE_CIJK.findall(text)]
-    gemm_times = [float(x) for x in RE_GEMM.findall(text)]
-
-    cijk_time = min(cijk_times) if cijk_times else None
-    gemm_time = min(gemm_times) if gemm_times else None
-
-    return cijk_time, gemm_time
+# kernel 名匹配（一次流式扫描同时匹配两类 kernel）
+CIJK_PATTERN = "Cijk_Ailk_Bljk*"
+GEMM_PATTERN = "*gemm*"
+
+# 多卡并行：每张卡一个 worker，按 FLOPs 从大到小分配 shape
+DEVICES = visible_devices()
+PROFILER = os.environ.get("HIPPROF", "hipprof --pmc")
+SWEEP_OPTIONS = {
+    "backend": ARGS.backend,
+    "bench_cmd": "python benchGemm.py",
+    "patterns": [CIJK_PATTERN, GEMM_PATTERN],
+    "ignore_case": [GEMM_PATTERN],
+    "pick": "min",
+    "min_repeat": MIN_REPEAT,
+    "repeat": REPEAT,
+    "rel_ci": REL_CI,
+    "profiler": PROFILER,
+    "temp_dir": TEMP_DIR,
+    "variant": VARIANT,
+    "counters": parse_counter_set(ARGS.counters),
+    "counter_store": ARGS.counter_store,
+    "order": ARGS.order,
+    "window": ARGS.window,
+    "sentinel": parse_sentinel(ARGS.sentinel),
+    "sentinel_every": ARGS.sentinel_every,
+    "cpus": ARGS.pin_cpus,
+    "seed": ARGS.seed,
+}
+
+# 结果库：已测过的 shape 直接跳过，中途崩溃重启后从断点继续
+STORE = ResultStore(os.path.join(TEMP_DIR, "results.sqlite"))
+STORE_ENV = current_env(VARIANT.dtype, backend=ARGS.backend, profiler=PROFILER, layout=layout_tag(VARIANT))
 
 
 def filter_and_average(values):
@@ -65,21 +112,58 @@ def filter_and_average(values):
 
 
 # === 主流程 ===
+def save_result(shape, device, times, stability):
+    """每个 shape 测完立即写入结果库（连同稳定性评分）"""
+    if any(times.values()):
+        with harnessProfile.span("store", shape):
+            STORE.put(shape, times, STORE_ENV, stability)
+
+
+def measure_shapes(shapes):
+    """测量结果库中还没有的 shape，返回 {shape: {"Cijk": 平均时间, "gemm": 平均时间}}"""
+    todo = STORE.missing(shapes, SWEEP_OPTIONS["patterns"], STORE_ENV)
+    print(f"Already measured: {len(shapes) - len(todo)}, to measure: {len(todo)}")
+    if todo:
+        run_sweep(todo, SWEEP_OPTIONS, DEVICES, on_result=save_result)
+    averages = {}
+    for shape in shapes:
+        times = STORE.get_times(shape, SWEEP_OPTIONS["patterns"], STORE_ENV)
+        averages[shape] = {label: filter_and_average(times[p]) if times.get(p) else None
+                           for label, p in (("Cijk", CIJK_PATTERN), ("gemm", GEMM_PATTERN))}
+    return averages
+
+
+print(f"Devices: {DEVICES}")
+if ARGS.adaptive:
+    grid_line = next((line for line in SPACE.splitlines() if line.strip().startswith("grid")), None)
+    if grid_line is None:
+        print("❌ --adaptive 需要 space 中有一行 grid")
+        sys.exit(1)
+    m_axis, k_axis, n_axis, where = parse_grid(grid_line)
+    explored = explore((m_axis, k_axis, n_axis), measure_shapes, where, stride=ARGS.stride)
+    SIZES = sorted(explored)
+    print(f"Adaptive: measured {len(SIZES)} of {dense_size((m_axis, k_axis, n_axis), where)} grid shapes")
+elif ARGS.active:
+    # 只测模型没把握的 shape，其余 shape 的时间和胜者由模型预测，写入 PREDICTED_CSV_FILE
+    _, PROFILE = load_device_profile(DEVICE_PROFILE_FILE)
+    measured, models = active_learn(SIZES, measure_shapes, PROFILE, VARIANT.dtype, VARIANT.batch, budget=ARGS.budget)
+    labels = sorted(models)
+    write_predictions(PREDICTED_CSV_FILE, labels, prediction_rows(SIZES, models, measured, labels))
+    print(f"Active: measured {len(measured)} of {len(SIZES)} shapes, predictions saved to {PREDICTED_CSV_FILE}")
+    SIZES = [s for s in SIZES if s in measured]
+else:
+    measure_shapes(SIZES)
 results = []
 
 for (m, k, n) in SIZES:
-    cijk_all = []
-    gemm_all = []
-
-    for i in range(REPEAT):
-        cijk, gemm = run_benchmark(m, k, n)
-        if cijk is not None:
-            cijk_all.append(cijk)
-        if gemm is not None:
-            gemm_all.append(gemm)
+    times = STORE.get_times((m, k, n), SWEEP_OPTIONS["patterns"], STORE_ENV)
+    cijk_all = times.get(CIJK_PATTERN, [])
+    gemm_all = times.get(GEMM_PATTERN, [])
+    stability = STORE.get_stability((m, k, n), SWEEP_OPTIONS["patterns"], STORE_ENV)
+    scores = [stability.get(p) if stability.get(p) is not None else "N/A" for p in (CIJK_PATTERN, GEMM_PATTERN)]
 
     debug_file = os.path.join(TEMP_DIR, f"M{m}_K{k}_N{n}_debug.txt")
-    with open(debug_file, "w") as f:
+    with harnessProfile.span("csv", (m, k, n)), open(debug_file, "w") as f:
         f.write(f"Cijk_Ailk_Bljk times: {cijk_all}\n")
         f.write(f"gemm times: {gemm_all}\n")
 
@@ -87,16 +171,20 @@ for (m, k, n) in SIZES:
         cijk_avg = filter_and_average(cijk_all)
         gemm_avg = filter_and_average(gemm_all)
         faster = "Cijk" if cijk_avg < gemm_avg else "gemm"
-        results.append([m, k, n, cijk_avg, gemm_avg, faster])
+        results.append([m, k, n] + list(VARIANT) + [cijk_avg, gemm_avg, faster]
+                       + stat_values(cijk_all) + stat_values(gemm_all) + scores)
         print(f"[{m},{k},{n}]  Cijk:{cijk_avg:.6f}s  gemm:{gemm_avg:.6f}s  => {faster} faster")
     else:
-        results.append([m, k, n, "N/A", "N/A", "N/A"])
+        results.append([m, k, n] + list(VARIANT) + ["N/A", "N/A", "N/A"]
+                       + stat_values(cijk_all) + stat_values(gemm_all) + scores)
 
 
 # === 写出 CSV 文件 ===
-with open(CSV_FILE, "w", newline="") as f:
+with harnessProfile.span("csv"), open(CSV_FILE, "w", newline="") as f:
     writer = csv.writer(f)
-    writer.writerow(["M", "K", "N", "Cijk_time_avg(s)", "gemm_time_avg(s)", "Faster"])
+    writer.writerow(["M", "K", "N"] + VARIANT_COLUMNS + ["Cijk_time_avg(s)", "gemm_time_avg(s)", "Faster"]
+                    + stat_columns("Cijk") + stat_columns("gemm") + ["Cijk_stability", "gemm_stability"])
     writer.writerows(results)
 
 print(f"\n✅ All done. Results saved to {CSV_FILE}")
+harnessProfile.stop()
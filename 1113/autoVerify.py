@@ -1,64 +1,185 @@
 #!/usr/bin/env python3
-import torch
-import lightop
+"""lightop.gemm 正确性验证
+
+所有 shape 共用一块按最大规模预分配的工作区：A / B / B^T / C 都是工作区前缀的
+连续视图，不再为每个 shape 重新分配和生成随机矩阵。A / B 来自输入库
+（inputStore.py），与 benchGemm.py 测性能时的输入完全相同。参考结果在 CPU 上用 fp64
+计算，放在进程池里与设备上的计算并行；每个 shape 记录 lightop 和 torch.mm
+相对参考结果的最大绝对误差、最大相对误差和 ULP 误差，写入 CSV。
+"""
+import argparse
+import csv
+import multiprocessing
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
-# === 配置参数 ===
-SIZES = []
-
-# === 不同 K 值 sweep ===
-for M in [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 7168, 8192, 9216]:
-    for K in [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 7168, 8192, 9216]:
-        for N in [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 7168, 8192, 9216]:
-            if M*K*N < 1024*1024:
-                SIZES.append((M, K, N))
+import numpy as np
+import torch
+import lightop
 
-print(f"Total test cases: {len(SIZES)}")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from inputStore import DEFAULT_ROOT, InputStore
+from shapeSpace import AUTOPERF_SPACE, load_space, parse_space
 
+# === 配置参数 ===
+# 与 autoPerf.py 相同的 16 个尺寸网格，M*K*N < 1024*1024
+SIZES = parse_space(AUTOPERF_SPACE)
+
+# 通过条件：|C - C_ref| <= ATOL + RTOL * |C_ref|（C_ref 为 fp64 参考结果）
+ATOL = 1e-3
+RTOL = 1e-3
+# ULP 误差的间距下限：ATOL 处的 fp16 间距
+ULP_FLOOR = float(np.spacing(np.float16(ATOL)))
+SEED = 0  # 输入库种子，与 benchGemm.py 相同
+# 每个进程池任务包含的 shape 数，减少进程间通信次数
+CHUNK = 32
 
 # === 结果输出目录 ===
 os.makedirs("temp", exist_ok=True)
 log_file = os.path.join("temp", "verify_results.txt")
+csv_file = os.path.join("temp", "verify_results.csv")
 
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 
-def test_one_case(M, K, N, atol=1e-3, rtol=1e-3):
-    """测试一个矩阵规模，返回是否通过"""
+ERROR_FIELDS = ["max_abs", "max_rel", "ulp_max", "ulp_mean"]
+CSV_COLUMNS = (["M", "K", "N", "Result"]
+               + [f"lightop_{f}" for f in ERROR_FIELDS]
+               + [f"torch_{f}" for f in ERROR_FIELDS]
+               + ["Error"])
+
+
+# === 工作区 ===
+class Workspace:
+    """按 shape 列表中最大的 M*K、K*N、M*N 预分配的 fp16 缓冲区"""
+
+    def __init__(self, sizes, device, store):
+        self.max_mk = max(m * k for m, k, n in sizes)
+        self.max_kn = max(k * n for m, k, n in sizes)
+        max_mn = max(m * n for m, k, n in sizes)
+        # 输入库中 A / B 流的前缀（内存映射）；进程池的参考计算各自映射同一份文件
+        self.a_host = store.stream("A", torch.float16, self.max_mk)[:self.max_mk]
+        self.b_host = store.stream("B", torch.float16, self.max_kn)[:self.max_kn]
+        self.a = self.a_host.to(device)
+        self.b = self.b_host.to(device)
+        self.bt = torch.empty(self.max_kn, device=device, dtype=torch.float16)
+        self.c = torch.empty(max_mn, device=device, dtype=torch.float16)
+
+    def views(self, M, K, N):
+        A = self.a[:M * K].view(M, K)
+        B = self.b[:K * N].view(K, N)
+        Bt = self.bt[:N * K].view(N, K)
+        C = self.c[:M * N].view(M, N)
+        return A, B, Bt, C
+
+
+# === CPU 参考计算（进程池） ===
+_HOST = {}
+
+
+def _init_worker(root, seed, max_mk, max_kn):
+    store = InputStore(root, seed)
+    _HOST["a"] = store.stream("A", torch.float16, max_mk).numpy()
+    _HOST["b"] = store.stream("B", torch.float16, max_kn).numpy()
+
+
+def error_stats(c, ref):
+    """max_abs / max_rel / ulp_max / ulp_mean；ULP 按参考值处 fp16 的间距计算
+
+    相对误差的分母下限取 ATOL，避免接近 0 的参考值把相对误差放大；ULP 同理，
+    间距下限取 ATOL 处的 fp16 间距（不用 0 附近 6e-8 的次正规数间距）。
+    fp16 间距用 fp32 间距乘 2**13（尾数少 13 位）计算，|参考值| 超出 fp16
+    范围时也不会溢出成 inf / NaN。
+    """
+    diff = np.abs(c.astype(np.float64) - ref)
+    rel = diff / np.maximum(np.abs(ref), ATOL)
+    spacing = np.spacing(np.abs(ref).astype(np.float32)).astype(np.float64) * 2.0 ** 13
+    ulp = diff / np.maximum(spacing, ULP_FLOOR)
+    return [float(diff.max()), float(rel.max()), float(ulp.max()), float(ulp.mean())]
+
+
+def check_chunk(jobs):
+    """jobs: [(M, K, N, C_lightop, C_torch, error)]，返回 CSV 行"""
+    rows = []
+    for M, K, N, c_lightop, c_torch, error in jobs:
+        A = _HOST["a"][:M * K].reshape(M, K).astype(np.float64)
+        B = _HOST["b"][:K * N].reshape(K, N).astype(np.float64)
+        ref = A @ B
+        torch_stats = error_stats(c_torch, ref)
+        if c_lightop is None:
+            rows.append([M, K, N, "FAIL"] + [None] * len(ERROR_FIELDS) + torch_stats + [error])
+            continue
+        ok = bool(np.all(np.abs(c_lightop.astype(np.float64) - ref) <= ATOL + RTOL * np.abs(ref)))
+        rows.append([M, K, N, "PASS" if ok else "FAIL"] + error_stats(c_lightop, ref) + torch_stats + [""])
+    return rows
+
+
+# === 设备计算 ===
+def run_one_case(ws, M, K, N):
+    """在工作区视图上计算 torch.mm 和 lightop.gemm，返回拷回主机的结果"""
+    A, B, Bt, C = ws.views(M, K, N)
+    torch.mm(A, B, out=C)
+    c_torch = C.to("cpu", copy=True).numpy()
     try:
-        A = torch.randn(M, K, device=device, dtype=torch.float16)
-        B = torch.randn(K, N, device=device, dtype=torch.float16)
-
-        C_torch = torch.mm(A, B)
-        C_lightop = lightop.gemm(A, B.T.contiguous())
-
-        ok = torch.allclose(C_torch, C_lightop, atol=atol, rtol=rtol)
-        return ok, None if ok else (C_torch, C_lightop)
-
+        Bt.copy_(B.T)
+        c_lightop = lightop.gemm(A, Bt).cpu().numpy()
+        return M, K, N, c_lightop, c_torch, None
     except Exception as e:
-        return False, str(e)
+        return M, K, N, None, c_torch, str(e)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="lightop.gemm 正确性验证")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="CPU 参考计算的进程数")
+    parser.add_argument("--space", help="shape space 文件（见 shapeSpace.py），默认与 autoPerf.py 相同")
+    args = parser.parse_args()
+
+    sizes = load_space(args.space) if args.space else SIZES
+    print(f"Total test cases: {len(sizes)}")
+    store = InputStore(DEFAULT_ROOT, SEED)
+    ws = Workspace(sizes, device, store)
+
+    # spawn：子进程不继承父进程已初始化的 GPU 运行时
+    ctx = multiprocessing.get_context("spawn")
+    futures = []
+    with ProcessPoolExecutor(args.workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(store.root, store.seed, ws.max_mk, ws.max_kn)) as pool:
+        jobs = []
+        for (M, K, N) in sizes:
+            jobs.append(run_one_case(ws, M, K, N))
+            if len(jobs) == CHUNK:
+                futures.append(pool.submit(check_chunk, jobs))
+                jobs = []
+        if jobs:
+            futures.append(pool.submit(check_chunk, jobs))
+        rows = [row for fut in futures for row in fut.result()]
+
     passed = []
     failed = []
-
     with open(log_file, "w") as f:
-        for (M, K, N) in SIZES:
-            ok, info = test_one_case(M, K, N)
-            if ok:
-                print(f"✅ PASS: M={M}, K={K}, N={N}")
+        for row in rows:
+            M, K, N, result = row[:4]
+            if result == "PASS":
+                print(f"✅ PASS: M={M}, K={K}, N={N}  max_abs={row[4]:.3g}  ulp_max={row[6]:.1f}")
                 f.write(f"PASS: M={M}, K={K}, N={N}\n")
                 passed.append((M, K, N))
             else:
-                print(f"❌ FAIL: M={M}, K={K}, N={N}")
+                print(f"❌ FAIL: M={M}, K={K}, N={N}"
+                      + (f"  max_abs={row[4]:.3g}  ulp_max={row[6]:.1f}" if row[4] is not None else ""))
                 f.write(f"FAIL: M={M}, K={K}, N={N}\n")
-                if isinstance(info, str):
-                    f.write(f"  Exception: {info}\n")
+                if row[-1]:
+                    f.write(f"  Exception: {row[-1]}\n")
                 failed.append((M, K, N))
 
+    with open(csv_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows([["N/A" if v is None else v for v in row] for row in rows])
+
     print("\n=== 测试完成 ===")
     print(f"✅ 通过 {len(passed)} 个 / ❌ 失败 {len(failed)} 个")
-    print(f"详细结果已写入 {log_file}")
+    print(f"详细结果已写入 {log_file}，误差统计已写入 {csv_file}")
 
     # 汇总结论
     if passed:
@@ -69,6 +190,12 @@ def main():
     else:
         print("\n🔴 所有测试均失败。")
 
+    measured = [row for row in rows if row[4] is not None]
+    if measured:
+        worst = max(measured, key=lambda row: row[6])
+        print(f"最大 ULP 误差：M={worst[0]}, K={worst[1]}, N={worst[2]}  "
+              f"ulp_max={worst[6]:.1f}  max_abs={worst[4]:.3g}  max_rel={worst[5]:.3g}")
+
 
 if __name__ == "__main__":
     main()
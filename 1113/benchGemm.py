@@ -1,29 +1,72 @@
 #!/usr/bin/env python3
-import torch
-import lightop
+import argparse
+import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# 在 torch 之前导入，框架自身剖析时能看到进程启动和 torch 导入的耗时（见 harnessProfile.py）
+from harnessProfile import span
+
+with span("import torch"):
+    import torch
+with span("import lightop"):
+    import lightop
+with span("import harness"):
+    import gemmHarness
+    from gemmVariant import DEFAULT_VARIANT, add_variant_args, variant_from_args
+
+# 默认 fp16 NN
+FP16_VARIANT = DEFAULT_VARIANT._replace(dtype="fp16")
+
+def make_inputs(M, K, N, device, variant=FP16_VARIANT):
+    """输入矩阵：按种子生成一次，之后从 temp/inputs/ 内存映射加载（与 autoVerify.py 相同的数据），按 variant 的布局排列"""
+    return gemmHarness.make_gemm_inputs(M, K, N, device, variant)
+
+def torch_gemm(A, B, C=None, alpha=1.0, beta=0.0):
+    # PyTorch GEMM（mm / bmm / addmm / baddbmm / _int_mm）
+    return gemmHarness.torch_gemm(A, B, C, alpha, beta)
+
+def lightop_gemm(A, B, C=None, alpha=1.0, beta=0.0):
+    # LightOp 浮点 GEMM：只支持单个矩阵、无 alpha/beta；B 以 N x K 传入，NT 布局时 B.T 已连续，不需要拷贝
+    if A.dim() != 2 or C is not None or not A.is_floating_point():
+        raise NotImplementedError("lightop.gemm 只支持非 batch、无 alpha/beta 的浮点 GEMM")
+    return lightop.gemm(A.contiguous(), B.T.contiguous())
+
+# 每个 op 对应的 kernel 名模式（进程内计时后端用作标签）
+OPS = {"Cijk_Ailk_Bljk*": torch_gemm, "*gemm*": lightop_gemm}
+
+def batch_main(argv):
+    """批量模式：一个进程内跑完所有 shape 和重复次数"""
+    from gemmHarness import parse_batch_args, read_shapes, run_batch
+
+    args = parse_batch_args(argv, "benchGemm.py", dtype="fp16")
+    shapes = read_shapes(args.shapes)
+    with span("bench ops"):
+        run_batch(shapes, make_inputs, list(OPS.values()), repeat=args.repeat, warmup=args.warmup,
+                  variant=variant_from_args(args), attribute=args.attribute)
+
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python benchGemm.py M K N")
-        sys.exit(1)
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        batch_main(sys.argv[2:])
+        return
 
-    # 读取矩阵大小
-    M = int(sys.argv[1])
-    K = int(sys.argv[2])
-    N = int(sys.argv[3])
+    parser = argparse.ArgumentParser(
+        prog="benchGemm.py",
+        epilog="批量模式: python benchGemm.py --batch <shapes.txt|-> [--repeat R] [--warmup W] [--attribute] [variant 选项]")
+    parser.add_argument("M", type=int)
+    parser.add_argument("K", type=int)
+    parser.add_argument("N", type=int)
+    add_variant_args(parser, "fp16")
+    args = parser.parse_args()
 
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
 
-    # 随机生成矩阵
-    A = torch.randn(M, K, device=device, dtype=torch.float16)
-    B = torch.randn(K, N, device=device, dtype=torch.float16)
-
-    # PyTorch GEMM
-    C_torch = torch.mm(A, B)
+    # 生成输入矩阵
+    with span("bench inputs"):
+        inputs = make_inputs(args.M, args.K, args.N, device, variant_from_args(args))
 
-    # LightOp 浮点 GEMM
-    C_lightop = lightop.gemm(A, B.T.contiguous())
+    with span("bench ops"):
+        gemmHarness.run_ops(OPS.values(), inputs, (args.M, args.K, args.N))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""把 autoPerf.py 的结果编译成 GEMM kernel 选择表
+
+读取 temp/gemm_benchmark.csv 的 Faster 列，在 (M, K, N) 三个轴的取值上
+生成一张稠密的三维表：测过的格点直接用测得的结果，没测过的格点（例如被
+M*K*N 过滤掉的组合）用 log2 空间中最近的已测 shape 的结果填充。
+运行时 gemmDispatch.py 对每个维度二分查找最近的轴值，再 O(1) 查表。
+"""
+import csv
+import json
+import math
+import sys
+
+CSV_FILE = "temp/gemm_benchmark.csv"
+TABLE_FILE = "temp/gemm_dispatch.json"
+
+# 表中的后端编码
+BACKEND_CODES = {"Cijk": "C", "gemm": "g"}
+
+
+def load_winners(csv_file):
+    """{(M, K, N): "Cijk" / "gemm"}，跳过没有结果的行"""
+    winners = {}
+    with open(csv_file, "r") as f:
+        for row in csv.DictReader(f):
+            if row["Faster"] in BACKEND_CODES:
+                winners[(int(row["M"]), int(row["K"]), int(row["N"]))] = row["Faster"]
+    return winners
+
+
+def build_table(winners):
+    """生成稠密表，返回可直接写成 JSON 的 dict"""
+    m_axis = sorted({s[0] for s in winners})
+    k_axis = sorted({s[1] for s in winners})
+    n_axis = sorted({s[2] for s in winners})
+
+    measured = [(math.log2(m), math.log2(k), math.log2(n), BACKEND_CODES[w])
+                for (m, k, n), w in winners.items()]
+
+    cells = []
+    for m in m_axis:
+        for k in k_axis:
+            for n in n_axis:
+                w = winners.get((m, k, n))
+                if w is not None:
+                    cells.append(BACKEND_CODES[w])
+                    continue
+                lm, lk, ln = math.log2(m), math.log2(k), math.log2(n)
+                nearest = min(measured, key=lambda s: (s[0] - lm) ** 2 + (s[1] - lk) ** 2 + (s[2] - ln) ** 2)
+                cells.append(nearest[3])
+
+    return {
+        "m": m_axis,
+        "k": k_axis,
+        "n": n_axis,
+        "backends": {code: name for name, code in BACKEND_CODES.items()},
+        "table": "".join(cells),
+        "measured": len(winners),
+    }
+
+
+def main():
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else CSV_FILE
+    table_file = sys.argv[2] if len(sys.argv) > 2 else TABLE_FILE
+
+    winners = load_winners(csv_file)
+    if not winners:
+        print(f"❌ {csv_file} 中没有可用的结果")
+        sys.exit(1)
+
+    table = build_table(winners)
+    with open(table_file, "w") as f:
+        json.dump(table, f)
+
+    n_cijk = table["table"].count("C")
+    print(f"已测 shape: {len(winners)}，表大小: {len(table['m'])}x{len(table['k'])}x{len(table['n'])}")
+    print(f"Cijk 更快: {n_cijk} 格，gemm 更快: {len(table['table']) - n_cijk} 格")
+    print(f"✅ 选择表已写入 {table_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,71 @@
 #!/usr/bin/env python3
+import os
+import sys
+
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
 
-# === CSV 文件路径 ===
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pmcParser import KernelMatcher
+
+# === 数据来源 ===
+# autoPerf.py 的 CSV，或 counterStore.py 的计数器库目录（如 temp/counters，autoPerf.py --counter-store 写入）
 CSV_FILE = "test.csv"
+CIJK_PATTERN = "Cijk_Ailk_Bljk*"
+GEMM_PATTERN = "*gemm*"
+# 过滤条件，如 {"M": (1, 1024), "dtype": "fp16"}；计数器库会把它下推到 Parquet，只解码命中的行组
+WHERE = {}
+
+
+def trimmed_mean(values):
+    """去掉最大最小后取平均"""
+    values = np.sort(values)
+    return values[1:-1].mean() if len(values) > 2 else values.mean()
+
+
+def load_counter_store(path):
+    """从计数器库只读取 M/K/N/kernel/time 列，每次运行取匹配 kernel 的最小时间，再按 shape 求修剪平均"""
+    from counterStore import load_counters
+
+    df = load_counters(path, ["M", "K", "N", "run", "run_id", "kernel", "time_s"], WHERE)
+    df = df.dropna(subset=["time_s"])
+    matcher = KernelMatcher([CIJK_PATTERN, GEMM_PATTERN], [GEMM_PATTERN])
+    labels = {}
+    for name in df["kernel"].unique():
+        hit = matcher.match(name)
+        if hit:
+            labels[name] = "Cijk" if hit[0] == CIJK_PATTERN else "gemm"
+    df["label"] = df["kernel"].map(labels)
+    df = df.dropna(subset=["label"])
+    per_run = df.groupby(["M", "K", "N", "run", "run_id", "label"])["time_s"].min()
+    avg = per_run.groupby(["M", "K", "N", "label"]).apply(trimmed_mean).unstack("label")
+    avg = avg.rename(columns={"Cijk": "Cijk_time_avg(s)", "gemm": "gemm_time_avg(s)"})
+    return avg.reset_index()
+
+
+def load_csv(path):
+    """只读取画图需要的列"""
+    df = pd.read_csv(path, usecols=["M", "K", "N", "Cijk_time_avg(s)", "gemm_time_avg(s)"], na_values=["N/A"])
+    for column, value in WHERE.items():
+        if column not in df.columns:
+            continue
+        if isinstance(value, tuple):
+            low, high = value
+            df = df[df[column].between(low if low is not None else -np.inf, high if high is not None else np.inf)]
+        elif isinstance(value, list):
+            df = df[df[column].isin(value)]
+        else:
+            df = df[df[column] == value]
+    return df
+
 
 # === 读取数据 ===
-df = pd.read_csv(CSV_FILE)
+df = load_counter_store(CSV_FILE) if os.path.isdir(CSV_FILE) else load_csv(CSV_FILE)
 
 # 去掉无效数据
-df = df[df["Cijk_time_avg(s)"] != "N/A"]
-df = df[df["gemm_time_avg(s)"] != "N/A"]
-df["Cijk_time_avg(s)"] = df["Cijk_time_avg(s)"].astype(float)
-df["gemm_time_avg(s)"] = df["gemm_time_avg(s)"].astype(float)
+df = df.dropna(subset=["Cijk_time_avg(s)", "gemm_time_avg(s)"])
 
 # 计算速度比
 df["speedup"] = df["Cijk_time_avg(s)"] / df["gemm_time_avg(s)"]
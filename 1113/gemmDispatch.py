@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""运行时 GEMM 后端选择：按 buildDispatch.py 生成的表在 torch.mm 和 lightop.gemm 之间选
+
+每个维度二分查找 log2 距离最近的轴值 (O(log n))，再 O(1) 查表；
+同一个 shape 的结果会缓存，重复调用只需一次 dict 查找。
+"""
+import bisect
+import json
+import math
+
+import torch
+import lightop
+
+TABLE_FILE = "temp/gemm_dispatch.json"
+
+
+def _nearest(axis, logs, value):
+    """axis 中 log2 距离 value 最近的下标"""
+    lv = math.log2(max(value, 1))
+    i = bisect.bisect_left(logs, lv)
+    if i == 0:
+        return 0
+    if i == len(axis):
+        return len(axis) - 1
+    return i if logs[i] - lv < lv - logs[i - 1] else i - 1
+
+
+class GemmDispatcher:
+    def __init__(self, table_file=TABLE_FILE):
+        with open(table_file, "r") as f:
+            t = json.load(f)
+        self.axes = [t["m"], t["k"], t["n"]]
+        self.logs = [[math.log2(v) for v in axis] for axis in self.axes]
+        self.backends = t["backends"]
+        self.table = t["table"]
+        self._cache = {}
+
+    def choose(self, m, k, n):
+        """返回 "Cijk"（torch.mm / hipBLASLt）或 "gemm"（lightop）"""
+        key = (m, k, n)
+        backend = self._cache.get(key)
+        if backend is None:
+            im, ik, in_ = (_nearest(axis, logs, v) for axis, logs, v in zip(self.axes, self.logs, key))
+            nk, nn = len(self.axes[1]), len(self.axes[2])
+            backend = self.backends[self.table[(im * nk + ik) * nn + in_]]
+            self._cache[key] = backend
+        return backend
+
+    def mm(self, A, B):
+        """C = A @ B，A 为 M x K，B 为 K x N"""
+        if self.choose(A.shape[0], A.shape[1], B.shape[1]) == "gemm":
+            return lightop.gemm(A, B.T.contiguous())
+        return torch.mm(A, B)
+
+    def mm_nt(self, A, Bt):
+        """C = A @ Bt.T，Bt 为 N x K（例如 Linear 权重），lightop 路径不需要额外转置"""
+        if self.choose(A.shape[0], A.shape[1], Bt.shape[0]) == "gemm":
+            return lightop.gemm(A, Bt)
+        return torch.mm(A, Bt.T)
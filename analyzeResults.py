@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Roofline analysis of GEMM sweep results.
+
+Loads a sweep CSV (run.py's gemm_sweep_results.csv or autoPerf's
+temp/gemm_benchmark.csv) and adds, for every measured kernel time column,
+achieved TFLOPS, arithmetic intensity, effective bandwidth and percent of
+the roofline for the device in device_profile.json. Shapes that are
+memory-bound or far below the roofline are flagged. All metrics are
+computed column-wise with pandas/NumPy. Sweeps that record a DType column
+per row (see gemmVariant.py) use each row's dtype unless --dtype is given.
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+DEVICE_PROFILE_FILE = "device_profile.json"
+DTYPE_BYTES = {"fp64": 8, "fp32": 4, "fp16": 2, "bf16": 2, "int8": 1}
+
+# Kernel time columns per sweep format, best estimate first
+TIME_COLUMNS = {
+    "kernel": ["Median(s)", "AverageKernelTime(s)"],
+    "Cijk": ["Cijk_median(s)", "Cijk_time_avg(s)"],
+    "gemm": ["gemm_median(s)", "gemm_time_avg(s)"],
+}
+
+
+def load_device_profile(path=DEVICE_PROFILE_FILE, device=None):
+    with open(path, "r") as f:
+        profiles = json.load(f)
+    device = device or profiles["default"]
+    if device not in profiles["devices"]:
+        print(f"Error: device '{device}' not in {path} ({', '.join(profiles['devices'])})")
+        sys.exit(1)
+    return device, profiles["devices"][device]
+
+
+def load_results(path):
+    """Read a sweep CSV; 'N/A' and empty cells become NaN."""
+    return pd.read_csv(path, na_values=["N/A", ""])
+
+
+def time_columns(df):
+    """{label: column} for the kernel time columns present in df."""
+    found = {}
+    for label, candidates in TIME_COLUMNS.items():
+        for col in candidates:
+            if col in df.columns:
+                found[label] = col
+                break
+    return found
+
+
+def guess_dtype(df):
+    """autoPerf sweeps (Cijk/gemm columns) run fp16, run.py runs fp32."""
+    return "fp16" if "Cijk_time_avg(s)" in df.columns else "fp32"
+
+
+def add_roofline_metrics(df, profile, dtype, far_pct=50.0):
+    """Return a copy of df with roofline columns added for every time column.
+
+    dtype=None takes each row's dtype from the DType column.
+    """
+    out = df.copy()
+    m = out["M"].to_numpy(dtype=np.float64)
+    k = out["K"].to_numpy(dtype=np.float64)
+    n = out["N"].to_numpy(dtype=np.float64)
+    batch = out["Batch"].to_numpy(dtype=np.float64) if "Batch" in out.columns else 1.0
+
+    dtypes = out["DType"] if dtype is None else pd.Series(dtype, index=out.index)
+    elem = dtypes.map(DTYPE_BYTES).to_numpy(dtype=np.float64)
+    flops = 2.0 * m * k * n * batch
+    # Compulsory traffic: read A and B once, write C once
+    nbytes = elem * (m * k + k * n + m * n) * batch
+    intensity = flops / nbytes
+
+    peak_flops = dtypes.map(profile["peak_tflops"]).to_numpy(dtype=np.float64) * 1e12
+    peak_bw = profile["peak_bandwidth_gbs"] * 1e9
+    ridge = peak_flops / peak_bw
+    attainable = np.minimum(peak_flops, intensity * peak_bw)
+
+    out["FLOPs"] = flops
+    out["Bytes"] = nbytes
+    out["ArithIntensity"] = intensity
+    out["MemoryBound"] = intensity < ridge
+
+    for label, col in time_columns(df).items():
+        t = out[col].to_numpy(dtype=np.float64)
+        achieved = flops / t
+        pct = 100.0 * achieved / attainable
+        out[f"{label}_TFLOPS"] = achieved / 1e12
+        out[f"{label}_GBps"] = nbytes / t / 1e9
+        out[f"{label}_pct_roofline"] = pct
+        out[f"{label}_far_from_roofline"] = pct < far_pct
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roofline analysis of GEMM sweep results.")
+    parser.add_argument("csv", nargs="?", default="gemm_sweep_results.csv",
+                        help="gemm_sweep_results.csv or temp/gemm_benchmark.csv")
+    parser.add_argument("--profile", default=DEVICE_PROFILE_FILE)
+    parser.add_argument("--device", help="device entry in the profile file (default: its 'default')")
+    parser.add_argument("--dtype", choices=sorted(DTYPE_BYTES),
+                        help="default: the DType column, else fp16 for autoPerf, fp32 for run.py")
+    parser.add_argument("--far-pct", type=float, default=50.0, help="flag shapes below this %% of roofline")
+    parser.add_argument("--output", help="output CSV (default: <csv>_roofline.csv)")
+    args = parser.parse_args()
+
+    device, profile = load_device_profile(args.profile, args.device)
+    df = load_results(args.csv)
+    dtype = args.dtype or (None if "DType" in df.columns else guess_dtype(df))
+    if not time_columns(df):
+        print(f"Error: no kernel time column found in {args.csv}")
+        sys.exit(1)
+
+    out = add_roofline_metrics(df, profile, dtype, args.far_pct)
+    output = args.output or args.csv.rsplit(".", 1)[0] + "_roofline.csv"
+    out.to_csv(output, index=False)
+
+    dtype_label = dtype or "/".join(sorted(df["DType"].dropna().unique()))
+    print(f"Device {device}, dtype {dtype_label}, {len(out)} shapes")
+    print(f"Memory-bound shapes: {int(out['MemoryBound'].sum())}")
+    for label in time_columns(df):
+        far = out[out[f"{label}_far_from_roofline"]]
+        print(f"[{label}] below {args.far_pct:.0f}% of roofline: {len(far)}; "
+              f"median {out[f'{label}_pct_roofline'].median():.1f}% of roofline")
+        worst = far.nsmallest(10, f"{label}_pct_roofline")
+        for _, row in worst.iterrows():
+            print(f"    M={row['M']} K={row['K']} N={row['N']}: "
+                  f"{row[f'{label}_TFLOPS']:.2f} TFLOPS, {row[f'{label}_pct_roofline']:.1f}%")
+    print(f"\nRoofline metrics saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
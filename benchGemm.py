@@ -1,24 +1,57 @@
 #!/usr/bin/env python3
-import torch
+import argparse
 import sys
 
+# Imported before torch so a profiled harness sees the startup and torch import (see harnessProfile.py)
+from harnessProfile import span
+
+with span("import torch"):
+    import torch
+with span("import harness"):
+    import gemmHarness
+    from gemmVariant import DEFAULT_VARIANT, add_variant_args, variant_from_args
+
+def make_inputs(M, K, N, device, variant=DEFAULT_VARIANT):
+    # Seeded inputs from temp/inputs/, laid out as the variant asks (see gemmVariant.py)
+    return gemmHarness.make_gemm_inputs(M, K, N, device, variant)
+
+def gemm(A, B, C=None, alpha=1.0, beta=0.0):
+    return gemmHarness.torch_gemm(A, B, C, alpha, beta)
+
+# Kernel pattern each op launches (labels for the in-process timing backends)
+OPS = {"Cijk_Ailk_Bljk*": gemm}
+
+def batch_main(argv):
+    from gemmHarness import parse_batch_args, read_shapes, run_batch
+
+    args = parse_batch_args(argv, "benchGemm.py")
+    shapes = read_shapes(args.shapes)
+    with span("bench ops"):
+        run_batch(shapes, make_inputs, list(OPS.values()), repeat=args.repeat, warmup=args.warmup,
+                  variant=variant_from_args(args), attribute=args.attribute)
+
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python benchGemm.py M K N")
-        sys.exit(1)
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        batch_main(sys.argv[2:])
+        return
 
-    # Read parameters
-    M = int(sys.argv[1])
-    K = int(sys.argv[2])
-    N = int(sys.argv[3])
+    parser = argparse.ArgumentParser(
+        prog="benchGemm.py",
+        epilog="batch mode: python benchGemm.py --batch <shapes.txt|-> [--repeat R] [--warmup W] [--attribute] [variant options]")
+    parser.add_argument("M", type=int)
+    parser.add_argument("K", type=int)
+    parser.add_argument("N", type=int)
+    add_variant_args(parser, "fp32")
+    args = parser.parse_args()
 
-    # Create random matrices
+    # Create the input matrices
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    A = torch.randn(M, K, device=device)
-    B = torch.randn(K, N, device=device)
+    with span("bench inputs"):
+        inputs = make_inputs(args.M, args.K, args.N, device, variant_from_args(args))
 
     # Perform matrix multiplication
-    C = torch.matmul(A, B)
+    with span("bench ops"):
+        gemmHarness.run_ops(OPS.values(), inputs, (args.M, args.K, args.N))
 
 if __name__ == "__main__":
     main()
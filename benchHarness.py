@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""Benchmarks of the harness itself, with fakeHipprof.py standing in for hipprof.
+
+    python benchHarness.py [--quick] [--only parser,run,batch,sweep,faults]
+                           [--save bench.json] [--compare baseline.json]
+
+- parser: pmcParser throughput in MB/s on synthetic traces, once with the
+  default counters and once with many counters per record, for
+  collect_kernel_times and for a full iter_records pass
+- run: one HipprofBackend.run_once against the bare fake profiler process
+  it launches; the difference is the per-run orchestration overhead
+- batch: run_hipprof_batch over a shape file, per measured run
+- sweep: run_sweep with 1, 2 and 4 workers; shapes per second and the
+  parallel efficiency relative to one worker
+- faults: run_once when every run fails (no pid, no pmc file, truncated
+  trace) and a hung run that has to be timed out
+
+Every benchmark runs a warm-up round and then --rounds measured rounds in
+a scratch directory; the table shows the median, min and standard
+deviation. --save keeps the results as JSON; --compare checks the medians
+against a saved baseline and exits with status 1 when a metric got more
+than --tolerance worse, so a harness change can be measured and guarded
+against regressions. Metrics that are the difference of two timings
+(run.overhead, faults.hang_kill_delay) can be near zero or negative. They are
+compared by absolute difference and are not part of the gate.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import fakeHipprof
+from gemmVariant import DEFAULT_VARIANT
+from getKernelTime import HipprofBackend, run_hipprof_batch
+from pmcParser import KernelMatcher, collect_kernel_times, iter_records
+from procRunner import run_command
+from sweepScheduler import run_sweep
+
+FAKE_HIPPROF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakeHipprof.py")
+PATTERNS = ["Cijk_Ailk_Bljk*", "*gemm*"]
+IGNORE_CASE = ["*gemm*"]
+BENCHMARKS = ("parser", "run", "batch", "sweep", "faults")
+TOLERANCE = 0.15
+
+# (quick, full) sizes
+TRACE_MB = (4, 32)
+WIDE_COUNTERS = 32
+RUNS_PER_ROUND = (5, 20)
+BATCH_SHAPES = (8, 32)
+BATCH_REPEAT = 10
+SWEEP_SHAPES = (12, 48)
+SWEEP_WORKERS = ((1, 2), (1, 2, 4))
+SWEEP_REPEAT = 3
+HANG_TIMEOUT = 0.5
+
+
+def random_shapes(count, seed=0):
+    rng = random.Random(seed)
+    sizes = [64, 128, 256, 512, 1024, 2048, 4096]
+    return [(rng.choice(sizes), rng.choice(sizes), rng.choice(sizes)) for _ in range(count)]
+
+
+def profiler(*options):
+    return [sys.executable, FAKE_HIPPROF] + list(options)
+
+
+def backend_options(*profiler_options, **extra):
+    options = {"backend": "hipprof", "bench_cmd": "python benchGemm.py", "patterns": PATTERNS,
+               "ignore_case": IGNORE_CASE, "pick": "min", "profiler": profiler(*profiler_options),
+               "temp_dir": "temp", "variant": DEFAULT_VARIANT}
+    options.update(extra)
+    return options
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the harness's progress output (the sweep workers inherit it)."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+class Bench:
+    """Collects per-round samples of named metrics."""
+
+    def __init__(self, rounds):
+        self.rounds = rounds
+        self.metrics = {}
+
+    def add(self, name, value, unit, higher_is_better=False, relative=True):
+        """relative=False marks a difference of two timings: compared by absolute change, never gated."""
+        metric = self.metrics.setdefault(name, {"unit": unit, "higher_is_better": higher_is_better,
+                                                "relative": relative, "samples": []})
+        metric["samples"].append(value)
+
+    def repeat(self, fn):
+        """fn(record) once as warm-up (record=False), then once per round."""
+        fn(False)
+        for _ in range(self.rounds):
+            fn(True)
+
+    def results(self):
+        out = {}
+        for name, m in self.metrics.items():
+            samples = m["samples"]
+            out[name] = dict(m, median=statistics.median(samples), min=min(samples), mean=statistics.mean(samples),
+                             stdev=statistics.stdev(samples) if len(samples) > 1 else 0.0)
+        return out
+
+
+# === Benchmarks ===
+def bench_parser(bench, size):
+    target = TRACE_MB[size] << 20
+    for label, counters in (("default", 0), ("wide", WIDE_COUNTERS)):
+        args = fakeHipprof.parse_args(["--counters", str(counters), "--seed", "1"])
+        path = f"trace_{label}.txt"
+        shapes = random_shapes(64)
+        per_pass = fakeHipprof.write_trace(path, shapes, args)
+        fakeHipprof.write_trace(path, shapes, args, repeat=max(1, target // per_pass))
+        mb = os.path.getsize(path) / (1 << 20)
+
+        def collect(record, path=path, mb=mb, label=label):
+            start = time.perf_counter()
+            collect_kernel_times(path, KernelMatcher(PATTERNS, IGNORE_CASE))
+            if record:
+                bench.add(f"parser.collect[{label}]", mb / (time.perf_counter() - start), "MB/s", True)
+
+        def records(record, path=path, mb=mb, label=label):
+            start = time.perf_counter()
+            for _ in iter_records(path):
+                pass
+            if record:
+                bench.add(f"parser.records[{label}]", mb / (time.perf_counter() - start), "MB/s", True)
+
+        bench.repeat(collect)
+        bench.repeat(records)
+        os.remove(path)
+
+
+def bench_run(bench, size):
+    runs = RUNS_PER_ROUND[size]
+    backend = HipprofBackend(backend_options())
+    argv = profiler() + ["python", "benchGemm.py", "256", "256", "256"]
+
+    def round_(record):
+        # alternate the two so that drift hits both alike
+        bare = full = 0.0
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = run_command(argv)
+            bare += time.perf_counter() - start
+            os.remove(f"pmc_results_{result.pid}.txt")
+            start = time.perf_counter()
+            backend.run_once((256, 256, 256))
+            full += time.perf_counter() - start
+        bare, full = bare / runs * 1e3, full / runs * 1e3
+        if record:
+            bench.add("run.profiler_process", bare, "ms")
+            bench.add("run.run_once", full, "ms")
+            bench.add("run.overhead", full - bare, "ms", relative=False)
+
+    with quiet():
+        bench.repeat(round_)
+    backend.close()
+
+
+def bench_batch(bench, size):
+    shapes = random_shapes(BATCH_SHAPES[size], seed=2)
+    with open("batch_shapes.txt", "w") as f:
+        f.writelines(f"{m} {k} {n}\n" for m, k, n in shapes)
+    with open("kernel_list.txt", "w") as f:
+        f.write("\n".join(PATTERNS[:1]) + "\n")
+
+    def round_(record):
+        start = time.perf_counter()
+        results = run_hipprof_batch("batch_shapes.txt", "kernel_list.txt", repeat=BATCH_REPEAT,
+                                    profiler=profiler())
+        elapsed = time.perf_counter() - start
+        if len(results) != len(set(shapes)):
+            raise RuntimeError(f"batch returned {len(results)} of {len(set(shapes))} shapes")
+        if record:
+            bench.add("batch.per_run", elapsed / (len(shapes) * BATCH_REPEAT) * 1e3, "ms")
+
+    with quiet():
+        bench.repeat(round_)
+
+
+def bench_sweep(bench, size):
+    shapes = random_shapes(SWEEP_SHAPES[size], seed=3)
+    shapes = list(dict.fromkeys(shapes))
+    options = backend_options(min_repeat=SWEEP_REPEAT, repeat=SWEEP_REPEAT)
+    rates = {}
+
+    def round_(record):
+        for workers in SWEEP_WORKERS[size]:
+            start = time.perf_counter()
+            done = run_sweep(shapes, options, [str(d) for d in range(workers)])
+            rate = len(done) / (time.perf_counter() - start)
+            if len(done) != len(shapes):
+                raise RuntimeError(f"sweep measured {len(done)} of {len(shapes)} shapes")
+            if record:
+                bench.add(f"sweep.shapes_per_s[{workers}]", rate, "shapes/s", True)
+                rates[workers] = rate
+        if record:
+            for workers in SWEEP_WORKERS[size][1:]:
+                bench.add(f"sweep.efficiency[{workers}]", rates[workers] / rates[1] / workers, "ratio", True)
+
+    with quiet():
+        bench.repeat(round_)
+
+
+def bench_faults(bench, size):
+    runs = RUNS_PER_ROUND[size]
+    # one GEMM name: a truncated trace then always ends inside that GEMM's record. Cut at a
+    # later GEMM, the complete records before the cut rightly give kernel times
+    backend = HipprofBackend(backend_options("--fail-rate", "1", "--failures", "nopid,nofile,truncated",
+                                             "--names", "Cijk_Ailk_Bljk_MT{tile}", wait_timeout=0.2, retries=0))
+    hang = HipprofBackend(backend_options("--fail-rate", "1", "--failures", "hang",
+                                          run_timeout=HANG_TIMEOUT, retries=0))
+
+    def round_(record):
+        start = time.perf_counter()
+        for _ in range(runs):
+            times = backend.run_once((256, 256, 256))
+            if any(t is not None for t in times.values()):
+                raise RuntimeError("a failed run produced kernel times")
+        failed = (time.perf_counter() - start) / runs * 1e3
+        start = time.perf_counter()
+        hang.run_once((256, 256, 256))
+        hung = time.perf_counter() - start
+        if record:
+            bench.add("faults.failed_run", failed, "ms")
+            bench.add("faults.hang_kill_delay", (hung - HANG_TIMEOUT) * 1e3, "ms", relative=False)
+
+    with quiet():
+        bench.repeat(round_)
+    backend.close()
+    hang.close()
+
+
+# === Report ===
+def print_table(results):
+    print(f"\n{'benchmark':<32} {'median':>12} {'min':>12} {'stdev':>10}  unit")
+    for name, r in results.items():
+        print(f"{name:<32} {r['median']:>12.3f} {r['min']:>12.3f} {r['stdev']:>10.3f}  {r['unit']}")
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Print the change of every median against the baseline; return the names that regressed."""
+    regressed = []
+    print(f"\n{'benchmark':<32} {'baseline':>12} {'now':>12} {'change':>8}")
+    for name, r in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if not r.get("relative", True):
+            diff = r["median"] - old["median"]
+            print(f"{name:<32} {old['median']:>12.3f} {r['median']:>12.3f} {diff:>+8.3f} {r['unit']} (not gated)")
+            continue
+        change = r["median"] / old["median"] - 1 if old["median"] else 0.0
+        worse = -change if r["higher_is_better"] else change
+        flag = ""
+        if worse > tolerance:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        elif worse < -tolerance:
+            flag = "  improved"
+        print(f"{name:<32} {old['median']:>12.3f} {r['median']:>12.3f} {change:>+8.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the harness against the fake hipprof.")
+    parser.add_argument("--quick", action="store_true", help="smaller traces, sweeps and fewer runs")
+    parser.add_argument("--only", help=f"comma-separated benchmarks ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--rounds", type=int, default=5, help="measured rounds per benchmark")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file written with --save")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="relative change of a median that counts as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    selected = [b.strip() for b in args.only.split(",")] if args.only else list(BENCHMARKS)
+    unknown = [b for b in selected if b not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    save = os.path.abspath(args.save) if args.save else None
+
+    size = 0 if args.quick else 1
+    bench = Bench(args.rounds)
+    workdir = tempfile.mkdtemp(prefix="benchHarness-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for name in selected:
+            print(f"==> {name}")
+            globals()[f"bench_{name}"](bench, size)
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"Scratch directory kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = bench.results()
+    print_table(results)
+    if save:
+        with open(save, "w") as f:
+            json.dump({"machine": {"python": platform.python_version(), "platform": platform.platform(),
+                                   "cpus": os.cpu_count()},
+                       "quick": args.quick, "rounds": args.rounds, "results": results}, f, indent=1)
+        print(f"\nResults saved to: {save}")
+    if baseline is not None:
+        regressed = compare(results, baseline, args.tolerance)
+        if regressed:
+            print(f"\nError: {len(regressed)} benchmark(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
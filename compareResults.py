@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""Sweep-to-sweep performance regression detector.
+
+Compares the per-run samples of two or more result sets, aligned by
+(M, K, N, dtype, layout, kernel pattern). A result set is a result store, optionally
+narrowed to one environment: `temp/results.sqlite:tool_version=6.2.1`. The
+same store file can therefore hold the sweeps before and after a
+ROCm/hipBLASLt/lightop upgrade. Every later set is compared with the first
+one (the baseline).
+
+For every shape the comparison reports:
+- the change of the median;
+- a bootstrap 95% CI of the median ratio;
+- Cliff's delta as the effect size;
+- a two-sided Mann-Whitney U test (normal approximation) with
+  Benjamini-Hochberg correction across shapes.
+
+A shape regresses when its q-value is below alpha, the median got slower by
+more than `min_change`, and the CI of the ratio excludes 1. All tests are
+vectorized over shapes. The exit status is 1 when any shape regressed, so
+the command can gate an upgrade. It is 2 when the comparison cannot be
+made: a store file does not exist, a set has no results, or a set has no
+shapes in common with the baseline. A mistyped path must not pass the gate.
+"""
+import argparse
+import csv
+import math
+import os
+import sys
+
+import numpy as np
+
+from resultStore import ENV_FIELDS, ResultStore
+
+ALPHA = 0.05
+MIN_CHANGE = 0.03
+BOOTSTRAP = 1000
+# resampled values held in memory at once
+BOOTSTRAP_CHUNK = 1 << 21
+SEED = 0
+
+REPORT_COLUMNS = ["M", "K", "N", "DType", "Layout", "Kernel", "Set", "BaseMedian(s)", "Median(s)", "Change(%)",
+                  "RatioCI95_low", "RatioCI95_high", "CliffsDelta", "p", "q", "BaseSamples", "Samples", "Status"]
+
+_erfc = np.vectorize(math.erfc, otypes=[np.float64])
+
+
+def parse_set(spec):
+    """'path[:field=value,...]' -> (path, {field: value})."""
+    path, _, filters = spec.partition(":")
+    where = {}
+    for item in filters.split(","):
+        if not item:
+            continue
+        field, sep, value = item.partition("=")
+        if not sep or field not in ENV_FIELDS + ("kernel",):
+            raise ValueError(f"bad result set filter '{item}' (fields: {', '.join(ENV_FIELDS)}, kernel)")
+        where[field] = value
+    return path, where
+
+
+def load_set(spec):
+    """{(M, K, N, dtype, layout, kernel): samples} of one result set; the newest
+    result wins when the filters leave several environments for a shape.
+
+    Raises ValueError when the store does not exist (it is not created) or
+    the set is empty."""
+    path, where = parse_set(spec)
+    if not os.path.isfile(path):
+        raise ValueError(f"{spec}: no result store at {path}")
+    store = ResultStore(path)
+    samples, envs, shadowed = {}, set(), 0
+    for shape, kernel, env, values, _ in store.query(**where):
+        key = shape + (env["dtype"], env["layout"], kernel)
+        if key in samples:
+            shadowed += 1
+            continue
+        envs.add((env["backend"], env["tool_version"], env["device"]))
+        samples[key] = values
+    store.close()
+    if len(envs) > 1:
+        print(f"[WARN] {spec}: {len(envs)} environments match, {shadowed} older results ignored; "
+              "narrow the set with :field=value")
+    if not samples:
+        raise ValueError(f"{spec}: no results" + (" match the filters" if where else ""))
+    return samples
+
+
+def pad(rows):
+    """List of sample lists -> (NaN-padded float array, counts)."""
+    counts = np.array([len(r) for r in rows], dtype=np.int64)
+    out = np.full((len(rows), max(counts.max(initial=0), 1)), np.nan)
+    for i, r in enumerate(rows):
+        out[i, :len(r)] = r
+    return out, counts
+
+
+def row_median(a, n):
+    """Median of the first n[i] values of each row along the last axis (NaN sorts last)."""
+    a = np.sort(a, axis=-1)
+    lo = np.broadcast_to(((n - 1) // 2)[..., None], a.shape[:-1] + (1,))
+    hi = np.broadcast_to((n // 2)[..., None], a.shape[:-1] + (1,))
+    return ((np.take_along_axis(a, lo, -1) + np.take_along_axis(a, hi, -1)) / 2)[..., 0]
+
+
+def mann_whitney(x, nx, y, ny):
+    """Row-wise two-sided Mann-Whitney U test; returns (U, p, Cliff's delta).
+
+    U counts the pairs where x is larger; delta > 0 means x tends to be larger.
+
+    Uses the normal approximation with a continuity correction. NaN padding
+    compares false in both directions and does not count.
+    """
+    gt = (x[:, :, None] > y[:, None, :]).sum(axis=(1, 2))
+    eq = (x[:, :, None] == y[:, None, :]).sum(axis=(1, 2))
+    u = gt + 0.5 * eq
+    pairs = (nx * ny).astype(np.float64)
+    mean = pairs / 2
+    sd = np.sqrt(pairs * (nx + ny + 1) / 12.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (np.abs(u - mean) - 0.5).clip(min=0) / sd
+        p = _erfc(np.nan_to_num(z) / math.sqrt(2))
+        delta = 2 * u / pairs - 1
+    return u, p, delta
+
+
+def benjamini_hochberg(p):
+    """q-values for a vector of p-values."""
+    n = len(p)
+    if n == 0:
+        return p
+    order = np.argsort(p)
+    ranked = p[order] * n / np.arange(1, n + 1)
+    q = np.minimum.accumulate(ranked[::-1])[::-1].clip(max=1.0)
+    out = np.empty(n)
+    out[order] = q
+    return out
+
+
+def bootstrap_ratio_ci(x, nx, y, ny, rounds=BOOTSTRAP, seed=SEED):
+    """Row-wise percentile 95% CI of median(y) / median(x) by resampling both."""
+    rng = np.random.default_rng(seed)
+    rows = np.arange(len(x))[:, None]
+    ratios = []
+    step = max(1, BOOTSTRAP_CHUNK // (len(x) * max(x.shape[1], y.shape[1])))
+    for start in range(0, rounds, step):
+        b = min(step, rounds - start)
+        ix = (rng.random((b, len(x), x.shape[1])) * nx[:, None]).astype(np.intp)
+        iy = (rng.random((b, len(y), y.shape[1])) * ny[:, None]).astype(np.intp)
+        # resampling only draws the first n (valid) samples; use n of them per row
+        mx = np.where(np.arange(x.shape[1]) < nx[:, None], x[rows, ix], np.nan)
+        my = np.where(np.arange(y.shape[1]) < ny[:, None], y[rows, iy], np.nan)
+        ratios.append(row_median(my, ny) / row_median(mx, nx))
+    ratios = np.concatenate(ratios)
+    return np.percentile(ratios, 2.5, axis=0), np.percentile(ratios, 97.5, axis=0)
+
+
+def compare(base, cand, alpha=ALPHA, min_change=MIN_CHANGE, rounds=BOOTSTRAP, min_samples=3):
+    """Compare two {key: samples} sets on their common keys; returns a dict of column arrays."""
+    keys = sorted(k for k in base.keys() & cand.keys()
+                  if len(base[k]) >= min_samples and len(cand[k]) >= min_samples)
+    if not keys:
+        return {"keys": keys}
+    x, nx = pad([base[k] for k in keys])
+    y, ny = pad([cand[k] for k in keys])
+    base_med = row_median(x, nx)
+    cand_med = row_median(y, ny)
+    ratio = cand_med / base_med
+    # delta > 0: the candidate tends to be slower
+    _, p, delta = mann_whitney(y, ny, x, nx)
+    q = benjamini_hochberg(p)
+    if rounds:
+        ci_low, ci_high = bootstrap_ratio_ci(x, nx, y, ny, rounds)
+    else:
+        ci_low = ci_high = np.full(len(keys), np.nan)
+    significant = (q < alpha) & ~((ci_low <= 1) & (ci_high >= 1))
+    status = np.where(significant & (ratio > 1 + min_change), "REGRESSION",
+                      np.where(significant & (ratio < 1 - min_change), "SPEEDUP", "same"))
+    return {"keys": keys, "base_median": base_med, "median": cand_med, "ratio": ratio,
+            "ci_low": ci_low, "ci_high": ci_high, "delta": delta, "p": p, "q": q,
+            "base_n": nx, "n": ny, "status": status}
+
+
+def report_rows(label, res):
+    for i, (m, k, n, dtype, layout, kernel) in enumerate(res["keys"]):
+        yield [m, k, n, dtype, layout, kernel, label, res["base_median"][i], res["median"][i],
+               100.0 * (res["ratio"][i] - 1), res["ci_low"][i], res["ci_high"][i],
+               res["delta"][i], res["p"][i], res["q"][i], res["base_n"][i], res["n"][i], res["status"][i]]
+
+
+def print_summary(label, res, top):
+    keys = res["keys"]
+    if not keys:
+        print(f"\n[{label}] no shapes in common with the baseline")
+        return
+    status = res["status"]
+    print(f"\n[{label}] {len(keys)} shapes compared: {int((status == 'REGRESSION').sum())} regressions, "
+          f"{int((status == 'SPEEDUP').sum())} speedups")
+    for name, sign in (("REGRESSION", -1), ("SPEEDUP", 1)):
+        idx = np.flatnonzero(status == name)
+        idx = idx[np.argsort(sign * res["ratio"][idx])][:top]
+        for i in idx:
+            m, k, n, dtype, layout, kernel = keys[i]
+            print(f"    {name:10s} M={m} K={k} N={n} {dtype} {layout} {kernel}: {100 * (res['ratio'][i] - 1):+.1f}% "
+                  f"(CI {res['ci_low'][i]:.3f}-{res['ci_high'][i]:.3f}, delta {res['delta'][i]:+.2f}, "
+                  f"q={res['q'][i]:.2g})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect performance regressions between result sets.")
+    parser.add_argument("sets", nargs="+",
+                        help="result sets 'store.sqlite[:field=value,...]'; the first is the baseline")
+    parser.add_argument("--alpha", type=float, default=ALPHA, help="false discovery rate")
+    parser.add_argument("--min-change", type=float, default=MIN_CHANGE,
+                        help="ignore median changes smaller than this fraction")
+    parser.add_argument("--bootstrap", type=int, default=BOOTSTRAP, help="bootstrap rounds (0: skip the CI)")
+    parser.add_argument("--top", type=int, default=10, help="regressions/speedups to print per set")
+    parser.add_argument("--output", help="write the per-shape comparison to this CSV")
+    args = parser.parse_args()
+    if len(args.sets) < 2:
+        parser.error("need a baseline and at least one result set to compare")
+
+    try:
+        base = load_set(args.sets[0])
+        print(f"Baseline {args.sets[0]}: {len(base)} results")
+        cands = [(spec, load_set(spec)) for spec in args.sets[1:]]
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    rows = []
+    regressions = 0
+    disjoint = []
+    for spec, cand in cands:
+        res = compare(base, cand, args.alpha, args.min_change, args.bootstrap)
+        print_summary(spec, res, args.top)
+        if res["keys"]:
+            regressions += int((res["status"] == "REGRESSION").sum())
+            rows.extend(report_rows(spec, res))
+        else:
+            disjoint.append(spec)
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(REPORT_COLUMNS)
+            writer.writerows(rows)
+        print(f"\nComparison saved to: {args.output}")
+
+    if regressions:
+        print(f"\n[FAIL] {regressions} regressions")
+        sys.exit(1)
+    if disjoint:
+        print(f"\nError: nothing to compare for {', '.join(disjoint)}")
+        sys.exit(2)
+    print("\n[OK] no regressions")
+
+
+if __name__ == "__main__":
+    main()
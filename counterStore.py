@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""Columnar store for per-launch hardware counters (Parquet via pyarrow).
+
+The kernel-time collectors read only `kernel time` from the pmc files. With
+a counter store, every kernel launch becomes one row with typed columns:
+
+- M, K, N, run and launch: int32;
+- run_id, kernel, dtype and layout: strings, dictionary-encoded in Parquet;
+- time_s and one column per counter: float64, null when the launch does
+  not report that counter.
+
+Rows are buffered and flushed as independent part files
+(part-<pid>-<writer id>-<n>.parquet) into a dataset directory. Sweep workers on several
+devices can therefore write to the same store, and a long sweep never
+rewrites earlier data. Part files written with different counter sets are
+merged with a unified schema when read.
+
+load_counters() reads only the requested columns and pushes the `where`
+filters down to the Parquet row groups, so a query on a million-row sweep
+touches only the data it needs.
+
+Counter sets are named lists of counters (COUNTER_SETS) or comma-separated
+counter names. profiler_argv() writes them to an input file in the
+`pmc: A B C` format and passes that file to the profiler through
+COUNTER_OPTION.
+"""
+import argparse
+import operator
+import os
+import re
+import sys
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from procRunner import to_argv
+
+DEFAULT_ROOT = os.path.join("temp", "counters")
+FLUSH_ROWS = 100_000
+
+# Counters collected together in one profiler pass
+COUNTER_SETS = {
+    "occupancy": ["GRBM_COUNT", "GRBM_GUI_ACTIVE", "SQ_WAVES", "SQ_BUSY_CYCLES", "SQ_WAVE_CYCLES"],
+    "compute": ["SQ_INSTS_VALU", "SQ_INSTS_SALU", "SQ_INSTS_MFMA", "SQ_ACTIVE_INST_VALU", "SQ_INSTS_LDS"],
+    "memory": ["TCC_HIT_sum", "TCC_MISS_sum", "TCC_EA_RDREQ_sum", "TCC_EA_WRREQ_sum", "TCP_TCC_READ_REQ_sum"],
+    "lds": ["SQ_LDS_BANK_CONFLICT", "SQ_LDS_IDX_ACTIVE", "SQ_INSTS_LDS"],
+}
+# Counters the profiler can read in a single pass
+COUNTERS_PER_PASS = 8
+# Profiler option that selects the counter input file; {file} is replaced by its path
+COUNTER_OPTION = os.environ.get("HIPPROF_COUNTER_OPTION", "-i {file}")
+
+FIXED_COLUMNS = ["M", "K", "N", "run", "run_id", "launch", "kernel", "time_s"]
+INT_COLUMNS = ("M", "K", "N", "run", "launch")
+
+_OPS = {"=": operator.eq, "==": operator.eq, "!=": operator.ne,
+        "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+WHERE_RE = re.compile(r"^\s*([\w.\[\]]+)\s*(==|!=|<=|>=|=|<|>)\s*(.*?)\s*$")
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("the counter store needs pyarrow (pip install pyarrow)")
+
+
+def parse_counter_set(spec):
+    """'memory,SQ_WAVES' -> counter names; named sets are expanded, order kept, duplicates dropped."""
+    counters = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        for name in COUNTER_SETS.get(item, [item] if item else []):
+            if name not in counters:
+                counters.append(name)
+    return counters
+
+
+def write_counter_input(counters, path):
+    """Profiler input file: one `pmc:` line per pass of at most COUNTERS_PER_PASS counters."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for i in range(0, len(counters), COUNTERS_PER_PASS):
+            f.write("pmc: " + " ".join(counters[i:i + COUNTERS_PER_PASS]) + "\n")
+    return path
+
+
+def profiler_argv(profiler, counters, temp_dir="temp"):
+    """Profiler argv that also collects `counters` (the profiler unchanged when there are none)."""
+    argv = to_argv(profiler)
+    if not counters:
+        return argv
+    path = write_counter_input(counters, os.path.join(temp_dir, f"pmc_input_{os.getpid()}.txt"))
+    return argv + [part.replace("{file}", path) for part in to_argv(COUNTER_OPTION)]
+
+
+def _column_name(counter):
+    return f"pmc_{counter}" if counter in FIXED_COLUMNS else counter
+
+
+class CounterWriter:
+    """Buffers one row per kernel launch and flushes Parquet part files into `root`.
+
+    tags are constant string columns added to every row, e.g. dtype and layout.
+    Part files are named part-<pid>-<writer id>-<n>.parquet, so several
+    writers (one per variant, per backend) can share a root in one process.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, tags=None, flush_rows=FLUSH_ROWS):
+        require_pyarrow()
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.tags = dict(tags or {})
+        self.flush_rows = flush_rows
+        self.writer_id = uuid.uuid4().hex[:12]
+        self.parts = 0
+        self.rows = 0
+        self._reset()
+
+    def _reset(self):
+        self._fixed = {c: [] for c in FIXED_COLUMNS}
+        self._counters = {}
+        self._count = 0
+
+    def add(self, record, shape, run=None, run_id=None):
+        """Add one pmcParser.KernelRecord."""
+        m, k, n = shape if shape is not None else (None, None, None)
+        for column, value in zip(FIXED_COLUMNS, (m, k, n, run, None if run_id is None else str(run_id),
+                                                 record.index, record.name, record.time)):
+            self._fixed[column].append(value)
+        for counter, value in record.counters.items():
+            column = self._counters.get(counter)
+            if column is None:
+                column = self._counters[counter] = [None] * self._count
+            column.append(value)
+        self._count += 1
+        for column in self._counters.values():
+            if len(column) < self._count:
+                column.append(None)
+        if self._count >= self.flush_rows:
+            self.flush()
+
+    def add_records(self, records, shape, run=None, run_id=None):
+        for record in records:
+            self.add(record, shape, run, run_id)
+
+    def flush(self):
+        if not self._count:
+            return
+        arrays, names = [], []
+        for column, values in self._fixed.items():
+            kind = pa.int32() if column in INT_COLUMNS else pa.float64() if column == "time_s" else pa.string()
+            arrays.append(pa.array(values, type=kind))
+            names.append(column)
+        for tag, value in self.tags.items():
+            arrays.append(pa.array([str(value)] * self._count, type=pa.string()))
+            names.append(tag)
+        for counter, values in sorted(self._counters.items()):
+            arrays.append(pa.array(values, type=pa.float64()))
+            names.append(_column_name(counter))
+        path = os.path.join(self.root, f"part-{os.getpid()}-{self.writer_id}-{self.parts:05d}.parquet")
+        pq.write_table(pa.Table.from_arrays(arrays, names=names), path + ".tmp", compression="zstd")
+        os.replace(path + ".tmp", path)
+        self.parts += 1
+        self.rows += self._count
+        self._reset()
+
+    def close(self):
+        self.flush()
+
+
+def _dataset(root):
+    require_pyarrow()
+    dataset = ds.dataset(root, format="parquet")
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+    if len(schemas) > 1:
+        dataset = ds.dataset(root, format="parquet", schema=pa.unify_schemas(schemas))
+    return dataset
+
+
+def where_expression(where):
+    """{column: value | (low, high) | [values]} -> pyarrow filter expression (None for no filter).
+
+    A (low, high) tuple is an inclusive range (None for an open end), a list
+    matches any of its values, and a string containing '*' is a wildcard
+    match on the column.
+    """
+    expr = None
+    for column, value in (where or {}).items():
+        field = ds.field(column)
+        if isinstance(value, tuple):
+            low, high = value
+            parts = ([field >= low] if low is not None else []) + ([field <= high] if high is not None else [])
+        elif isinstance(value, list):
+            parts = [field.isin(value)]
+        elif isinstance(value, str) and "*" in value:
+            parts = [pc.match_like(field, value.replace("%", "\\%").replace("_", "\\_").replace("*", "%"))]
+        else:
+            parts = [field == value]
+        for part in parts:
+            expr = part if expr is None else expr & part
+    return expr
+
+
+def parse_where(items):
+    """['M>=1024', 'kernel=Cijk*'] -> pyarrow filter expression."""
+    expr = None
+    for item in items:
+        m = WHERE_RE.match(item)
+        if not m:
+            raise ValueError(f"bad filter '{item}', expected <column><op><value>")
+        column, op, text = m.groups()
+        try:
+            value = int(text)
+        except ValueError:
+            try:
+                value = float(text)
+            except ValueError:
+                value = text
+        if op in ("=", "==") and isinstance(value, str) and "*" in value:
+            part = where_expression({column: value})
+        else:
+            part = _OPS[op](ds.field(column), value)
+        expr = part if expr is None else expr & part
+    return expr
+
+
+def load_counters(root=DEFAULT_ROOT, columns=None, where=None):
+    """Read `columns` (all when None) of the rows matching `where` as a pandas DataFrame.
+
+    where is a dict for where_expression() or a pyarrow expression. Only
+    the requested columns are read, and the filter is applied to the
+    Parquet row-group statistics before any data is decoded.
+    """
+    dataset = _dataset(root)
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    expr = where if where is None or not isinstance(where, dict) else where_expression(where)
+    return dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+
+def counter_columns(root=DEFAULT_ROOT):
+    """Names of the counter columns in the store."""
+    tags = {"dtype", "layout"}
+    return [name for name in _dataset(root).schema.names if name not in FIXED_COLUMNS and name not in tags]
+
+
+def import_archive(writer, archive, shape=None):
+    """Parse archived per-shape traces (see traceArchive.py) into the counter store; returns the trace count."""
+    from pmcParser import iter_records
+
+    count = 0
+    for entry in archive.find(shape):
+        if entry.m is None:
+            continue
+        writer.add_records(iter_records(archive.open(entry)), (entry.m, entry.k, entry.n), entry.repeat,
+                           entry.run_id)
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar store of per-launch hardware counters.")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="counter store directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("sets", help="list the named counter sets")
+    p_query = sub.add_parser("query", help="print matching rows")
+    p_query.add_argument("--columns", help="comma-separated columns (default: all)")
+    p_query.add_argument("--where", action="append", default=[], help="filter such as M>=1024 or kernel=Cijk*")
+    p_query.add_argument("--output", help="write the rows to this CSV instead of printing them")
+    sub.add_parser("columns", help="list the counter columns in the store")
+    p_import = sub.add_parser("import", help="parse archived per-shape traces into the store")
+    p_import.add_argument("--traces", default=os.path.join("temp", "traces"), help="trace archive directory")
+    args = parser.parse_args(argv)
+
+    if args.command == "sets":
+        for name, counters in COUNTER_SETS.items():
+            print(f"{name}: {' '.join(counters)}")
+        return
+    try:
+        if args.command == "query":
+            columns = args.columns.split(",") if args.columns else None
+            df = load_counters(args.root, columns, parse_where(args.where))
+            if args.output:
+                df.to_csv(args.output, index=False)
+                print(f"[OK] {len(df)} rows saved to {args.output}")
+            else:
+                print(df.to_string(index=False))
+        elif args.command == "columns":
+            print("\n".join(counter_columns(args.root)))
+        else:
+            from traceArchive import TraceArchive
+
+            archive = TraceArchive(args.traces)
+            writer = CounterWriter(args.root)
+            count = import_archive(writer, archive)
+            writer.close()
+            archive.close()
+            print(f"[OK] {count} traces, {writer.rows} launches written to {args.root}")
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""Stand-in for `hipprof --pmc` that needs neither hipprof nor a GPU.
+
+    python fakeHipprof.py [options] [--pmc] [-i pmc_input.txt] <bench command ...>
+
+It prints the `HIP_PROF:process id '<pid>'` line and writes a
+pmc_results_<pid>.txt in the format pmcParser.py reads. By default the
+benchmark command is not run; the trace is synthesized from it:
+
+- `... benchGemm.py M K N`: one run of that shape
+- `... benchGemm.py --batch shapes.txt --repeat R --warmup W [--attribute]`:
+  the BENCH_MARK (or BENCH_OP) lines are printed and the trace holds a
+  marker fill kernel before every segment, as gemmHarness.run_batch does
+
+Every run launches one GEMM kernel per --names entry, timed as
+2*M*K*N / --tflops plus a launch overhead with --noise relative noise and
+--outliers slow runs, between --kernels background kernels (copies and
+elementwise ops). Each record carries the counters of the -i input file
+(`pmc:` lines, see counterStore.py), --counters extra synthetic counters
+and BeginNs/EndNs timestamps. With --run the command is run for real, its
+output passed through, and the pid is the benchmark's.
+
+Latency and failures can be injected: --startup and --teardown delays,
+--file-delay writes the pmc file that long after exiting, and with
+probability --fail-rate a run fails in one of the --failures modes:
+
+- nopid: exits with status 1 before printing the pid line
+- nofile: prints the pid line but writes no pmc file
+- truncated: the pmc file stops in the middle of the GEMM records
+- hang: never exits (the harness has to time it out)
+
+Use it wherever a profiler command is taken, e.g.
+
+    python sweepScheduler.py shapes.txt kernel_list.txt --profiler "python fakeHipprof.py --fail-rate 0.05"
+    HIPPROF="python fakeHipprof.py" python run.py
+
+benchHarness.py uses it to benchmark the harness itself.
+"""
+import argparse
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+
+# Kernel names as Tensile / lightop / PyTorch print them; {tile} is the macro tile
+DEFAULT_NAMES = [
+    "Cijk_Ailk_Bljk_HHS_BH_MT{tile}x{tile}x32_MI32x32x8x1_SN_1LDSB1_AFC1_AG0_ASEM8_CLR1_DTVA0_EPS1_GRVW8_"
+    "ISA942_IU1_K1_LBSPPA128_LPA8_LPB8_MIAV0_NLCA1_NLCB1_PGR2_PLR1_SIA3_SS1_SU32_SUS128_SVW4_TT2_64_TLDS1_"
+    "WG32_8_1_WGM8",
+    "void lightop::gemm_kernel<__half, 128, 128, 32, 4>(lightop::GemmParams)",
+]
+BACKGROUND_NAMES = [
+    "void at::native::elementwise_kernel<128, 2, at::native::gpu_kernel_impl_nocast<"
+    "at::native::direct_copy_kernel_cuda(at::TensorIteratorBase&)::{lambda()#3}::operator()() const::"
+    "{lambda()#14}::operator()() const::{lambda(c10::Half)#1}>(at::TensorIteratorBase&)>(int, ...)",
+    "void at::native::vectorized_elementwise_kernel<4, at::native::CUDAFunctor_add<c10::Half>, "
+    "at::detail::Array<char*, 3> >(int, at::native::CUDAFunctor_add<c10::Half>, at::detail::Array<char*, 3>)",
+    "__amd_rocclr_copyBuffer",
+]
+# Matches getKernelTime.MARKER_PATTERNS
+MARKER_NAME = ("void at::native::vectorized_elementwise_kernel<4, at::native::FillFunctor<long>, "
+               "at::detail::Array<char*, 1> >(int, at::native::FillFunctor<long>, at::detail::Array<char*, 1>)")
+DEFAULT_COUNTERS = ["GRBM_COUNT", "GRBM_GUI_ACTIVE", "SQ_WAVES"]
+FAILURES = ("nopid", "nofile", "truncated", "hang")
+LAUNCH_OVERHEAD = 4e-6
+# Names of the ops of the two benchGemm.py scripts, for BENCH_OP lines
+OP_NAMES = ["torch_gemm", "lightop_gemm"]
+CLOCK_HZ = 2.1e9
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="fakeHipprof.py", description="Stand-in for hipprof --pmc.")
+    parser.add_argument("--pmc", action="store_true", help="accepted for compatibility with hipprof")
+    parser.add_argument("-i", dest="input", help="counter input file ('pmc: A B ...' lines)")
+    parser.add_argument("--run", action="store_true", help="run the benchmark command instead of synthesizing")
+    parser.add_argument("--names", help="GEMM kernel names, '|'-separated ({tile} is replaced by the macro tile)")
+    parser.add_argument("--kernels", type=int, default=4, help="background kernels per run")
+    parser.add_argument("--counters", type=int, default=0, help="extra synthetic counters per record")
+    parser.add_argument("--tflops", type=float, default=80.0, help="GEMM throughput of the fake device")
+    parser.add_argument("--noise", type=float, default=0.02, help="relative timing noise (sigma)")
+    parser.add_argument("--outliers", type=float, default=0.0, help="fraction of runs 1.5-3x slower")
+    parser.add_argument("--startup", type=float, default=0.0, help="seconds before the run starts")
+    parser.add_argument("--teardown", type=float, default=0.0, help="seconds between writing the trace and exiting")
+    parser.add_argument("--file-delay", type=float, default=0.0, help="write the pmc file this long after exiting")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="probability that a run fails")
+    parser.add_argument("--failures", default="nopid,nofile,truncated",
+                        help=f"failure modes to pick from: {', '.join(FAILURES)}")
+    parser.add_argument("--seed", type=int, help="random seed (default: pid and time)")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="benchmark command")
+    args = parser.parse_args(argv)
+    args.names = args.names.split("|") if args.names else DEFAULT_NAMES
+    args.failures = [f.strip() for f in args.failures.split(",") if f.strip()]
+    unknown = [f for f in args.failures if f not in FAILURES]
+    if unknown:
+        parser.error(f"unknown failure modes: {', '.join(unknown)}")
+    return args
+
+
+def read_counter_input(path):
+    counters = []
+    if path:
+        with open(path) as f:
+            for line in f:
+                if line.startswith("pmc:"):
+                    counters += [c for c in line[4:].split() if c not in counters]
+    return counters
+
+
+def macro_tile(m, n):
+    return 256 if min(m, n) >= 4096 else 128 if min(m, n) >= 256 else 64
+
+
+def gemm_time(shape, index, args, rng):
+    """Seconds for GEMM kernel `index` (later names are 10% faster each) of one run."""
+    m, k, n = shape[:3]
+    batch = shape[3] if len(shape) > 3 else 1
+    t = 2.0 * m * k * n * batch / (args.tflops * 1e12) * (1 - 0.1 * index) + LAUNCH_OVERHEAD
+    t *= max(0.1, 1 + rng.gauss(0, args.noise))
+    if args.outliers and rng.random() < args.outliers:
+        t *= rng.uniform(1.5, 3.0)
+    return t
+
+
+class TraceWriter:
+    """Writes kernel records in the pmc_results_<pid>.txt format."""
+
+    def __init__(self, f, counters, extra_counters=0, rng=None):
+        self.f = f
+        self.counters = list(counters) + [f"FAKE_COUNTER_{i}" for i in range(extra_counters)]
+        self.rng = rng or random.Random()
+        self.clock_ns = 1_000_000
+
+    def kernel(self, name, seconds):
+        begin = self.clock_ns
+        end = begin + int(seconds * 1e9)
+        self.clock_ns = end + 2000
+        cycles = int(seconds * CLOCK_HZ)
+        values = []
+        for c in self.counters:
+            if c in ("GRBM_COUNT", "GRBM_GUI_ACTIVE"):
+                values.append(cycles)
+            else:
+                values.append(self.rng.randint(1, max(2, cycles)))
+        pairs = ", ".join(f"{c}: {v}" for c, v in zip(self.counters, values))
+        self.f.write(f'kernel-name:"{name}"\nkernel time {seconds:.9f}(s)\n'
+                     f"{pairs + ', ' if pairs else ''}BeginNs: {begin}, EndNs: {end}\n")
+
+    def background(self, count, shape):
+        m, k, n = shape[:3]
+        for i in range(count):
+            seconds = (m * n * 2e-12 + 2e-6) * self.rng.uniform(0.8, 1.2)
+            self.kernel(BACKGROUND_NAMES[i % len(BACKGROUND_NAMES)], seconds)
+
+
+def write_run(writer, shape, args, rng, stop_after=None):
+    """One benchmark run: background kernels around one launch per GEMM name.
+
+    With stop_after, the trace ends in the middle of the kernel-name line
+    of GEMM launch number stop_after, and False is returned.
+    """
+    tile = macro_tile(shape[0], shape[2])
+    half = args.kernels // 2
+    writer.background(half, shape)
+    for i, name in enumerate(args.names):
+        name = name.replace("{tile}", str(tile))
+        if stop_after is not None and i >= stop_after:
+            writer.f.write(f'kernel-name:"{name[:len(name) // 2]}')
+            return False
+        writer.kernel(name, gemm_time(shape, i, args, rng))
+    writer.background(args.kernels - half, shape)
+    return True
+
+
+def write_trace(path, shapes, args=None, repeat=1, rng=None):
+    """Write a synthetic per-shape trace: `repeat` runs of every shape; returns its size in bytes.
+
+    benchHarness.py uses this for parser benchmarks; args are the
+    parse_args() options (defaults when None).
+    """
+    args = args or parse_args([])
+    rng = rng or random.Random(args.seed)
+    with open(path, "w") as f:
+        writer = TraceWriter(f, DEFAULT_COUNTERS + read_counter_input(args.input), args.counters, rng)
+        for shape in shapes:
+            for _ in range(repeat):
+                write_run(writer, shape, args, rng)
+    return os.path.getsize(path)
+
+
+def read_shape_file(path):
+    shapes = []
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        for line in f:
+            line = line.split("#", 1)[0].replace(",", " ").strip()
+            if line:
+                shapes.append(tuple(int(x) for x in line.split()[:3]))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return shapes
+
+
+def option_value(argv, name, default=None):
+    return argv[argv.index(name) + 1] if name in argv and argv.index(name) + 1 < len(argv) else default
+
+
+def bench_shape(command):
+    """(M, K, N[, batch]) from a per-shape benchmark command, or None."""
+    script = next((i for i, a in enumerate(command) if a.endswith(".py")), None)
+    start = 0 if script is None else script + 1
+    numbers = []
+    for token in command[start:]:
+        if not re.fullmatch(r"\d+", token):
+            break
+        numbers.append(int(token))
+    if len(numbers) < 3:
+        return None
+    batch = option_value(command, "--batch-count")
+    return tuple(numbers[:3]) + ((int(batch),) if batch and int(batch) > 1 else ())
+
+
+def synthesize(command, writer, args, rng, truncate):
+    """Write the trace for a benchmark command that is not run; print what the benchmark would."""
+    stop_after = rng.randrange(len(args.names)) if truncate else None
+    if "--batch" in command:
+        shapes = read_shape_file(option_value(command, "--batch"))
+        repeat = int(option_value(command, "--repeat", 10))
+        warmup = max(int(option_value(command, "--warmup", 1)), 1)
+        attribute = "--attribute" in command
+        seq = 0
+        for shape in shapes:
+            if attribute:
+                writer.kernel(MARKER_NAME, 1e-6)
+                print(f"BENCH_OP {seq} inputs {shape[0]} {shape[1]} {shape[2]} 0 inputs")
+                seq += 1
+            for phase, rep in [("warmup", r) for r in range(warmup)] + [("run", r) for r in range(repeat)]:
+                if attribute:
+                    # one marker per op call, as run_batch does with --attribute
+                    for i, name in enumerate(args.names):
+                        writer.kernel(MARKER_NAME, 1e-6)
+                        op = OP_NAMES[i] if i < len(OP_NAMES) else f"op{i}"
+                        print(f"BENCH_OP {seq} {phase} {shape[0]} {shape[1]} {shape[2]} {rep} {op}")
+                        seq += 1
+                        writer.kernel(name.replace("{tile}", str(macro_tile(shape[0], shape[2]))),
+                                      gemm_time(shape, i, args, rng))
+                    continue
+                writer.kernel(MARKER_NAME, 1e-6)
+                print(f"BENCH_MARK {seq} {phase} {shape[0]} {shape[1]} {shape[2]} {rep}")
+                seq += 1
+                if not write_run(writer, shape, args, rng, stop_after if phase == "run" else None):
+                    return
+        return
+    shape = bench_shape(command)
+    if shape is None:
+        writer.background(args.kernels, (64, 64, 64))
+        return
+    write_run(writer, shape, args, rng, stop_after)
+
+
+def run_benchmark(command, writer, args, rng, truncate):
+    """Run the benchmark command, passing its output through; return its pid and exit status."""
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    output = []
+    for line in proc.stdout:
+        sys.stdout.write(line)
+        output.append(line)
+    proc.wait()
+    marks = [line.split() for line in output if line.startswith(("BENCH_MARK ", "BENCH_OP "))]
+    if not marks:
+        shape = bench_shape(command)
+        write_run(writer, shape or (64, 64, 64), args, rng, rng.randrange(len(args.names)) if truncate else None)
+        return proc.pid, proc.returncode
+    for i, mark in enumerate(marks):
+        writer.kernel(MARKER_NAME, 1e-6)
+        shape = tuple(int(x) for x in mark[3:6])
+        if mark[0] == "BENCH_OP":
+            index = OP_NAMES.index(mark[7]) if mark[7] in OP_NAMES else 0
+            if mark[7] != "inputs" and index < len(args.names):
+                writer.kernel(args.names[index].replace("{tile}", str(macro_tile(shape[0], shape[2]))),
+                              gemm_time(shape, index, args, rng))
+        elif not write_run(writer, shape, args, rng, 0 if truncate and i == len(marks) - 1 else None):
+            break
+    return proc.pid, proc.returncode
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        print("Usage: python fakeHipprof.py [options] [--pmc] [-i pmc_input.txt] <command ...>")
+        sys.exit(2)
+    rng = random.Random(args.seed if args.seed is not None else (os.getpid() << 20) ^ time.time_ns())
+    failure = rng.choice(args.failures) if args.failures and rng.random() < args.fail_rate else None
+
+    if args.startup:
+        time.sleep(args.startup)
+    if failure == "nopid":
+        print("hipprof: failed to attach to the application", file=sys.stderr)
+        sys.exit(1)
+    if failure == "hang":
+        sys.stdout.flush()
+        while True:
+            time.sleep(3600)
+
+    counters = DEFAULT_COUNTERS + [c for c in read_counter_input(args.input) if c not in DEFAULT_COUNTERS]
+    pid = os.getpid()
+    tmp_path = f".pmc_results_{pid}.tmp"
+    with open(tmp_path, "w") as f:
+        writer = TraceWriter(f, counters, args.counters, rng)
+        if args.run:
+            pid, status = run_benchmark(command, writer, args, rng, failure == "truncated")
+        else:
+            synthesize(command, writer, args, rng, failure == "truncated")
+            status = 0
+    sys.stdout.flush()
+
+    # renamed into place, so a reader never sees a half-written file unless it is meant to
+    if failure == "nofile":
+        os.remove(tmp_path)
+    elif args.file_delay > 0:
+        if os.fork() == 0:
+            # the trace shows up after the profiler has exited; let go of the
+            # output pipe so the harness sees the exit right away
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            time.sleep(args.file_delay)
+            os.replace(tmp_path, f"pmc_results_{pid}.txt")
+            os._exit(0)
+    else:
+        os.replace(tmp_path, f"pmc_results_{pid}.txt")
+    if args.teardown:
+        time.sleep(args.teardown)
+    print(f"HIP_PROF:process id '{pid}'", flush=True)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""In-process batch loop and GEMM inputs/ops shared by the benchGemm.py scripts.
+
+Batch mode runs every shape and repeat inside one process. Before each
+measured (or warm-up) segment a tiny int64 fill kernel is launched and a
+matching ``BENCH_MARK`` line is printed, so the kernel-time collector can
+split the profiler trace into segments and map each one back to its
+(M, K, N, repeat). With --attribute the marker is emitted before every op
+call instead (``BENCH_OP`` lines naming the op, plus one before the inputs
+are created), so traceAttribution.py can attribute every launch to the
+logical operation it belongs to.
+
+make_gemm_inputs lays the input-store data out as a GEMM variant asks
+(dtype, transposes, batch, padded leading dimension, alpha/beta; see
+gemmVariant.py), and torch_gemm runs it with the matching torch op. An op
+raises NotImplementedError for a variant it cannot run; run_ops then skips
+it for that shape.
+"""
+import argparse
+
+import torch
+
+# read_shapes is re-exported for the bench scripts
+from getKernelTime import MARKER_PREFIX, OP_MARKER_PREFIX, read_shapes
+from gemmVariant import DEFAULT_VARIANT, add_variant_args
+from inputStore import default_store
+
+TORCH_DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16, "int8": torch.int8}
+# torch._int_mm on the GPU needs M > INT_MM_MIN_M and K, N multiples of INT_MM_ALIGN (the CPU takes any shape)
+INT_MM_MIN_M = 16
+INT_MM_ALIGN = 8
+
+
+def parse_batch_args(argv, prog, dtype="fp32"):
+    parser = argparse.ArgumentParser(prog=f"{prog} --batch")
+    parser.add_argument("shapes", help="shape list file ('M K N' per line), or '-' for stdin")
+    parser.add_argument("--repeat", type=int, default=10, help="measured repeats per shape")
+    parser.add_argument("--warmup", type=int, default=1, help="warm-up runs per shape")
+    parser.add_argument("--attribute", action="store_true",
+                        help="mark every op call instead of every run (see traceAttribution.py)")
+    add_variant_args(parser, dtype)
+    return parser.parse_args(argv)
+
+
+def _operand(store, name, rows, cols, transposed, variant, device):
+    """rows x cols operand (batched when batch > 1), stored transposed and/or with padded rows."""
+    stored_rows, stored_cols = (cols, rows) if transposed else (rows, cols)
+    shape = (stored_rows, stored_cols + variant.pad)
+    if variant.batch > 1:
+        shape = (variant.batch,) + shape
+    t = store.tensor(name, shape, TORCH_DTYPES[variant.dtype], device)[..., :stored_cols]
+    return t.transpose(-1, -2) if transposed else t
+
+
+def make_gemm_inputs(M, K, N, device, variant=DEFAULT_VARIANT, store=None):
+    """(A, B, C, alpha, beta) for `variant`; C is None unless there is an alpha/beta epilogue."""
+    store = store or default_store()
+    A = _operand(store, "A", M, K, variant.trans[0] == "T", variant, device)
+    B = _operand(store, "B", K, N, variant.trans[1] == "T", variant, device)
+    C = None
+    if variant.alpha != 1 or variant.beta != 0:
+        shape = (M, N) if variant.batch == 1 else (variant.batch, M, N)
+        C = store.tensor("C", shape, TORCH_DTYPES[variant.dtype], device)
+    return A, B, C, variant.alpha, variant.beta
+
+
+def torch_gemm(A, B, C=None, alpha=1.0, beta=0.0):
+    """matmul/bmm, addmm/baddbmm with an epilogue, torch._int_mm for int8."""
+    if A.dtype == torch.int8:
+        if A.dim() != 2 or C is not None:
+            raise NotImplementedError("int8 GEMM supports neither batches nor alpha/beta")
+        (m, k), n = A.shape, B.shape[1]
+        if A.device.type != "cpu" and (m <= INT_MM_MIN_M or k % INT_MM_ALIGN or n % INT_MM_ALIGN):
+            raise NotImplementedError(f"int8 GEMM needs M > {INT_MM_MIN_M} and K, N multiples of {INT_MM_ALIGN}")
+        return torch._int_mm(A, B)
+    if C is None:
+        return torch.matmul(A, B)
+    if A.dim() == 3:
+        return torch.baddbmm(C, A, B, beta=beta, alpha=alpha)
+    return torch.addmm(C, A, B, beta=beta, alpha=alpha)
+
+
+def run_ops(ops, inputs, shape, before=None):
+    """Run every op once; return the ops that support these inputs.
+
+    before(op), when given, is called ahead of each op.
+    """
+    active = []
+    for op in ops:
+        if before is not None:
+            before(op)
+        try:
+            op(*inputs)
+        except NotImplementedError as e:
+            m, k, n = shape
+            print(f"[WARN] {op.__name__} skipped for M={m} K={k} N={n}: {e}", flush=True)
+            continue
+        active.append(op)
+    return active
+
+
+def emit_marker(seq, phase, shape, rep, device):
+    """Launch the marker kernel and print the marker line for one segment."""
+    torch.full((1,), seq, dtype=torch.int64, device=device)
+    m, k, n = shape
+    print(f"{MARKER_PREFIX} {seq} {phase} {m} {k} {n} {rep}", flush=True)
+
+
+def emit_op_marker(seq, phase, shape, rep, op_name, device):
+    """Launch the marker kernel and print the marker line for one op call."""
+    torch.full((1,), seq, dtype=torch.int64, device=device)
+    m, k, n = shape
+    print(f"{OP_MARKER_PREFIX} {seq} {phase} {m} {k} {n} {rep} {op_name}", flush=True)
+
+
+def run_batch(shapes, make_inputs, ops, repeat=10, warmup=1, device=None, variant=DEFAULT_VARIANT,
+              attribute=False):
+    """Run every op for every shape: a warm-up phase, then `repeat` measured runs.
+
+    make_inputs(M, K, N, device, variant) returns the op arguments; they are
+    created once per shape and reused by every warm-up and measured run. The
+    first warm-up run (always done) also drops the ops that do not support
+    the variant. attribute=True marks every op call (and the input creation)
+    instead of every run.
+    """
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+    seq = 0
+    for shape in shapes:
+        def mark(phase, rep, op_name=None):
+            nonlocal seq
+            if op_name is None:
+                emit_marker(seq, phase, shape, rep, device)
+            else:
+                emit_op_marker(seq, phase, shape, rep, op_name, device)
+            seq += 1
+
+        if attribute:
+            mark("inputs", 0, "inputs")
+        inputs = make_inputs(*shape, device, variant)
+
+        active = None
+        runs = [("warmup", rep) for rep in range(max(warmup, 1))] + [("run", rep) for rep in range(repeat)]
+        for phase, rep in runs:
+            before = None
+            if attribute:
+                before = lambda op: mark(phase, rep, op.__name__)
+            else:
+                mark(phase, rep)
+            if active is None:
+                active = run_ops(ops, inputs, shape, before)
+                continue
+            for op in active:
+                if before is not None:
+                    before(op)
+                op(*inputs)
+
+        del inputs
+
+    if device == 'cuda':
+        torch.cuda.synchronize()
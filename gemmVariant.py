@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""GEMM variants: everything about a benchmark run except M, K and N.
+
+A variant fixes:
+- the input dtype;
+- the transpose of each operand, as 'NN', 'NT', 'TN' or 'TT' for op(A)
+  and op(B); 'T' means the operand is stored transposed, e.g. a Linear
+  weight stored N x K;
+- the batch count (bmm / baddbmm when > 1);
+- the leading-dimension padding in elements added to every stored row;
+- the alpha / beta epilogue, C = alpha * op(A) op(B) + beta * C.
+
+The bench scripts take one variant as command-line options (variant_argv
+produces them). The sweep drivers take comma-separated lists and measure
+every combination. Results are keyed by the dtype and the layout tag of
+the variant, and the sweep CSVs record each field in its own column.
+"""
+import itertools
+from collections import namedtuple
+
+GemmVariant = namedtuple("GemmVariant", ["dtype", "trans", "batch", "pad", "alpha", "beta"])
+
+DTYPES = ("fp32", "fp16", "bf16", "int8")
+TRANSPOSES = ("NN", "NT", "TN", "TT")
+DEFAULT_VARIANT = GemmVariant("fp32", "NN", 1, 0, 1.0, 0.0)
+
+# Result columns, in GemmVariant field order
+VARIANT_COLUMNS = ["DType", "Trans", "Batch", "Pad", "Alpha", "Beta"]
+
+
+def layout_tag(variant):
+    """Result-store key for everything but the dtype, e.g. 'NT_b8_p0_a1_b0'."""
+    return f"{variant.trans}_b{variant.batch}_p{variant.pad}_a{variant.alpha:g}_b{variant.beta:g}"
+
+
+DEFAULT_LAYOUT = layout_tag(DEFAULT_VARIANT)
+
+
+def variant_argv(variant):
+    """Bench script options selecting `variant`."""
+    return ["--dtype", variant.dtype, "--trans", variant.trans, "--batch-count", str(variant.batch),
+            "--pad", str(variant.pad), "--alpha", f"{variant.alpha:g}", "--beta", f"{variant.beta:g}"]
+
+
+def add_variant_args(parser, dtype="fp32"):
+    """Options for a single variant (bench scripts)."""
+    parser.add_argument("--dtype", choices=DTYPES, default=dtype, help="input dtype")
+    parser.add_argument("--trans", choices=TRANSPOSES, default="NN", help="transpose of A and B")
+    parser.add_argument("--batch-count", type=int, default=1, help="batch count (bmm/baddbmm when > 1)")
+    parser.add_argument("--pad", type=int, default=0, help="leading-dimension padding in elements")
+    parser.add_argument("--alpha", type=float, default=1.0)
+    parser.add_argument("--beta", type=float, default=0.0)
+
+
+def variant_from_args(args):
+    return GemmVariant(args.dtype, args.trans, args.batch_count, args.pad, args.alpha, args.beta)
+
+
+def _list(text, convert, choices=None):
+    values = [convert(v.strip()) for v in str(text).split(",") if v.strip()]
+    if choices is not None:
+        bad = [v for v in values if v not in choices]
+        if bad:
+            raise ValueError(f"unsupported value(s) {', '.join(map(str, bad))}; choose from {', '.join(choices)}")
+    return values
+
+
+def add_variant_sweep_args(parser, dtype="fp32"):
+    """Comma-separated lists of variant fields (sweep drivers); every combination is measured."""
+    parser.add_argument("--dtype", default=dtype, help=f"input dtypes ({', '.join(DTYPES)})")
+    parser.add_argument("--trans", default="NN", help=f"transposes ({', '.join(TRANSPOSES)})")
+    parser.add_argument("--batch-count", default="1", help="batch counts")
+    parser.add_argument("--pad", default="0", help="leading-dimension paddings in elements")
+    parser.add_argument("--alpha", default="1", help="alpha values")
+    parser.add_argument("--beta", default="0", help="beta values")
+
+
+def variants_from_args(args):
+    return variant_grid(args.dtype, args.trans, args.batch_count, args.pad, args.alpha, args.beta)
+
+
+def variant_grid(dtypes="fp32", transposes="NN", batches="1", pads="0", alphas="1", betas="0"):
+    """Every combination of the comma-separated field lists."""
+    return [GemmVariant(*v) for v in itertools.product(
+        _list(dtypes, str, DTYPES), _list(transposes, str.upper, TRANSPOSES), _list(batches, int),
+        _list(pads, int), _list(alphas, float), _list(betas, float))]
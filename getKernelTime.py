@@ -1,92 +1,548 @@
 #!/usr/bin/env python3
-import subprocess
 import re
 import csv
 import os
+import random
 import time
-import shutil
 import sys
+from collections import OrderedDict, namedtuple
 from datetime import datetime
 
+import harnessProfile
+from harnessProfile import profiled_run, span
+from pmcParser import KernelMatcher, collect_kernel_times, iter_records
+from procRunner import run_command, to_argv
+from sampleStats import MAX_RUNS, MIN_RUNS, REL_CI, enough_samples, summarize
+from counterStore import CounterWriter, profiler_argv
+from gemmVariant import layout_tag, variant_argv
+from traceArchive import TraceArchive
+
 def read_kernel_list(file_path):
     """Read kernel names or patterns from a file (one per line)."""
     with open(file_path, "r") as f:
         kernels = [line.strip() for line in f if line.strip()]
     return kernels
 
-def run_hipprof(run_cmd, kernel_list_file, repeat=10):
+def read_shapes(source):
+    """Read (M, K, N) triples from a file, or from stdin when source is '-'."""
+    f = sys.stdin if source == "-" else open(source, "r")
+    shapes = []
+    try:
+        for line in f:
+            line = line.split("#", 1)[0].replace(",", " ").strip()
+            if not line:
+                continue
+            m, k, n = (int(x) for x in line.split()[:3])
+            shapes.append((m, k, n))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return shapes
+
+# Per-run limit for one profiled benchmark process; hung runs are killed and retried
+RUN_TIMEOUT = 600.0
+RUN_RETRIES = 1
+
+def launch_hipprof(run_cmd, profiler="hipprof --pmc", timeout=RUN_TIMEOUT, retries=RUN_RETRIES, keep=None):
+    """Run `hipprof --pmc <run_cmd>` once without a shell; return (pid, RunResult).
+
+    run_cmd and profiler are argv lists or command strings (split with
+    shlex). pid is None on failure; result.tail holds the last output lines
+    and result.kept the lines matching `keep`. `profiler` may name any
+    stand-in that prints the HIP_PROF process id line and writes
+    pmc_results_<pid>.txt.
+    """
+    argv = to_argv(profiler) + to_argv(run_cmd)
+    with span("launch") as info:
+        result = run_command(argv, timeout, retries, keep=keep)
+        info["pid"] = result.pid
+    if result.timed_out:
+        return None, result
+    return result.pid, result
+
+# Upper bound for the pmc file to show up after the profiler has exited
+PMC_WAIT_TIMEOUT = 15.0
+
+def wait_for_file(path, timeout=PMC_WAIT_TIMEOUT, poll=0.005):
+    """Wait until `path` exists and its size has stopped changing.
+
+    Called after the profiler process has exited, so the file is normally
+    complete already and this returns after one short poll; the backoff
+    only kicks in while the file is missing or still growing.
+    """
+    with span("wait"):
+        deadline = time.monotonic() + timeout
+        last_size = None
+        while True:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = None
+            if size is not None and size == last_size:
+                return True
+            last_size = size
+            if time.monotonic() >= deadline:
+                return False
+            with span("sleep"):
+                time.sleep(poll)
+            poll = min(poll * 2, 0.5)
+
+# === Batch mode (benchGemm.py --batch) ===
+# Marker kernel names as they show up in the pmc trace (demangled / mangled)
+MARKER_PATTERNS = ["*FillFunctor<long>*", "*FillFunctorIlE*"]
+MARKER_PREFIX = "BENCH_MARK"
+MARKER_RE = re.compile(MARKER_PREFIX + r" (\d+) (\w+) (\d+) (\d+) (\d+) (\d+)")
+# --batch --attribute: one marker per op call instead of per segment (see traceAttribution.py)
+OP_MARKER_PREFIX = "BENCH_OP"
+OP_MARKER_RE = re.compile(OP_MARKER_PREFIX + r" (\d+) (\w+) (\d+) (\d+) (\d+) (\d+) (\S+)")
+
+def parse_markers(output):
+    """Return [(phase, (M, K, N), repeat), ...] in the order the benchmark printed them."""
+    markers = []
+    for m in MARKER_RE.finditer(output):
+        _, phase, M, K, N, rep = m.groups()
+        markers.append((phase, (int(M), int(K), int(N)), int(rep)))
+    return markers
+
+def split_by_markers(records, markers, marker_patterns):
+    """Assign kernel records to the marker segment they follow.
+
+    Yields the marker tuple followed by the record, e.g. (phase, shape,
+    repeat, record) for parse_markers; records before the first marker
+    kernel are dropped.
+    """
+    marker_matcher = KernelMatcher(marker_patterns)
+    seg = -1
+    for record in records:
+        if marker_matcher.match(record.name):
+            seg += 1
+            continue
+        if 0 <= seg < len(markers):
+            yield markers[seg] + (record,)
+
+def trimmed_mean(values):
+    """Average excluding max and min; None when fewer than 3 valid values."""
+    valid = sorted(v for v in values if v is not None)
+    if len(valid) < 3:
+        return None
+    trimmed = valid[1:-1]
+    return sum(trimmed) / len(trimmed)
+
+def run_hipprof_batch(shape_file, kernel_list_file, bench_cmd="python benchGemm.py", repeat=10, warmup=1,
+                      wait_timeout=PMC_WAIT_TIMEOUT, profiler="hipprof --pmc", timeout=None, output_csv=None,
+                      bench_args=(), counters=(), counter_writer=None):
+    """Profile every shape in shape_file with a single `benchGemm.py --batch` process.
+
+    bench_args are appended to the benchmark command, e.g. variant_argv(v).
+    The profiler also collects `counters`, and every kernel launch of the
+    measured runs is added to counter_writer (a counterStore.CounterWriter)
+    when one is given.
+
+    Returns {(M, K, N): {kernel_pattern: [time per repeat]}}; the first
+    matching kernel of each measured segment is used, as in run_hipprof.
+    """
     kernel_names = read_kernel_list(kernel_list_file)
     if not kernel_names:
         print("Error: kernel list file is empty or not found.")
         sys.exit(1)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_csv = f"hipprof_results_{timestamp}.csv"
-    os.makedirs("temp", exist_ok=True)
-    all_results = {k: [] for k in kernel_names}
+    run_cmd = to_argv(bench_cmd) + ["--batch", shape_file, "--repeat", str(repeat), "--warmup", str(warmup)] + list(bench_args)
+    print(f"\n[Batch] Running: {profiler} {' '.join(run_cmd)}")
+    pid, result = launch_hipprof(run_cmd, profiler_argv(profiler, counters), timeout, retries=0, keep=MARKER_RE)
+    if pid is None:
+        print("Error: process id not found.")
+        print("".join(result.tail))
+        return {}
+    pmc_file = f"pmc_results_{pid}.txt"
+    if not wait_for_file(pmc_file, wait_timeout):
+        print(f"Error: {pmc_file} not generated.")
+        return {}
 
-    for i in range(1, repeat + 1):
-        print(f"\n[Run {i}/{repeat}] Running: hipprof --pmc {run_cmd}")
-        cmd = f"hipprof --pmc {run_cmd}"
-        process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-        output, _ = process.communicate()
-
-        # Extract process id
-        match = re.search(r"HIP_PROF:process id '(\d+)'", output)
-        if not match:
-            print("Error: process id not found, skipping this run.")
-            print(output)
-            continue
-        pid = match.group(1)
+    markers = parse_markers("".join(result.kept))
+    results = {}
+    for _, shape, _ in markers:
+        results.setdefault(shape, {k: [None] * repeat for k in kernel_names})
+
+    matcher = KernelMatcher(kernel_names)
+    # counter writes happen inside this pass, so "parse" includes them in batch mode
+    with span("parse"):
+        records = iter_records(pmc_file, counters=counter_writer is not None)
+        for phase, shape, rep, record in split_by_markers(records, markers, MARKER_PATTERNS):
+            if phase != "run":
+                continue
+            if counter_writer is not None:
+                counter_writer.add(record, shape, rep, pid)
+            if record.time is None:
+                continue
+            for kernel_pattern in matcher.match(record.name):
+                if results[shape][kernel_pattern][rep] is None:
+                    results[shape][kernel_pattern][rep] = record.time
+    for shape, per_kernel in results.items():
+        harnessProfile.kernel_time(sum(t for values in per_kernel.values() for t in values if t is not None), shape)
+
+    with span("archive"):
+        archive = TraceArchive()
+        archive.add(pmc_file, run_id=pid)
+        archive.close()
+
+    if output_csv:
+        with span("csv"), open(output_csv, "w", newline="") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["M", "K", "N", "Run"] + kernel_names)
+            for (M, K, N), per_kernel in results.items():
+                for i in range(repeat):
+                    row = [M, K, N, i + 1]
+                    for k in kernel_names:
+                        val = per_kernel[k][i]
+                        row.append(val if val is not None else "N/A")
+                    writer.writerow(row)
+                avg_row = [M, K, N, "Average"]
+                for k in kernel_names:
+                    avg = trimmed_mean(per_kernel[k])
+                    avg_row.append(avg if avg is not None else "N/A")
+                writer.writerow(avg_row)
+
+        print(f"\nAll batch results saved to: {output_csv}")
+    return results
+
+# === Timing backends ===
+# A backend measures one shape per run_once() call and returns
+# {kernel pattern: seconds or None}. hipprof profiles an external benchmark
+# process; the others time the ops of the bench script in this process. Bench
+# scripts expose make_inputs(M, K, N, device, variant) and OPS = {kernel
+# pattern: op}, the pattern naming the kernel each op is expected to launch.
+# options["variant"] (a gemmVariant.GemmVariant) selects the dtype and layout;
+# an op that raises NotImplementedError for it is reported as None.
+
+def bench_script(bench_cmd):
+    """The .py file of a benchmark command such as 'python benchGemm.py'."""
+    for token in bench_cmd.split():
+        if token.endswith(".py"):
+            return token
+    raise ValueError(f"no python script in benchmark command: {bench_cmd}")
+
+class HipprofBackend:
+    name = "hipprof"
+
+    def __init__(self, options):
+        self.bench_cmd = options["bench_cmd"]
+        self.patterns = options["patterns"]
+        self.matcher = KernelMatcher(self.patterns, options.get("ignore_case", ()))
+        self.pick = min if options.get("pick", "first") == "min" else (lambda values: values[0])
+        self.profiler = options.get("profiler", "hipprof --pmc")
+        self.temp_dir = options.get("temp_dir", "temp")
+        self.wait_timeout = options.get("wait_timeout", PMC_WAIT_TIMEOUT)
+        self.run_timeout = options.get("run_timeout", RUN_TIMEOUT)
+        self.retries = options.get("retries", RUN_RETRIES)
+        self.variant = options.get("variant")
+        self.archive = TraceArchive(os.path.join(self.temp_dir, "traces"))
+        self.runs = {}
+        # options["counters"]: extra counters for the profiler; options["counter_store"]: where to keep them
+        self.profiler_argv = profiler_argv(self.profiler, options.get("counters"), self.temp_dir)
+        self.counter_writer = None
+        if options.get("counter_store"):
+            tags = {"dtype": self.variant.dtype, "layout": layout_tag(self.variant)} if self.variant else None
+            self.counter_writer = CounterWriter(options["counter_store"], tags)
+
+    def run_once(self, shape):
+        m, k, n = shape
+        failed = {p: None for p in self.patterns}
+        run_cmd = to_argv(self.bench_cmd) + [str(m), str(k), str(n)]
+        if self.variant is not None:
+            run_cmd += variant_argv(self.variant)
+        pid, _ = launch_hipprof(run_cmd, self.profiler_argv, self.run_timeout, self.retries)
+        if pid is None:
+            print(f"[WARN] M={m} K={k} N={n}: process id not found")
+            return failed
         pmc_file = f"pmc_results_{pid}.txt"
+        if not wait_for_file(pmc_file, self.wait_timeout):
+            print(f"[WARN] M={m} K={k} N={n}: {pmc_file} not generated")
+            return failed
+        with span("parse"):
+            times = {p: self.pick(values) if values else None
+                     for p, values in collect_kernel_times(pmc_file, self.matcher).items()}
+        self.runs[shape] = self.runs.get(shape, 0) + 1
+        if self.counter_writer is not None:
+            with span("counters"):
+                self.counter_writer.add_records(iter_records(pmc_file), shape, self.runs[shape], pid)
+        with span("archive"):
+            self.archive.add(pmc_file, shape, repeat=self.runs[shape], run_id=pid)
+        return times
 
-        # Wait for pmc file to appear
-        for _ in range(30):
-            if os.path.exists(pmc_file):
-                break
-            time.sleep(0.5)
-        else:
-            print(f"Error: {pmc_file} not generated, skipping.")
-            continue
+    def release(self, shape):
+        """Nothing is kept per shape: every run starts a new benchmark process."""
+
+    def close(self):
+        if self.counter_writer is not None:
+            self.counter_writer.close()
+        self.archive.close()
+
+class InProcessBackend:
+    """Base for backends that run the bench script's OPS in this process."""
+
+    def __init__(self, options):
+        import importlib.util
+        import torch
 
-        # Parse pmc file
-        with open(pmc_file, "r") as f:
-            text = f.read()
-
-        for kernel_pattern in kernel_names:
-            # Support wildcard "*" → regex ".*"
-            regex_pattern = re.escape(kernel_pattern).replace(r'\*', '.*')
-            pattern = rf'kernel-name:"{regex_pattern}".*?kernel time\s+([\d.]+)\(s\)'
-            matches = re.findall(pattern, text, re.S)
-
-            if len(matches) == 1:
-                kernel_time = float(matches[0])
-                all_results[kernel_pattern].append(kernel_time)
-                print(f"[OK] {kernel_pattern} run {i}: {kernel_time:.6f}s")
-            elif len(matches) > 1:
-                print(f"[WARN] Multiple matches for {kernel_pattern}, using first one.")
-                kernel_time = float(matches[0])
-                all_results[kernel_pattern].append(kernel_time)
+        self.torch = torch
+        path = bench_script(options["bench_cmd"])
+        spec = importlib.util.spec_from_file_location("bench_ops", path)
+        self.bench = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.bench)
+        self.patterns = options["patterns"]
+        self.ops = {p: self.bench.OPS.get(p) for p in self.patterns}
+        self.active = dict(self.ops)
+        self.variant = options.get("variant")
+        # options["order"] == "random" also shuffles the op order of every run (see stability.py)
+        self.rng = random.Random(options.get("seed")) if options.get("order") == "random" else None
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        # {shape: (inputs, active ops)} of the shapes in flight: an interleaved window
+        # (see stability.measure_window) plus the drift sentinel, least recently used first
+        self._cache = OrderedDict()
+        self.cache_shapes = max(1, options.get("window", 1)) + (1 if options.get("sentinel") else 0)
+
+    def inputs(self, shape):
+        """Inputs for `shape`, created once while it is cached; creating them also
+        warms every op up. Sets self.active to the ops that support the variant."""
+        hit = self._cache.get(shape)
+        if hit is None:
+            if self.variant is None:
+                inputs = self.bench.make_inputs(*shape, self.device)
             else:
-                print(f"[WARN] kernel {kernel_pattern} not found in pmc file.")
-                all_results[kernel_pattern].append(None)
+                inputs = self.bench.make_inputs(*shape, self.device, self.variant)
+            active = {}
+            for p, op in self.ops.items():
+                try:
+                    if op is not None:
+                        op(*inputs)
+                    active[p] = op
+                except NotImplementedError:
+                    active[p] = None
+            self.synchronize()
+            hit = self._cache[shape] = (inputs, active)
+            while len(self._cache) > self.cache_shapes:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(shape)
+        inputs, self.active = hit
+        return inputs
+
+    def release(self, shape):
+        """Drop the cached inputs of a shape that is done."""
+        self._cache.pop(shape, None)
+
+    def active_ops(self):
+        """(pattern, op or None) pairs of this run, shuffled under the random order."""
+        ops = list(self.active.items())
+        if self.rng is not None:
+            self.rng.shuffle(ops)
+        return ops
 
-        # Move pmc file to temp/
-        dst_file = os.path.join("temp", f"pmc_results_{pid}.txt")
-        shutil.move(pmc_file, dst_file)
-        time.sleep(1)
+    def synchronize(self):
+        if self.device == 'cuda':
+            self.torch.cuda.synchronize()
 
-    # Write results to CSV
-    with open(output_csv, "w", newline="") as csvfile:
+    def close(self):
+        pass
+
+class EventBackend(InProcessBackend):
+    """Device time of each op between two recorded device events."""
+    name = "event"
+
+    def __init__(self, options):
+        super().__init__(options)
+        if self.device != 'cuda':
+            print("Error: the event backend needs a GPU; use --backend cpu instead.")
+            sys.exit(1)
+
+    def run_once(self, shape):
+        inputs = self.inputs(shape)
+        times = {}
+        for p, op in self.active_ops():
+            if op is None:
+                times[p] = None
+                continue
+            start = self.torch.cuda.Event(enable_timing=True)
+            end = self.torch.cuda.Event(enable_timing=True)
+            start.record()
+            op(*inputs)
+            end.record()
+            end.synchronize()
+            times[p] = start.elapsed_time(end) / 1e3
+        return times
+
+class TorchProfilerBackend(InProcessBackend):
+    """Per-kernel device durations from torch.profiler, matched by kernel name."""
+    name = "torch-profiler"
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.matcher = KernelMatcher(self.patterns, options.get("ignore_case", ()))
+        self.pick = min if options.get("pick", "first") == "min" else (lambda values: values[0])
+
+    def run_once(self, shape):
+        from torch.profiler import ProfilerActivity, profile
+
+        inputs = self.inputs(shape)
+        with profile(activities=[ProfilerActivity.CPU, ProfilerActivity.CUDA]) as prof:
+            for _, op in self.active_ops():
+                if op is not None:
+                    op(*inputs)
+            self.synchronize()
+
+        found = {p: [] for p in self.patterns}
+        for evt in prof.events():
+            if evt.device_type != self.torch.autograd.DeviceType.CUDA:
+                continue
+            for p in self.matcher.match(evt.name):
+                found[p].append(evt.time_range.elapsed_us() / 1e6)
+        return {p: self.pick(values) if values else None for p, values in found.items()}
+
+class WallClockBackend(InProcessBackend):
+    """Host wall-clock time of each op (synchronized on GPU); works without a GPU."""
+    name = "cpu"
+
+    def run_once(self, shape):
+        inputs = self.inputs(shape)
+        times = {}
+        for p, op in self.active_ops():
+            if op is None:
+                times[p] = None
+                continue
+            self.synchronize()
+            start = time.perf_counter()
+            op(*inputs)
+            self.synchronize()
+            times[p] = time.perf_counter() - start
+        return times
+
+BACKENDS = {b.name: b for b in (HipprofBackend, EventBackend, TorchProfilerBackend, WallClockBackend)}
+
+def make_backend(options):
+    """Backend named by options["backend"] (default hipprof)."""
+    with span("backend setup"):
+        return BACKENDS[options.get("backend", "hipprof")](options)
+
+def measure(backend, shape, min_repeat=MIN_RUNS, max_repeat=MAX_RUNS, rel_ci=REL_CI, max_cv=None):
+    """Run backend.run_once until every pattern is stable; return {pattern: [time, ...]}.
+
+    Failed runs count towards max_repeat but are left out of the result.
+    """
+    times = {p: [] for p in backend.patterns}
+    while not all(enough_samples(v, min_repeat, max_repeat, rel_ci, max_cv) for v in times.values()):
+        for p, t in profiled_run(backend, shape).items():
+            times[p].append(t)
+    return {p: [v for v in values if v is not None] for p, values in times.items()}
+
+# Result of run_hipprof: per-run samples (None = no match) and per-kernel summaries
+KernelTimeResult = namedtuple("KernelTimeResult", ["kernels", "samples", "summary", "runs"])
+
+def default_csv_path(prefix="hipprof_results"):
+    """Timestamped CSV name; microseconds and pid keep back-to-back runs apart."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return f"{prefix}_{timestamp}_{os.getpid()}.csv"
+
+def run_hipprof(run_cmd, kernel_list, min_repeat=MIN_RUNS, max_repeat=MAX_RUNS, rel_ci=REL_CI,
+                max_cv=None, wait_timeout=PMC_WAIT_TIMEOUT, profiler="hipprof --pmc",
+                run_timeout=RUN_TIMEOUT, retries=RUN_RETRIES, output_csv=None, shape=None,
+                counters=(), counter_writer=None):
+    """Profile run_cmd until every kernel's median is stable (see sampleStats).
+
+    kernel_list is a kernel list file or a list of patterns. Set
+    min_repeat == max_repeat for a fixed number of runs. Returns a
+    KernelTimeResult; the CSV is only written when output_csv is given.
+    Raw traces go to the trace archive, indexed by `shape` when given.
+    The profiler also collects `counters`; every launch of every run is
+    added to counter_writer when one is given.
+    """
+    kernel_names = list(kernel_list) if isinstance(kernel_list, (list, tuple)) else read_kernel_list(kernel_list)
+    if not kernel_names:
+        raise ValueError("kernel list is empty")
+
+    archive = TraceArchive()
+    all_results = {k: [] for k in kernel_names}
+    matcher = KernelMatcher(kernel_names)
+
+    def stable():
+        return all(enough_samples(all_results[k], min_repeat, max_repeat, rel_ci, max_cv) for k in kernel_names)
+
+    i = 0
+    while not stable():
+        i += 1
+        print(f"\n[Run {i}/{max_repeat}] Running: {profiler} {run_cmd}")
+        with span("run", shape):
+            pid, result = launch_hipprof(run_cmd, profiler_argv(profiler, counters), run_timeout, retries)
+            if pid is None:
+                print("Error: process id not found, skipping this run.")
+                print("".join(result.tail))
+                for k in kernel_names:
+                    all_results[k].append(None)
+                continue
+            pmc_file = f"pmc_results_{pid}.txt"
+
+            # Wait for pmc file to be finalized
+            if not wait_for_file(pmc_file, wait_timeout):
+                print(f"Error: {pmc_file} not generated, skipping.")
+                for k in kernel_names:
+                    all_results[k].append(None)
+                continue
+
+            # Parse pmc file (single streaming pass for all patterns)
+            with span("parse"):
+                kernel_times = collect_kernel_times(pmc_file, matcher)
+
+            for kernel_pattern in kernel_names:
+                matches = kernel_times[kernel_pattern]
+
+                if len(matches) == 1:
+                    kernel_time = matches[0]
+                    all_results[kernel_pattern].append(kernel_time)
+                    print(f"[OK] {kernel_pattern} run {i}: {kernel_time:.6f}s")
+                elif len(matches) > 1:
+                    print(f"[WARN] Multiple matches for {kernel_pattern}, using first one.")
+                    kernel_time = matches[0]
+                    all_results[kernel_pattern].append(kernel_time)
+                else:
+                    print(f"[WARN] kernel {kernel_pattern} not found in pmc file.")
+                    all_results[kernel_pattern].append(None)
+
+            harnessProfile.kernel_time(sum(all_results[k][-1] for k in kernel_names if all_results[k][-1] is not None))
+            if counter_writer is not None:
+                with span("counters"):
+                    counter_writer.add_records(iter_records(pmc_file), shape, i, pid)
+            with span("archive"):
+                archive.add(pmc_file, shape, repeat=i, run_id=pid)
+    archive.close()
+
+    summary = {}
+    for k in kernel_names:
+        summary[k] = summarize(all_results[k])
+        summary[k]["trimmed_mean"] = trimmed_mean(all_results[k])
+        if summary[k]["trimmed_mean"] is not None:
+            print(f"[AVG] {k}: average (trimmed) = {summary[k]['trimmed_mean']:.6f}s")
+        if summary[k]["n"]:
+            print(f"[MEDIAN] {k}: {summary[k]['median']:.6f}s "
+                  f"(CI95 {summary[k]['ci_low']:.6f}-{summary[k]['ci_high']:.6f}, n={summary[k]['n']})")
+
+    res = KernelTimeResult(kernel_names, all_results, summary, i)
+    if output_csv:
+        write_results_csv(res, output_csv)
+        print(f"\nAll results saved to: {output_csv}")
+    return res
+
+def write_results_csv(res, output_csv):
+    """Write a KernelTimeResult in the per-run + summary layout of getKernelTime.py."""
+    kernel_names = res.kernels
+    with span("csv"), open(output_csv, "w", newline="") as csvfile:
         writer = csv.writer(csvfile)
         header = ["Run"] + kernel_names
         writer.writerow(header)
 
         # Per-run results
-        for i in range(repeat):
+        for i in range(res.runs):
             row = [i + 1]
             for k in kernel_names:
-                val = all_results[k][i] if i < len(all_results[k]) else None
+                val = res.samples[k][i] if i < len(res.samples[k]) else None
                 row.append(val if val is not None else "N/A")
             writer.writerow(row)
 
@@ -95,26 +551,34 @@ def run_hipprof(run_cmd, kernel_list_file, repeat=10):
         writer.writerow(["Average (no max/min)"])
         avg_row = ["Average"]
         for k in kernel_names:
-            valid = [v for v in all_results[k] if v is not None]
-            if len(valid) >= 3:
-                valid.sort()
-                trimmed = valid[1:-1]
-                avg = sum(trimmed) / len(trimmed)
-                avg_row.append(avg)
-                print(f"[AVG] {k}: average (trimmed) = {avg:.6f}s")
-            else:
-                avg_row.append("N/A")
+            avg = res.summary[k]["trimmed_mean"]
+            avg_row.append(avg if avg is not None else "N/A")
         writer.writerow(avg_row)
 
-    print(f"\nAll results saved to: {output_csv}")
+        # Robust summary: median, IQR, 95% CI of the median, sample count
+        for field, label in [("median", "Median"), ("iqr", "IQR"), ("ci_low", "CI95_low"),
+                             ("ci_high", "CI95_high"), ("n", "Samples")]:
+            writer.writerow([label] + [res.summary[k][field] if res.summary[k][field] is not None else "N/A"
+                                       for k in kernel_names])
 
 
 if __name__ == "__main__":
+    # HARNESS_PROFILE=<dir> profiles the harness itself (see harnessProfile.py)
+    if len(sys.argv) == 4 and sys.argv[1] == "--batch":
+        with harnessProfile.session():
+            run_hipprof_batch(sys.argv[2], sys.argv[3], output_csv=default_csv_path("hipprof_batch_results"))
+        sys.exit(0)
+
     if len(sys.argv) != 3:
         print("Usage: python getKernelTime.py '<run_cmd>' <kernel_list.txt>")
+        print("       python getKernelTime.py --batch <shapes.txt> <kernel_list.txt>")
         print("Example: python getKernelTime.py 'python test.py' kernel_list.txt")
         sys.exit(1)
 
     run_cmd = sys.argv[1]
     kernel_list_file = sys.argv[2]
-    run_hipprof(run_cmd, kernel_list_file)
+    if not read_kernel_list(kernel_list_file):
+        print("Error: kernel list file is empty or not found.")
+        sys.exit(1)
+    with harnessProfile.session():
+        run_hipprof(run_cmd, kernel_list_file, output_csv=default_csv_path())
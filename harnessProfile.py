@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""Self-profiling of the sweep harness: where does a sweep's wall clock go?
+
+Set HARNESS_PROFILE to a directory (or pass --harness-profile to run.py,
+sweepScheduler.py or autoPerf.py) and the orchestration code records a
+timed span for every phase it goes through:
+
+- python startup: interpreter start until this module is imported
+- run: one measured run of a shape (sentinel: a drift-sentinel run)
+- launch: the profiled benchmark process, from spawn to exit. The bench
+  scripts import this module before torch, so the benchmark process
+  reports its own python startup, torch import, inputs and ops; the rest
+  of the launch is the profiler's overhead.
+- wait: waiting for the pmc file, with the polling sleeps inside it
+- parse: regex parsing of the pmc file
+- counters, archive, store, csv: counter store, trace archive, result
+  store and CSV writes
+
+The variable is inherited, so sweep workers and benchmark processes record
+too; each process appends its spans to its own JSON-lines file in the
+directory. A span belongs to the shape of the run it is part of, and every
+run also records the kernel time it measured.
+
+report() merges the files into trace.json (Chrome trace event format, open
+it in chrome://tracing or ui.perfetto.dev), writes the per-shape breakdown
+to phases.csv and prints the per-sweep summary table (also kept in
+summary.txt): every phase nested under the phase it ran in, with its self
+time as a separate line, and the ratio of measured kernel time to harness
+time.
+
+    python harnessProfile.py temp/harness_profile
+"""
+import argparse
+import atexit
+import csv
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ENV_VAR = "HARNESS_PROFILE"
+SPAN_FILE_PREFIX = "spans-"
+TRACE_FILE = "trace.json"
+PHASES_FILE = "phases.csv"
+SUMMARY_FILE = "summary.txt"
+
+# Name of the self-time line of a phase that has nested phases
+SELF_LABELS = {"launch": "(profiler overhead)", "process": "(bench other)"}
+
+_local = threading.local()
+_lock = threading.Lock()
+_sink = None
+_startup_done = False
+_session = None
+_ran_session = False
+
+
+def _now_us():
+    return time.time_ns() / 1000.0
+
+
+def _process_start_us():
+    """Wall-clock start of this process in microseconds (Linux), else the import time."""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - started
+        return (time.time() - age) * 1e6
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _IMPORTED_US
+
+
+_IMPORTED_US = _now_us()
+_STARTED_US = min(_process_start_us(), _IMPORTED_US)
+
+
+def profile_dir():
+    return os.environ.get(ENV_VAR) or None
+
+
+def enabled():
+    return bool(os.environ.get(ENV_VAR))
+
+
+def _reset_after_fork():
+    global _lock, _sink
+    _lock = threading.Lock()
+    _sink = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _write(event):
+    """Append one trace event to this process's span file (opened on first use)."""
+    global _sink
+    directory = profile_dir()
+    if not directory:
+        return
+    pid = os.getpid()
+    with _lock:
+        if _sink is None:
+            os.makedirs(directory, exist_ok=True)
+            _sink = open(os.path.join(directory, f"{SPAN_FILE_PREFIX}{pid}.jsonl"), "a")
+            name = f"{os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else 'python'} ({pid})"
+            _sink.write(json.dumps({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}}) + "\n")
+        _sink.write(json.dumps(event) + "\n")
+        _sink.flush()
+
+
+def current_shape():
+    return getattr(_local, "shape", None)
+
+
+def _emit(name, start, end, shape, args):
+    args = dict(args)
+    if shape is not None:
+        args["shape"] = list(shape)
+    _write({"name": name, "ph": "X", "ts": start, "dur": max(0.0, end - start), "pid": os.getpid(),
+            "tid": threading.get_native_id(), "args": args})
+
+
+@contextmanager
+def span(name, shape=None, **args):
+    """Record the enclosed block as phase `name`; yields a dict for args known only at the end.
+
+    Nested spans without a shape inherit the shape of the enclosing one.
+    Does nothing unless profiling is enabled.
+    """
+    if not enabled():
+        yield {}
+        return
+    outer = current_shape()
+    if shape is not None:
+        _local.shape = tuple(shape)
+    start = _now_us()
+    try:
+        yield args
+    finally:
+        _emit(name, start, _now_us(), current_shape(), args)
+        _local.shape = outer
+
+
+def kernel_time(seconds, shape=None):
+    """Record kernel time measured by a run (the Chrome trace plots it as a counter)."""
+    if not enabled() or not seconds:
+        return
+    shape = shape if shape is not None else current_shape()
+    args = {"seconds": seconds}
+    if shape is not None:
+        args["shape"] = list(shape)
+    _write({"name": "kernel time", "ph": "C", "ts": _now_us(), "pid": os.getpid(), "args": args})
+
+
+def profiled_run(backend, shape, name="run"):
+    """backend.run_once(shape) as a `name` span, recording the kernel time it measured."""
+    with span(name, shape):
+        times = backend.run_once(shape)
+        kernel_time(sum(t for t in times.values() if t is not None), shape)
+    return times
+
+
+def _record_exit():
+    # a session's process is covered by its session span
+    if not _ran_session:
+        _emit("process", _STARTED_US, _now_us(), None, {})
+
+
+def _record_startup():
+    """Record this process's startup once, and its whole lifetime at exit."""
+    global _startup_done
+    if _startup_done or not enabled():
+        return
+    _startup_done = True
+    _emit("python startup", _STARTED_US, _IMPORTED_US, None, {})
+    atexit.register(_record_exit)
+
+
+_record_startup()
+
+
+# === Sessions ===
+def start(directory=None, name="sweep"):
+    """Start profiling a sweep into `directory` (default: $HARNESS_PROFILE); False when disabled.
+
+    Span files of earlier sessions in the directory are removed. Sets
+    HARNESS_PROFILE, so processes started from here on record too. The
+    session span starts with the process, so it covers the startup as well.
+    """
+    global _session, _ran_session
+    directory = directory or profile_dir()
+    if not directory:
+        return False
+    os.environ[ENV_VAR] = directory
+    os.makedirs(directory, exist_ok=True)
+    own = os.path.join(directory, f"{SPAN_FILE_PREFIX}{os.getpid()}.jsonl")
+    for path in glob.glob(os.path.join(directory, f"{SPAN_FILE_PREFIX}*.jsonl")):
+        if path != own:
+            os.remove(path)
+    _record_startup()
+    _session = (name, _STARTED_US)
+    _ran_session = True
+    return True
+
+
+def stop():
+    """End the session started by start() and write its report."""
+    global _session
+    if _session is None:
+        return
+    name, started = _session
+    _session = None
+    _emit(name, started, _now_us(), None, {})
+    report(profile_dir())
+
+
+@contextmanager
+def session(directory=None, name="sweep"):
+    """Profile the enclosed sweep when `directory` or HARNESS_PROFILE is set (see start/stop)."""
+    started = start(directory, name)
+    try:
+        yield
+    finally:
+        if started:
+            stop()
+
+
+# === Report ===
+def load_events(directory):
+    events = []
+    for path in sorted(glob.glob(os.path.join(directory, f"{SPAN_FILE_PREFIX}*.jsonl"))):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        events.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass  # a line cut short by a killed process
+    return events
+
+
+def write_trace(events, path):
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def build_tree(spans):
+    """Nest spans by time containment within each thread; return the root spans.
+
+    Each span gets "children" and an inherited "shape". The root spans of
+    a benchmark process are moved under the launch span whose pid they ran
+    in, so the launch's self time is what the profiler added.
+    """
+    for s in spans:
+        s["children"] = []
+    roots = []
+    by_thread = {}
+    for s in spans:
+        by_thread.setdefault((s["pid"], s["tid"]), []).append(s)
+    for thread_spans in by_thread.values():
+        thread_spans.sort(key=lambda s: (s["ts"], -s["dur"]))
+        stack = []
+        for s in thread_spans:
+            while stack and s["ts"] >= stack[-1]["ts"] + stack[-1]["dur"]:
+                stack.pop()
+            if stack and s["ts"] + s["dur"] <= stack[-1]["ts"] + stack[-1]["dur"] + 1:
+                stack[-1]["children"].append(s)
+            else:
+                roots.append(s)
+            stack.append(s)
+
+    launches = {str(s["args"]["pid"]): s for s in spans if s["name"] == "launch" and s["args"].get("pid")}
+    linked = []
+    for s in roots:
+        launch = launches.get(str(s["pid"]))
+        if launch is not None and launch["pid"] != s["pid"]:
+            launch["children"].append(s)
+            linked.append(s)
+    roots = [s for s in roots if not any(s is l for l in linked)]
+
+    def inherit(s, shape):
+        shape = tuple(s["args"]["shape"]) if "shape" in s["args"] else shape
+        s["shape"] = shape
+        for c in s["children"]:
+            inherit(c, shape)
+    for s in roots:
+        inherit(s, None)
+    return roots
+
+
+def self_time(s):
+    return max(0.0, s["dur"] - sum(c["dur"] for c in s["children"]))
+
+
+def aggregate(roots):
+    """{path: [count, total_us, self_us]} over the span tree; path is a tuple of phase names."""
+    stats = {}
+
+    def walk(s, prefix):
+        path = prefix + (s["name"],)
+        row = stats.setdefault(path, [0, 0.0, 0.0])
+        row[0] += 1
+        row[1] += s["dur"]
+        row[2] += self_time(s)
+        for c in s["children"]:
+            walk(c, path)
+    for s in roots:
+        walk(s, ())
+    return stats
+
+
+def per_shape(roots, kernel_events):
+    """{shape: {phase: self seconds}} plus {shape: (runs, kernel seconds)}."""
+    phases = {}
+
+    def walk(s):
+        if s["shape"] is not None:
+            row = phases.setdefault(s["shape"], {})
+            name = SELF_LABELS.get(s["name"], s["name"]).strip("()") if s["children"] else s["name"]
+            row[name] = row.get(name, 0.0) + self_time(s) / 1e6
+        for c in s["children"]:
+            walk(c)
+    for s in roots:
+        walk(s)
+    kernel = {}
+    for e in kernel_events:
+        if "shape" in e["args"]:
+            runs, seconds = kernel.get(tuple(e["args"]["shape"]), (0, 0.0))
+            kernel[tuple(e["args"]["shape"])] = (runs + 1, seconds + e["args"]["seconds"])
+    return phases, kernel
+
+
+def summary_lines(stats, kernel_seconds, sweep_seconds, lanes, session_names=("sweep",)):
+    lines = [f"{'phase':<44} {'count':>7} {'total(s)':>10} {'mean(ms)':>10} {'share':>7}"]
+
+    def emit(path, depth, basis):
+        count, total, own = stats[path]
+        lines.append(f"{'  ' * depth + path[-1]:<44} {count:>7} {total / 1e6:>10.3f} "
+                     f"{total / count / 1e3:>10.3f} {total / basis:>7.1%}")
+        children = sorted((p for p in stats if len(p) == len(path) + 1 and p[:-1] == path),
+                          key=lambda p: -stats[p][1])
+        for child in children:
+            emit(child, depth + 1, basis)
+        if children and own > 0:
+            label = SELF_LABELS.get(path[-1], "(self)")
+            lines.append(f"{'  ' * (depth + 1) + label:<44} {'':>7} {own / 1e6:>10.3f} {'':>10} {own / basis:>7.1%}")
+
+    for root in sorted((p for p in stats if len(p) == 1), key=lambda p: (p[0] not in session_names, -stats[p][1])):
+        emit(root, 0, stats[root][1] or 1.0)
+
+    lines.append("")
+    lines.append(f"kernel time: {kernel_seconds:.6f}s")
+    if sweep_seconds:
+        harness = sweep_seconds * lanes
+        lines.append(f"sweep wall clock: {sweep_seconds:.3f}s" + (f" x {lanes} workers" if lanes > 1 else ""))
+        lines.append(f"kernel / harness time: {kernel_seconds / harness:.2%} "
+                     f"({harness - kernel_seconds:.3f}s outside measured kernels)")
+    return lines
+
+
+def report(directory, session_names=("sweep",)):
+    """Merge the span files in `directory`; write trace.json, phases.csv and summary.txt."""
+    events = load_events(directory)
+    write_trace(events, os.path.join(directory, TRACE_FILE))
+    spans = [e for e in events if e.get("ph") == "X"]
+    kernel_events = [e for e in events if e.get("ph") == "C" and e.get("name") == "kernel time"]
+    roots = build_tree(spans)
+    stats = aggregate(roots)
+    kernel_seconds = sum(e["args"]["seconds"] for e in kernel_events)
+    sweep_seconds = sum(s["dur"] for s in roots if s["name"] in session_names) / 1e6
+    lanes = max(1, sum(1 for s in roots if s["name"] == "worker"))
+
+    phases, kernel = per_shape(roots, kernel_events)
+    columns = sorted({name for row in phases.values() for name in row},
+                     key=lambda name: -sum(row.get(name, 0.0) for row in phases.values()))
+    with open(os.path.join(directory, PHASES_FILE), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["M", "K", "N", "Runs", "KernelTime(s)", "HarnessTime(s)", "KernelRatio"]
+                        + [f"{name}(s)" for name in columns])
+        for shape in sorted(phases):
+            runs, seconds = kernel.get(shape, (0, 0.0))
+            harness = sum(phases[shape].values())
+            writer.writerow(list(shape) + [runs, seconds, harness, seconds / harness if harness else "N/A"]
+                            + [phases[shape].get(name, 0.0) for name in columns])
+
+    lines = summary_lines(stats, kernel_seconds, sweep_seconds, lanes, session_names)
+    with open(os.path.join(directory, SUMMARY_FILE), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n" + "\n".join(lines))
+    print(f"\nHarness profile: {os.path.join(directory, TRACE_FILE)} (chrome://tracing, ui.perfetto.dev), "
+          f"per-shape phases in {os.path.join(directory, PHASES_FILE)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report a harness profile written with HARNESS_PROFILE.")
+    parser.add_argument("directory", nargs="?", default=profile_dir(), help="profile directory")
+    args = parser.parse_args(argv)
+    if not args.directory or not glob.glob(os.path.join(args.directory, f"{SPAN_FILE_PREFIX}*.jsonl")):
+        print("Error: no span files found.")
+        sys.exit(1)
+    report(args.directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Deterministic, memory-mapped benchmark inputs.
+
+Every input is a prefix of a seeded random stream that is generated once
+per (name, dtype, seed) and saved under temp/inputs/. The A of an M x K
+GEMM is the first M*K elements of stream "A" viewed as M x K, and B is
+the same for stream "B". Later runs map the file with torch.from_file,
+which is zero-copy on the CPU and a single host-to-device copy otherwise.
+
+The stream is generated in fixed-size blocks, and each block is seeded
+from (name, seed, block index). Growing a stream for a larger shape
+therefore never changes the data that smaller shapes already use. The
+benchmark scripts, the in-process timing backends and autoVerify.py all
+see identical inputs for a given shape, dtype and seed.
+"""
+import os
+import sys
+import zlib
+
+import torch
+
+DEFAULT_ROOT = os.environ.get("GEMM_INPUT_STORE", os.path.join("temp", "inputs"))
+DEFAULT_SEED = 0
+BLOCK = 1 << 20
+
+# Integer streams: normal samples scaled and clamped to the int8 range
+INT_SCALE = 32.0
+
+
+def dtype_name(dtype):
+    return str(dtype).replace("torch.", "")
+
+
+def _block(name, seed, index, dtype):
+    gen = torch.Generator().manual_seed(zlib.crc32(f"{name}:{seed}:{index}".encode()))
+    values = torch.randn(BLOCK, generator=gen, dtype=torch.float32)
+    if not dtype.is_floating_point:
+        info = torch.iinfo(dtype)
+        values = (values * INT_SCALE).round().clamp(max(info.min, -128), min(info.max, 127))
+    return values.to(dtype)
+
+
+def _bytes(tensor):
+    return tensor.reshape(-1).view(torch.uint8).numpy().tobytes()
+
+
+class InputStore:
+    """Seeded random streams under `root`, mapped into memory on demand."""
+
+    def __init__(self, root=DEFAULT_ROOT, seed=DEFAULT_SEED):
+        self.root = root
+        self.seed = seed
+        self._streams = {}
+
+    def path(self, name, dtype):
+        return os.path.join(self.root, f"{name}_{dtype_name(dtype)}_s{self.seed}.bin")
+
+    def _grow(self, name, dtype, numel):
+        """Extend the stream file to at least `numel` elements (whole blocks)."""
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(name, dtype)
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        have = os.path.getsize(path) // itemsize if os.path.exists(path) else 0
+        if have >= numel:
+            return
+        # write the grown copy under a private name, then swap it in atomically
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            if have:
+                with open(path, "rb") as old:
+                    f.write(old.read(have * itemsize))
+            for index in range(have // BLOCK, -(-numel // BLOCK)):
+                f.write(_bytes(_block(name, self.seed, index, dtype)))
+        os.replace(tmp, path)
+
+    def stream(self, name, dtype, numel):
+        """1-D tensor of at least `numel` elements, mapped from the stream file."""
+        key = (name, dtype)
+        cached = self._streams.get(key)
+        if cached is not None and cached.numel() >= numel:
+            return cached
+        self._grow(name, dtype, numel)
+        path = self.path(name, dtype)
+        size = os.path.getsize(path) // torch.empty((), dtype=dtype).element_size()
+        tensor = torch.from_file(path, shared=False, size=size, dtype=dtype)
+        self._streams[key] = tensor
+        return tensor
+
+    def tensor(self, name, shape, dtype, device="cpu"):
+        """Prefix of stream `name` viewed as `shape`; no copy when device is the CPU."""
+        numel = 1
+        for size in shape:
+            numel *= size
+        tensor = self.stream(name, dtype, numel)[:numel].view(*shape)
+        return tensor if str(device) == "cpu" else tensor.to(device)
+
+    def matrix(self, name, rows, cols, dtype, device="cpu"):
+        """rows x cols prefix of stream `name`."""
+        return self.tensor(name, (rows, cols), dtype, device)
+
+
+_default = None
+
+
+def default_store():
+    global _default
+    if _default is None:
+        _default = InputStore()
+    return _default
+
+
+def gemm_inputs(M, K, N, dtype, device, store=None):
+    """A (M x K) and B (K x N) from the input store."""
+    store = store or default_store()
+    return store.matrix("A", M, K, dtype, device), store.matrix("B", K, N, dtype, device)
+
+
+if __name__ == "__main__":
+    # Pre-generate the streams for a shape list: python inputStore.py shapes.txt [dtype]
+    from getKernelTime import read_shapes
+
+    if len(sys.argv) < 2:
+        print("Usage: python inputStore.py <shapes.txt|-> [float16|float32|bfloat16|int8]")
+        sys.exit(1)
+    shapes = read_shapes(sys.argv[1])
+    dtype = getattr(torch, sys.argv[2]) if len(sys.argv) > 2 else torch.float32
+    store = default_store()
+    store.stream("A", dtype, max(m * k for m, k, n in shapes))
+    store.stream("B", dtype, max(k * n for m, k, n in shapes))
+    for name in ("A", "B"):
+        path = store.path(name, dtype)
+        print(f"[OK] {path}: {os.path.getsize(path)} bytes")
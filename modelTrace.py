@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""Capture the GEMMs of a real PyTorch model and replay them, weighted by call count.
+
+capture runs a model under a TorchDispatchMode and records every GEMM it
+reaches at the dispatcher: mm, addmm, bmm, baddbmm and _int_mm. Linear
+and matmul arrive there as these ops, so they are recorded as well. For
+each call it keeps:
+- M, K, N and the batch count
+- the dtype
+- the strides of both operands, giving the transpose and leading-dimension
+  padding of a gemmVariant.GemmVariant
+- alpha/beta
+- the module the call was made from
+Identical calls are counted, and the counts are divided by the number of
+steps, so the trace describes one model step:
+
+    python modelTrace.py capture --model builtin:decoder --tokens 1 --dtype fp16
+    python modelTrace.py capture --model mypkg.models:build --steps 4 --device cuda
+
+--model names a function returning (model, inputs), where inputs is a
+tensor, a tuple of positional arguments or a dict of keyword arguments.
+builtin:decoder is a Llama-style decoder sized by --hidden, --heads, --ffn,
+--layers, --vocab, --tokens and --batch-size. With --device meta (the
+default for the builtin) no memory is allocated and nothing is computed.
+
+replay measures every traced shape/variant pair that is missing from the
+result store, using the sweep workers (see sweepScheduler.py). It then
+reports the time of one model step per kernel pattern, as the sum over
+traced calls of calls per step x median kernel time. It also picks the
+fastest pattern (backend) for every shape and reports the total of that
+per-shape choice:
+
+    python modelTrace.py replay model_trace.csv kernel_list.txt --bench "python benchGemm.py"
+
+The other drivers take a trace through a shape space line (see
+shapeSpace.py), e.g. `trace model_trace.csv dtype=fp16`.
+"""
+import argparse
+import csv
+import importlib
+import os
+import sys
+from collections import namedtuple
+
+try:
+    import torch
+    from torch.utils._python_dispatch import TorchDispatchMode
+except ImportError:
+    torch = None
+    TorchDispatchMode = object
+
+from gemmVariant import DTYPES, VARIANT_COLUMNS, GemmVariant, layout_tag
+
+DEFAULT_TRACE = "model_trace.csv"
+DEFAULT_REPORT = "model_replay.csv"
+TOP = 10
+
+TRACE_COLUMNS = ["M", "K", "N"] + VARIANT_COLUMNS + ["Op", "StrideA", "StrideB", "Calls", "PerStep", "Modules"]
+# Modules listed per trace row; the rest are counted
+MAX_MODULES = 3
+
+TraceRow = namedtuple("TraceRow", ["shape", "variant", "op", "stride_a", "stride_b", "calls", "per_step", "modules"])
+
+
+def require_torch():
+    if torch is None:
+        raise RuntimeError("model capture needs PyTorch (pip install torch)")
+
+
+def dtype_name(dtype):
+    names = {torch.float32: "fp32", torch.float16: "fp16", torch.bfloat16: "bf16", torch.int8: "int8"}
+    return names.get(dtype, str(dtype).replace("torch.", ""))
+
+
+def operand_layout(t, rows, cols):
+    """('N' or 'T', padding) of a rows x cols operand from its strides.
+
+    Row-major storage is N, column-major (a transposed view such as a
+    Linear weight) is T. The padding is the leading dimension minus the
+    stored row length. Other layouts are treated as dense N.
+    """
+    s_rows, s_cols = t.stride()[-2:]
+    if s_cols == 1 and (rows == 1 or s_rows >= cols):
+        return "N", s_rows - cols if rows > 1 else 0
+    if s_rows == 1 and (cols == 1 or s_cols >= rows):
+        return "T", s_cols - rows if cols > 1 else 0
+    return "N", 0
+
+
+# === Capture ===
+class GemmCapture(TorchDispatchMode):
+    """Count the GEMM calls made under this mode; see rows()."""
+
+    def __init__(self, module_names=None):
+        super().__init__()
+        require_torch()
+        aten = torch.ops.aten
+        # op -> (index of A, index of B, index of C or None)
+        self.ops = {aten.mm: (0, 1, None), aten.addmm: (1, 2, 0), aten.bmm: (0, 1, None),
+                    aten.baddbmm: (1, 2, 0), aten._int_mm: (0, 1, None)}
+        self.module_names = module_names or {}
+        self.module_stack = []
+        self.calls = {}
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        packet = func.overloadpacket
+        if packet in self.ops:
+            self.record(packet, args, kwargs)
+        return func(*args, **kwargs)
+
+    def record(self, packet, args, kwargs):
+        ia, ib, ic = self.ops[packet]
+        A, B = args[ia], args[ib]
+        m, k = A.shape[-2:]
+        n = B.shape[-1]
+        batch = A.shape[0] if A.dim() == 3 else 1
+        trans_a, pad_a = operand_layout(A, m, k)
+        trans_b, pad_b = operand_layout(B, k, n)
+        alpha, beta = 1.0, 0.0
+        if ic is not None:
+            beta = float(kwargs.get("beta", args[3] if len(args) > 3 else 1.0))
+            alpha = float(kwargs.get("alpha", args[4] if len(args) > 4 else 1.0))
+        variant = GemmVariant(dtype_name(A.dtype), trans_a + trans_b, batch, max(pad_a, pad_b), alpha, beta)
+        key = ((m, k, n), variant, packet.__name__, tuple(A.stride()), tuple(B.stride()))
+        entry = self.calls.setdefault(key, [0, {}])
+        entry[0] += 1
+        module = self.module_stack[-1] if self.module_stack else ""
+        entry[1][module] = entry[1].get(module, 0) + 1
+
+    def hooks(self):
+        """Global module hooks that keep track of the module a GEMM is called from."""
+        def enter(module, inputs):
+            self.module_stack.append(self.module_names.get(id(module), type(module).__name__))
+
+        def leave(module, inputs, output):
+            if self.module_stack:
+                self.module_stack.pop()
+        return (torch.nn.modules.module.register_module_forward_pre_hook(enter),
+                torch.nn.modules.module.register_module_forward_hook(leave))
+
+    def rows(self, steps=1):
+        """TraceRows in call order of first appearance; per_step is calls / steps."""
+        rows = []
+        for (shape, variant, op, stride_a, stride_b), (calls, modules) in self.calls.items():
+            ranked = sorted(modules, key=lambda name: -modules[name])
+            rows.append(TraceRow(shape, variant, op, stride_a, stride_b, calls, calls / steps, ranked))
+        return rows
+
+
+def capture(model, inputs, steps=1):
+    """Run model(inputs) `steps` times under GemmCapture; return the TraceRows."""
+    require_torch()
+    names = {id(module): name or type(module).__name__ for name, module in model.named_modules()}
+    mode = GemmCapture(names)
+    handles = mode.hooks()
+    try:
+        with torch.no_grad(), mode:
+            for _ in range(steps):
+                if isinstance(inputs, dict):
+                    model(**inputs)
+                elif isinstance(inputs, (tuple, list)):
+                    model(*inputs)
+                else:
+                    model(inputs)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return mode.rows(steps)
+
+
+# === Built-in model ===
+def build_decoder(hidden=4096, heads=32, ffn=11008, layers=2, vocab=32000, tokens=1, batch_size=1,
+                  dtype="fp16", device="meta"):
+    """A Llama-style decoder (attention + gated MLP per layer, LM head) and its input embeddings."""
+    require_torch()
+    from torch import nn
+
+    class Attention(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.q_proj = nn.Linear(hidden, hidden, bias=False)
+            self.k_proj = nn.Linear(hidden, hidden, bias=False)
+            self.v_proj = nn.Linear(hidden, hidden, bias=False)
+            self.o_proj = nn.Linear(hidden, hidden, bias=False)
+
+        def forward(self, x):
+            b, t, _ = x.shape
+
+            def split(y):
+                return y.view(b, t, heads, hidden // heads).transpose(1, 2)
+            q, k, v = split(self.q_proj(x)), split(self.k_proj(x)), split(self.v_proj(x))
+            scores = torch.matmul(q, k.transpose(-1, -2)) / (hidden // heads) ** 0.5
+            out = torch.matmul(torch.softmax(scores, dim=-1), v)
+            return self.o_proj(out.transpose(1, 2).reshape(b, t, hidden))
+
+    class MLP(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.gate_proj = nn.Linear(hidden, ffn, bias=False)
+            self.up_proj = nn.Linear(hidden, ffn, bias=False)
+            self.down_proj = nn.Linear(ffn, hidden, bias=False)
+
+        def forward(self, x):
+            return self.down_proj(nn.functional.silu(self.gate_proj(x)) * self.up_proj(x))
+
+    class Layer(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.self_attn = Attention()
+            self.mlp = MLP()
+
+        def forward(self, x):
+            x = x + self.self_attn(x)
+            return x + self.mlp(x)
+
+    class Decoder(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.layers = nn.ModuleList(Layer() for _ in range(layers))
+            self.lm_head = nn.Linear(hidden, vocab, bias=False) if vocab else None
+
+        def forward(self, x):
+            for layer in self.layers:
+                x = layer(x)
+            return self.lm_head(x) if self.lm_head is not None else x
+
+    from gemmHarness import TORCH_DTYPES
+
+    with torch.device(device):
+        model = Decoder().to(TORCH_DTYPES[dtype])
+        x = torch.zeros(batch_size, tokens, hidden, dtype=TORCH_DTYPES[dtype])
+    return model.eval(), x
+
+
+def load_model(spec, args):
+    """(model, inputs) for 'builtin:decoder' or 'module:function'."""
+    module_name, _, attr = spec.partition(":")
+    if module_name == "builtin":
+        if attr != "decoder":
+            raise ValueError(f"unknown built-in model: {attr}")
+        return build_decoder(args.hidden, args.heads, args.ffn, args.layers, args.vocab, args.tokens,
+                             args.batch_size, args.dtype, args.device or "meta")
+    if not attr:
+        raise ValueError(f"expected module:function, got {spec}")
+    model, inputs = getattr(importlib.import_module(module_name), attr)()
+    if args.device:
+        model = model.to(args.device)
+        if isinstance(inputs, dict):
+            inputs = {k: v.to(args.device) if hasattr(v, "to") else v for k, v in inputs.items()}
+        elif isinstance(inputs, (tuple, list)):
+            inputs = tuple(v.to(args.device) if hasattr(v, "to") else v for v in inputs)
+        else:
+            inputs = inputs.to(args.device)
+    return model.eval(), inputs
+
+
+# === Trace files ===
+def _strides(text):
+    return tuple(int(x) for x in text.split("x")) if text else ()
+
+
+def write_trace(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(TRACE_COLUMNS)
+        for r in rows:
+            more = len(r.modules) - MAX_MODULES
+            modules = ";".join(r.modules[:MAX_MODULES]) + (f";+{more} more" if more > 0 else "")
+            writer.writerow(list(r.shape) + list(r.variant) + [r.op, "x".join(map(str, r.stride_a)),
+                            "x".join(map(str, r.stride_b)), r.calls, r.per_step, modules])
+
+
+def load_trace(path):
+    rows = []
+    with open(path, newline="") as f:
+        for rec in csv.DictReader(f):
+            variant = GemmVariant(rec["DType"], rec["Trans"], int(rec["Batch"]), int(rec["Pad"]),
+                                  float(rec["Alpha"]), float(rec["Beta"]))
+            rows.append(TraceRow((int(rec["M"]), int(rec["K"]), int(rec["N"])), variant, rec["Op"],
+                                 _strides(rec["StrideA"]), _strides(rec["StrideB"]), int(rec["Calls"]),
+                                 float(rec["PerStep"]), [m for m in rec["Modules"].split(";") if m]))
+    return rows
+
+
+def trace_shapes(path, where=None):
+    """(M, K, N) of the trace rows whose variant fields match `where`, e.g. {"dtype": "fp16"}."""
+    shapes = []
+    for r in load_trace(path):
+        if all(str(getattr(r.variant, field)) == str(value) for field, value in (where or {}).items()):
+            shapes.append(r.shape)
+    return shapes
+
+
+def group_by_variant(rows):
+    """{variant: [shape, ...]} of the replayable rows; the rest are reported and skipped."""
+    groups = {}
+    for r in rows:
+        if r.variant.dtype not in DTYPES:
+            print(f"[WARN] {r.op} {'x'.join(map(str, r.shape))}: dtype {r.variant.dtype} not supported, skipped")
+            continue
+        shapes = groups.setdefault(r.variant, [])
+        if r.shape not in shapes:
+            shapes.append(r.shape)
+    return groups
+
+
+# === Replay ===
+def replay(rows, options, store, devices=None):
+    """Measure the traced shapes that `store` does not have yet, one sweep per variant."""
+    from resultStore import current_env
+    from sweepScheduler import run_sweep
+
+    for variant, shapes in group_by_variant(rows).items():
+        env = current_env(variant.dtype, backend=options["backend"], profiler=options["profiler"],
+                          layout=layout_tag(variant))
+        todo = store.missing(shapes, options["patterns"], env)
+        print(f"[{variant.dtype} {env['layout']}] {len(shapes) - len(todo)} of {len(shapes)} shapes already measured")
+        if not todo:
+            continue
+
+        def save(shape, device, times, stability, env=env):
+            if any(times.values()):
+                store.put(shape, times, env, stability)
+
+        run_sweep(todo, dict(options, variant=variant), devices, on_result=save)
+
+
+def weighted_times(rows, patterns, medians):
+    """Per-row {pattern: seconds per step} and the best pattern per row.
+
+    medians(row) returns {pattern: median seconds or None}. Returns
+    [(row, {pattern: median}, {pattern: per-step seconds}, best pattern or None)].
+    """
+    out = []
+    for r in rows:
+        med = medians(r)
+        weighted = {p: med[p] * r.per_step for p in patterns if med.get(p) is not None}
+        best = min(weighted, key=weighted.get) if weighted else None
+        out.append((r, med, weighted, best))
+    return out
+
+
+def step_totals(weighted, patterns):
+    """{pattern: (seconds per step, rows without a time)} plus the per-shape best total."""
+    totals = {p: (sum(w[p] for _, _, w, _ in weighted if p in w), sum(1 for _, _, w, _ in weighted if p not in w))
+              for p in patterns}
+    best = sum(w[b] for _, _, w, b in weighted if b is not None)
+    return totals, best
+
+
+def write_report(path, weighted, patterns):
+    """One row per trace row, largest best-choice time per step first."""
+    ordered = sorted(weighted, key=lambda item: -(item[2][item[3]] if item[3] else 0.0))
+    total = sum(w[b] for _, _, w, b in ordered if b is not None) or 1.0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["M", "K", "N"] + VARIANT_COLUMNS + ["Op", "PerStep"] + [f"{p}_median(s)" for p in patterns]
+                        + [f"{p}_step(s)" for p in patterns] + ["Best", "BestStep(s)", "Share", "CumShare", "Modules"])
+        cumulative = 0.0
+        for r, med, w, best in ordered:
+            best_step = w[best] if best else None
+            cumulative += best_step or 0.0
+            writer.writerow(list(r.shape) + list(r.variant) + [r.op, r.per_step]
+                            + [med.get(p) if med.get(p) is not None else "N/A" for p in patterns]
+                            + [w.get(p, "N/A") for p in patterns]
+                            + [best or "N/A", best_step if best_step is not None else "N/A",
+                               (best_step or 0.0) / total, cumulative / total, ";".join(r.modules)])
+
+
+def print_summary(weighted, patterns, top=TOP):
+    totals, best = step_totals(weighted, patterns)
+    print("\nGEMM time per model step:")
+    for p in patterns:
+        seconds, missing = totals[p]
+        note = f"  ({missing} traced shapes without a time)" if missing else ""
+        print(f"  {p:<32} {seconds * 1e3:10.3f} ms{note}")
+    complete = [p for p in patterns if not totals[p][1]]
+    print(f"  {'best backend per shape':<32} {best * 1e3:10.3f} ms", end="")
+    if complete:
+        single = min(complete, key=lambda p: totals[p][0])
+        if totals[single][0]:
+            print(f"  ({1 - best / totals[single][0]:.1%} less than {single} alone)", end="")
+    print()
+
+    choices = {}
+    for _, _, w, b in weighted:
+        if b is not None:
+            choices[b] = choices.get(b, 0) + 1
+    if not choices:
+        return
+    print("  shapes per chosen backend: " + ", ".join(f"{p}: {n}" for p, n in choices.items()))
+
+    ordered = sorted((item for item in weighted if item[3]), key=lambda item: -item[2][item[3]])
+    print(f"\nTop {min(top, len(ordered))} GEMMs by time per step (best backend):")
+    for r, _, w, b in ordered[:top]:
+        shape = "x".join(map(str, r.shape))
+        print(f"  {shape:<18} {r.variant.dtype} {layout_tag(r.variant):<16} x{r.per_step:g}/step  "
+              f"{w[b] * 1e3:9.3f} ms  {w[b] / best:6.1%}  {b}  {';'.join(r.modules[:2])}")
+
+
+# === Command line ===
+def capture_main(args):
+    try:
+        model, inputs = load_model(args.model, args)
+        rows = capture(model, inputs, args.steps)
+    except (RuntimeError, ValueError, ImportError, AttributeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    write_trace(args.output, rows)
+    calls = sum(r.per_step for r in rows)
+    print(f"Captured {len(rows)} distinct GEMMs, {calls:g} calls per step, saved to {args.output}")
+
+
+def replay_main(args):
+    from counterStore import parse_counter_set
+    from getKernelTime import read_kernel_list
+    from resultStore import ResultStore, current_env
+    from sampleStats import summarize
+
+    rows = load_trace(args.trace)
+    patterns = read_kernel_list(args.kernel_list)
+    if not patterns:
+        print("Error: kernel list file is empty or not found.")
+        sys.exit(1)
+    options = {
+        "backend": args.backend,
+        "bench_cmd": args.bench,
+        "patterns": patterns,
+        "ignore_case": args.ignore_case.split(",") if args.ignore_case else [],
+        "pick": args.pick,
+        "min_repeat": args.min_repeat,
+        "repeat": args.repeat,
+        "profiler": args.profiler,
+        "temp_dir": "temp",
+        "counters": parse_counter_set(args.counters),
+    }
+    store = ResultStore(args.store)
+    if not args.report_only:
+        replay(rows, options, store, args.devices.split(",") if args.devices else None)
+
+    envs = {}
+
+    def medians(r):
+        if r.variant not in envs:
+            envs[r.variant] = current_env(r.variant.dtype, backend=args.backend, profiler=args.profiler,
+                                          layout=layout_tag(r.variant))
+        times = store.get_times(r.shape, patterns, envs[r.variant])
+        return {p: summarize(times.get(p, []))["median"] for p in patterns}
+
+    weighted = weighted_times([r for r in rows if r.variant.dtype in DTYPES], patterns, medians)
+    store.close()
+    write_report(args.output, weighted, patterns)
+    print_summary(weighted, patterns, args.top)
+    print(f"\nReplay report saved to: {args.output}")
+
+
+def main(argv=None):
+    from getKernelTime import BACKENDS
+    from sampleStats import MAX_RUNS, MIN_RUNS
+
+    parser = argparse.ArgumentParser(description="Capture a model's GEMMs and replay them weighted by call count.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    cap = sub.add_parser("capture", help="record the GEMM calls of a model")
+    cap.add_argument("--model", default="builtin:decoder", help="'module:function' returning (model, inputs), "
+                     "or builtin:decoder")
+    cap.add_argument("--steps", type=int, default=1, help="forward passes to run; counts are per pass")
+    cap.add_argument("--device", help="move the model and inputs here (builtin: default meta, nothing is computed)")
+    cap.add_argument("--output", default=DEFAULT_TRACE)
+    decoder = cap.add_argument_group("builtin:decoder")
+    decoder.add_argument("--hidden", type=int, default=4096)
+    decoder.add_argument("--heads", type=int, default=32)
+    decoder.add_argument("--ffn", type=int, default=11008)
+    decoder.add_argument("--layers", type=int, default=2)
+    decoder.add_argument("--vocab", type=int, default=32000, help="LM head size (0: none)")
+    decoder.add_argument("--tokens", type=int, default=1, help="tokens per sequence (1: decode step)")
+    decoder.add_argument("--batch-size", type=int, default=1)
+    decoder.add_argument("--dtype", choices=DTYPES, default="fp16")
+
+    rep = sub.add_parser("replay", help="measure the traced GEMMs and report the time per model step")
+    rep.add_argument("trace", help="trace CSV written by capture")
+    rep.add_argument("kernel_list", help="kernel name patterns, one per line; each is a backend to choose from")
+    rep.add_argument("--bench", default="python benchGemm.py", help="benchmark command, M K N are appended")
+    rep.add_argument("--backend", choices=sorted(BACKENDS), default="hipprof", help="timing backend")
+    rep.add_argument("--profiler", default=os.environ.get("HIPPROF", "hipprof --pmc"),
+                     help="profiler command (or a stand-in such as fakeHipprof.py)")
+    rep.add_argument("--ignore-case", help="kernel patterns matched case-insensitively, comma-separated")
+    rep.add_argument("--pick", choices=["min", "first"], default="min", help="which matching kernel to keep per run")
+    rep.add_argument("--devices", help="comma-separated device ids (default: all visible)")
+    rep.add_argument("--min-repeat", type=int, default=MIN_RUNS)
+    rep.add_argument("--repeat", type=int, default=MAX_RUNS, help="maximum runs per shape")
+    rep.add_argument("--counters", help="extra hardware counters for hipprof (see counterStore.py)")
+    rep.add_argument("--store", default=os.path.join("temp", "results.sqlite"),
+                     help="result store; shapes already in it are not measured again")
+    rep.add_argument("--report-only", action="store_true", help="only report what the store already has")
+    rep.add_argument("--output", default=DEFAULT_REPORT)
+    rep.add_argument("--top", type=int, default=TOP, help="GEMMs listed in the summary")
+
+    args = parser.parse_args(argv)
+    if args.command == "capture":
+        capture_main(args)
+    else:
+        replay_main(args)
+
+
+if __name__ == "__main__":
+    main()
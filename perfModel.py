@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""Kernel time model for unmeasured shapes, and active learning on top of it.
+
+For each kernel pattern, the model starts from three analytic times:
+
+- launch: the launch overhead;
+- compute: FLOPs / peak * tile_waste * wave_waste;
+- memory: compulsory bytes / bandwidth.
+
+tile_waste is the FLOP overhead of padding M and N to the macro tile and
+K to a 32-deep unroll. The tile edge is 128, or the next power of two (at
+least 16) for a smaller dimension, as the libraries pick narrow tiles for
+skinny shapes. wave_waste is the overhead of rounding the
+tile count up to a multiple of the compute units. The peaks, CU count and
+launch overhead come from device_profile.json.
+
+The fit has two stages. First, non-negative weights of the three times
+are fitted to the measured medians (relative least squares), which gives
+the kernel's own overhead, efficiency and bandwidth. Then a ridge
+regression fits the log residual. Its features are log M/K/N, the log
+intensity, and the padding waste for several tile sizes. The
+regularization keeps the residual small when data is scarce. Fits on
+bootstrap resamples give the uncertainty of the prediction (log-space
+sigma). The residual scatter of the full fit is added to it.
+
+active_learn() measures a space-filling initial set, then repeats:
+- fit a model per kernel;
+- predict every unmeasured candidate;
+- measure the candidates whose prediction is uncertain (bootstrap spread
+  above max_sigma, i.e. more data nearby would improve it) or whose
+  winner may flip (given the full sigma, the fastest and second-fastest
+  kernel overlap with more than flip_prob probability).
+It stops when no candidate qualifies or the budget is spent. The winner of
+every other shape is taken from the model.
+
+The command line fits models to a result store. It reports the
+cross-validated error and winner accuracy, writes predictions for a shape
+space, and with --suggest writes the shapes active learning would measure
+next (a shape file for sweepScheduler.py).
+"""
+import argparse
+import csv
+import math
+import re
+import sys
+
+import numpy as np
+
+from analyzeResults import DEVICE_PROFILE_FILE, DTYPE_BYTES, load_device_profile
+from compareResults import load_set
+from sampleStats import summarize
+
+# Used when device_profile.json has no entry for them
+COMPUTE_UNITS = 104
+LAUNCH_OVERHEAD_US = 4.0
+
+# Largest and smallest macro tile edge (M x N) and K unroll of the analytic time
+MACRO_TILE = (128, 128)
+MIN_TILE = 16
+DEPTH_U = 32
+# Tiles whose padding waste are residual features
+FEATURE_TILES = (256, 128, 64, 32, 16)
+
+# Lower bound of a fitted launch/compute/memory weight
+BASE_FLOOR = 1e-3
+RIDGE = 1.0
+BOOTSTRAP = 32
+SEED = 0
+# Bootstrap spread (log space) above which a prediction counts as uncertain (~10%)
+MAX_SIGMA = 0.1
+# Probability of a winner flip above which a shape is measured
+FLIP_PROB = 0.05
+INITIAL = 16
+BATCH = 8
+
+PREDICTION_SUFFIXES = ["pred(s)", "pred_low(s)", "pred_high(s)", "measured(s)"]
+LAYOUT_BATCH_RE = re.compile(r"_b(\d+)_p")
+
+
+def _ceil_to(x, step):
+    return np.ceil(x / step) * step
+
+
+def _macro_tile(x, largest):
+    """Tile edge for a dimension of x: the next power of two, between MIN_TILE and `largest`."""
+    return np.clip(2.0 ** np.ceil(np.log2(x)), MIN_TILE, largest)
+
+
+def _norm_cdf(x):
+    return 0.5 * math.erfc(-x / math.sqrt(2))
+
+
+def layout_batch(layout):
+    """Batch count of a layout tag (see gemmVariant.layout_tag)."""
+    m = LAYOUT_BATCH_RE.search(layout or "")
+    return int(m.group(1)) if m else 1
+
+
+class PerfModel:
+    """Time model of one kernel for one dtype and batch count.
+
+    fit() takes shapes and their measured times (None or non-positive times
+    are ignored); predict() returns the log-time mean and sigma per shape,
+    and the part of sigma that more data would reduce (the bootstrap spread).
+    """
+
+    def __init__(self, profile, dtype="fp32", batch=1, ridge=RIDGE, rounds=BOOTSTRAP, seed=SEED):
+        self.peak_flops = profile["peak_tflops"][dtype] * 1e12
+        self.peak_bw = profile["peak_bandwidth_gbs"] * 1e9
+        self.cus = profile.get("compute_units", COMPUTE_UNITS)
+        self.launch = profile.get("launch_overhead_us", LAUNCH_OVERHEAD_US) * 1e-6
+        self.elem = DTYPE_BYTES[dtype]
+        self.batch = batch
+        self.ridge = ridge
+        self.rounds = rounds
+        self.seed = seed
+        self.coef = None
+
+    def components(self, shapes):
+        """Launch, compute and memory times in seconds per shape (columns)."""
+        m, k, n = (np.asarray(shapes, dtype=np.float64).reshape(-1, 3).T)
+        flops = 2.0 * m * k * n * self.batch
+        nbytes = self.elem * (m * k + k * n + m * n) * self.batch
+        tm, tn = _macro_tile(m, MACRO_TILE[0]), _macro_tile(n, MACRO_TILE[1])
+        tiles = np.ceil(m / tm) * np.ceil(n / tn) * self.batch
+        tile_waste = _ceil_to(m, tm) * _ceil_to(n, tn) * _ceil_to(k, DEPTH_U) / (m * n * k)
+        wave_waste = _ceil_to(tiles, self.cus) / tiles
+        return np.stack([np.full(len(m), self.launch), flops / self.peak_flops * tile_waste * wave_waste,
+                         nbytes / self.peak_bw], axis=1)
+
+    def analytic(self, shapes):
+        """Analytic times in seconds (see the module docstring)."""
+        c = self.components(shapes)
+        return c[:, 0] + np.maximum(c[:, 1], c[:, 2])
+
+    def features(self, shapes):
+        m, k, n = (np.asarray(shapes, dtype=np.float64).reshape(-1, 3).T)
+        intensity = 2.0 * m * k * n / (self.elem * (m * k + k * n + m * n))
+        cols = [np.log2(m), np.log2(k), np.log2(n), np.log2(intensity)]
+        for t in FEATURE_TILES:
+            cols.append(np.log(_ceil_to(m, t) * _ceil_to(n, t) / (m * n)))
+        return np.stack(cols, axis=1)
+
+    @staticmethod
+    def _scale_components(c, t):
+        """Non-negative weights w (relative least squares, t ~ c @ w); a weight that
+        would go negative is held at BASE_FLOOR."""
+        w = np.ones(c.shape[1])
+        free = np.ones(c.shape[1], dtype=bool)
+        rel = c / t[:, None]
+        for _ in range(c.shape[1]):
+            w[~free] = BASE_FLOOR
+            target = 1.0 - rel[:, ~free] @ w[~free]
+            w[free] = np.linalg.lstsq(rel[:, free], target, rcond=None)[0]
+            if (w[free] > BASE_FLOOR).all():
+                break
+            free &= w > BASE_FLOOR
+            if not free.any():
+                break
+        return np.maximum(w, BASE_FLOOR)
+
+    def _solve(self, x, y):
+        """Ridge fit with an unpenalized intercept; x is standardized."""
+        a = np.hstack([np.ones((len(x), 1)), x])
+        penalty = self.ridge * np.eye(a.shape[1])
+        penalty[0, 0] = 0.0
+        return np.linalg.solve(a.T @ a + penalty, a.T @ y)
+
+    def _fit_once(self, c, x, t):
+        w = self._scale_components(c, t)
+        return w, self._solve(x, np.log(t) - np.log(c @ w))
+
+    def _standardize(self, x):
+        return (x - self.mean) / self.scale
+
+    def fit(self, shapes, times):
+        keep = [(s, t) for s, t in zip(shapes, times) if t is not None and t > 0]
+        if not keep:
+            raise ValueError("no measured times to fit")
+        shapes = [s for s, _ in keep]
+        t = np.array([t for _, t in keep])
+        c = self.components(shapes)
+        x = self.features(shapes)
+        self.mean = x.mean(axis=0)
+        self.scale = np.where(x.std(axis=0) > 0, x.std(axis=0), 1.0)
+        x = self._standardize(x)
+        self.weights, self.coef = self._fit_once(c, x, t)
+        a = np.hstack([np.ones((len(x), 1)), x])
+        resid = np.log(t) - np.log(c @ self.weights) - a @ self.coef
+        dof = max(len(t) - a.shape[1] - c.shape[1], 1)
+        self.noise = float(np.sqrt(resid @ resid / dof)) if len(t) > 1 else MAX_SIGMA
+        rng = np.random.default_rng(self.seed)
+        self.boot = []
+        for _ in range(self.rounds):
+            idx = rng.integers(0, len(t), len(t))
+            self.boot.append(self._fit_once(c[idx], x[idx], t[idx]))
+        self.samples = len(t)
+        return self
+
+    def _log_time(self, c, a, weights, coef):
+        return np.log(c @ weights) + a @ coef
+
+    def predict(self, shapes):
+        """(log-time mean, log-time sigma, bootstrap spread) arrays for `shapes`."""
+        if self.coef is None:
+            raise ValueError("model is not fitted")
+        c = self.components(shapes)
+        a = np.hstack([np.ones((len(c), 1)), self._standardize(self.features(shapes))])
+        mu = self._log_time(c, a, self.weights, self.coef)
+        if self.boot:
+            spread = np.std([self._log_time(c, a, w, r) for w, r in self.boot], axis=0)
+        else:
+            spread = np.zeros(len(c))
+        return mu, np.sqrt(spread ** 2 + self.noise ** 2), spread
+
+
+def fit_models(measured, profile, dtype="fp32", batch=1, labels=None, **kwargs):
+    """{label: PerfModel} fitted to measured = {shape: {label: time}}; labels without times are skipped."""
+    labels = labels or sorted({label for times in measured.values() for label in times})
+    models = {}
+    for label in labels:
+        pairs = [(s, t[label]) for s, t in measured.items() if t.get(label)]
+        if pairs:
+            models[label] = PerfModel(profile, dtype, batch, **kwargs).fit(*zip(*pairs))
+    return models
+
+
+def predict_shapes(models, shapes):
+    """{shape: {label: (mu, sigma, spread)}} in log seconds."""
+    out = {s: {} for s in shapes}
+    if not shapes:
+        return out
+    for label, model in models.items():
+        for s, *values in zip(shapes, *model.predict(shapes)):
+            out[s][label] = tuple(float(v) for v in values)
+    return out
+
+
+def flip_probability(pred):
+    """Probability that the predicted fastest kernel is not the fastest (0 with one kernel)."""
+    if len(pred) < 2:
+        return 0.0
+    (mu_a, sd_a, _), (mu_b, sd_b, _) = sorted(pred.values())[:2]
+    return _norm_cdf(-(mu_b - mu_a) / math.sqrt(sd_a ** 2 + sd_b ** 2 + 1e-12))
+
+
+def priority(pred, max_sigma=MAX_SIGMA, flip_prob=FLIP_PROB):
+    """How much measuring a shape is worth; > 1 when it is uncertain or its winner may flip."""
+    if not pred:
+        return float("inf")
+    sigma = max(spread for _, _, spread in pred.values())
+    return max(sigma / max_sigma, flip_probability(pred) / flip_prob)
+
+
+def select(predictions, count, max_sigma=MAX_SIGMA, flip_prob=FLIP_PROB):
+    """Up to `count` shapes with priority > 1, highest first."""
+    scored = [(priority(p, max_sigma, flip_prob), s) for s, p in predictions.items()]
+    return [s for score, s in sorted(scored, reverse=True) if score > 1][:count]
+
+
+def initial_design(candidates, count):
+    """Space-filling subset: farthest-point sampling in log2 (M, K, N), starting near the center."""
+    if count >= len(candidates):
+        return list(candidates)
+    x = np.log2(np.asarray(candidates, dtype=np.float64))
+    x = (x - x.mean(axis=0)) / np.where(x.std(axis=0) > 0, x.std(axis=0), 1.0)
+    chosen = [int(np.argmin((x ** 2).sum(axis=1)))]
+    dist = ((x - x[chosen[0]]) ** 2).sum(axis=1)
+    while len(chosen) < count:
+        i = int(np.argmax(dist))
+        chosen.append(i)
+        dist = np.minimum(dist, ((x - x[i]) ** 2).sum(axis=1))
+    return [candidates[i] for i in chosen]
+
+
+def active_learn(candidates, measure, profile, dtype="fp32", batch=1, initial=INITIAL, batch_size=BATCH,
+                 budget=None, max_sigma=MAX_SIGMA, flip_prob=FLIP_PROB):
+    """Measure only the candidates the model cannot predict confidently.
+
+    measure(shapes) returns {shape: {label: time or None}} for a list of
+    shapes. Returns (measured, models): the measured {shape: times} and the
+    final {label: PerfModel}. When no kernel can be fitted (e.g. every run
+    of the initial design failed), it stops after the initial design.
+    """
+    candidates = list(dict.fromkeys(candidates))
+    budget = len(candidates) if budget is None else budget
+    measured, models = {}, {}
+    todo = initial_design(candidates, min(initial, budget))
+    rounds = 0
+    while todo:
+        rounds += 1
+        results = measure(todo)
+        for s in todo:
+            measured[s] = results.get(s, {})
+        models = fit_models(measured, profile, dtype, batch)
+        if not models:
+            # without a model every shape looks uncertain; do not spend the budget measuring them all
+            print(f"[WARN] [active] round {rounds}: no kernel times to fit a model to, stopping after "
+                  f"{len(measured)} shapes")
+            break
+        rest = [s for s in candidates if s not in measured]
+        todo = select(predict_shapes(models, rest), min(batch_size, budget - len(measured)), max_sigma, flip_prob)
+        print(f"[active] round {rounds}: measured {len(measured)} of {len(candidates)} shapes, "
+              f"{len(todo)} uncertain next")
+    return measured, models
+
+
+def prediction_rows(shapes, models, measured=None, labels=None):
+    """One row per shape: per label the predicted time, its 95% interval and the measured time,
+    then the winner, the flip probability and whether the winner was measured or predicted
+    (all three "N/A" when no model could be fitted)."""
+    measured = measured or {}
+    labels = labels or sorted(models)
+    rows = []
+    for s, pred in predict_shapes(models, list(shapes)).items():
+        row = list(s)
+        for label in labels:
+            if label in pred:
+                mu, sd, _ = pred[label]
+                row += [math.exp(mu), math.exp(mu - 1.96 * sd), math.exp(mu + 1.96 * sd)]
+            else:
+                row += ["N/A"] * 3
+            t = measured.get(s, {}).get(label)
+            row.append(t if t is not None else "N/A")
+        times = {label: measured[s][label] for label in models if measured.get(s, {}).get(label)}
+        if times and len(times) == len(models):
+            row += [min(times, key=times.get), 0.0, "measured"]
+        elif not pred:
+            row += ["N/A", "N/A", "N/A"]
+        else:
+            row += [min(pred, key=lambda label: pred[label][0]), flip_probability(pred), "predicted"]
+        rows.append(row)
+    return rows
+
+
+def write_predictions(path, labels, rows, prefix_columns=()):
+    """Write prediction rows; prefix_columns name the values rows carry between N and the predictions."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["M", "K", "N"] + list(prefix_columns)
+                        + [f"{label}_{suffix}" for label in labels for suffix in PREDICTION_SUFFIXES]
+                        + ["Winner", "FlipProb", "Source"])
+        writer.writerows(rows)
+    return len(rows)
+
+
+def cross_validate(measured, profile, dtype="fp32", batch=1, folds=5, seed=SEED):
+    """k-fold CV: (median absolute % error per label, winner accuracy, shapes with every label)."""
+    shapes = list(measured)
+    order = np.random.default_rng(seed).permutation(len(shapes))
+    errors, hits, total = {}, 0, 0
+    for f in range(min(folds, len(shapes))):
+        test = [shapes[i] for i in order[f::folds]]
+        train = {s: measured[s] for s in shapes if s not in test}
+        if not train:
+            continue
+        models = fit_models(train, profile, dtype, batch)
+        pred = predict_shapes(models, test)
+        for s in test:
+            times = {label: t for label, t in measured[s].items() if t and label in models}
+            for label, t in times.items():
+                errors.setdefault(label, []).append(abs(math.exp(pred[s][label][0]) / t - 1) * 100)
+            if len(times) > 1 and len(times) == len(models):
+                total += 1
+                hits += min(times, key=times.get) == min(times, key=lambda label: pred[s][label][0])
+    return ({label: summarize(e)["median"] for label, e in errors.items()},
+            hits / total if total else None, total)
+
+
+def load_medians(spec, kernels=None):
+    """{(dtype, layout): {shape: {kernel: median}}} from a result set (see compareResults.parse_set)."""
+    groups = {}
+    for (m, k, n, dtype, layout, kernel), samples in load_set(spec).items():
+        if kernels and kernel not in kernels:
+            continue
+        median = summarize(samples)["median"]
+        if median:
+            groups.setdefault((dtype, layout), {}).setdefault((m, k, n), {})[kernel] = median
+    return groups
+
+
+def write_shapes(path, shapes):
+    with open(path, "w") as f:
+        for m, k, n in shapes:
+            f.write(f"{m} {k} {n}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict kernel times for unmeasured shapes from a result store.")
+    parser.add_argument("store", help="result set 'store.sqlite[:field=value,...]' (see compareResults.py)")
+    parser.add_argument("space", nargs="?", help="shapes to predict: shape file or shape space (see shapeSpace.py)")
+    parser.add_argument("--kernel", action="append", default=[], help="kernel pattern to model (default: all)")
+    parser.add_argument("--profile", default=DEVICE_PROFILE_FILE)
+    parser.add_argument("--device", help="device entry in the profile file (default: its 'default')")
+    parser.add_argument("--folds", type=int, default=5, help="cross-validation folds (0: skip)")
+    parser.add_argument("--max-sigma", type=float, default=MAX_SIGMA, help="bootstrap spread (log space) counted as uncertain")
+    parser.add_argument("--flip-prob", type=float, default=FLIP_PROB,
+                        help="winner flip probability above which a shape is worth measuring")
+    parser.add_argument("--output", default="gemm_predictions.csv")
+    parser.add_argument("--suggest", type=int, default=0, help="write up to this many shapes to measure next")
+    parser.add_argument("--suggest-file", default="next_shapes.txt")
+    args = parser.parse_args()
+
+    _, profile = load_device_profile(args.profile, args.device)
+    try:
+        groups = load_medians(args.store, args.kernel)
+        if args.space:
+            from shapeSpace import load_space
+
+            space = load_space(args.space)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not groups:
+        print(f"Error: no results in {args.store}")
+        sys.exit(1)
+
+    fitted, suggested = [], []
+    for (dtype, layout), measured in groups.items():
+        batch = layout_batch(layout)
+        models = fit_models(measured, profile, dtype, batch)
+        fitted.append((dtype, layout, measured, models))
+        print(f"[{dtype} {layout}] {len(measured)} measured shapes")
+        if args.folds > 1 and len(measured) > 1:
+            errors, accuracy, total = cross_validate(measured, profile, dtype, batch, args.folds)
+            for label, err in errors.items():
+                print(f"    {label}: median error {err:.1f}% ({args.folds}-fold CV)")
+            if accuracy is not None:
+                print(f"    winner accuracy {accuracy * 100:.1f}% over {total} shapes")
+        if args.space:
+            rest = [s for s in space if s not in measured]
+            suggested += select(predict_shapes(models, rest), len(rest), args.max_sigma, args.flip_prob)
+
+    if args.space:
+        labels = sorted({label for *_, models in fitted for label in models})
+        rows = []
+        for dtype, layout, measured, models in fitted:
+            rows += [r[:3] + [dtype, layout] + r[3:] for r in prediction_rows(space, models, measured, labels)]
+        write_predictions(args.output, labels, rows, ["DType", "Layout"])
+        print(f"\n{len(rows)} predictions saved to: {args.output}")
+    if args.suggest:
+        suggested = list(dict.fromkeys(suggested))[:args.suggest]
+        write_shapes(args.suggest_file, suggested)
+        print(f"{len(suggested)} shapes to measure next saved to: {args.suggest_file}")
+
+
+if __name__ == "__main__":
+    main()
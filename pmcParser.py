@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Streaming parser for hipprof `pmc_results_<pid>.txt` files.
+
+The file is read line by line, so memory use does not grow with the trace
+size. Each `kernel-name:"..."` line starts a new record; the lines that
+follow (up to the next kernel-name) hold its `kernel time` and counters.
+Kernel-name patterns from kernel_list.txt are matched by one compiled
+alternation, and the per-pattern result is cached per distinct kernel name.
+
+Counter parsing is most of the cost of a pass. collect_kernel_times
+therefore asks iter_records for the matching records only, with counters
+off. The bodies of other records are skipped unparsed, and matching ones
+are only searched for their `kernel time`. Full records (every launch, all
+counters) are what the CLI, counterStore.py and traceAttribution.py read.
+"""
+import re
+import sys
+from collections import namedtuple
+
+KernelRecord = namedtuple("KernelRecord", ["index", "name", "time", "counters"])
+
+KERNEL_NAME_RE = re.compile(r'kernel-name:"([^"]*)"')
+KERNEL_TIME_RE = re.compile(r'kernel time\s+([\d.]+)\(s\)')
+# "SQ_WAVES: 128", "GRBM_COUNT=42" ...
+COUNTER_PAIR_RE = re.compile(r'([A-Za-z_][\w.\[\]]*)\s*[:=]\s*([-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)(?![\w.])')
+# "SQ_WAVES   128" (one counter per line)
+COUNTER_LINE_RE = re.compile(r'^\s*([A-Za-z_][\w.\[\]]*)\s+([-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)\s*$')
+
+
+def wildcard_regex(kernel_pattern):
+    """Support wildcard "*" → regex ".*" """
+    return re.escape(kernel_pattern).replace(r'\*', '.*')
+
+
+class KernelMatcher:
+    """Match kernel names against many wildcard patterns in one pass.
+
+    A single alternation rejects non-matching names with one regex call;
+    names that do match are resolved to the list of patterns they satisfy
+    once and then served from a cache.
+    """
+
+    CACHE_LIMIT = 4096
+
+    def __init__(self, patterns, ignore_case=()):
+        self.patterns = list(patterns)
+        ignore_case = set(ignore_case)
+        parts = []
+        for p in self.patterns:
+            flag = "?i:" if p in ignore_case else "?:"
+            parts.append(f"({flag}{wildcard_regex(p)})")
+        self._combined = re.compile("|".join(parts)) if parts else None
+        self._each = [re.compile(part) for part in parts]
+        self._cache = {}
+
+    def match(self, name):
+        """Return the tuple of patterns matching `name` (empty if none)."""
+        hit = self._cache.get(name)
+        if hit is not None:
+            return hit
+        if self._combined is None or not self._combined.fullmatch(name):
+            hit = ()
+        else:
+            hit = tuple(p for p, rx in zip(self.patterns, self._each) if rx.fullmatch(name))
+        if len(self._cache) >= self.CACHE_LIMIT:
+            self._cache.clear()
+        self._cache[name] = hit
+        return hit
+
+
+def _parse_body(text, counters):
+    """Parse one body line; return the kernel time if the line holds it."""
+    m = KERNEL_TIME_RE.search(text) if "kernel time" in text else None
+    if m:
+        text = text[:m.start()] + text[m.end():]
+    line_counter = COUNTER_LINE_RE.match(text)
+    if line_counter:
+        counters[line_counter.group(1)] = float(line_counter.group(2))
+    else:
+        for c in COUNTER_PAIR_RE.finditer(text):
+            counters[c.group(1)] = float(c.group(2))
+    return float(m.group(1)) if m else None
+
+
+def _parse_time(text):
+    """Kernel time on one body line, or None; counters are not parsed."""
+    m = KERNEL_TIME_RE.search(text) if "kernel time" in text else None
+    return float(m.group(1)) if m else None
+
+
+def iter_records(source, matcher=None, counters=True):
+    """Yield a KernelRecord per kernel launch, in trace order.
+
+    `source` is a path or an open text file. `time` is None when the record
+    has no `kernel time` line. With a KernelMatcher, only records whose
+    name matches it are yielded (`index` still counts every launch), and
+    the other bodies are skipped unparsed. With counters=False only the
+    kernel time is parsed and `counters` is empty.
+    """
+    f = open(source, "r", errors="replace") if isinstance(source, str) else source
+    index = -1
+    # name of the record being read; None before the first one and inside skipped ones
+    name = None
+    kernel_time = None
+    fields = {}
+    try:
+        for line in f:
+            m = KERNEL_NAME_RE.search(line) if "kernel-name:" in line else None
+            if m:
+                if name is not None:
+                    yield KernelRecord(index, name, kernel_time, fields)
+                index += 1
+                name, kernel_time, fields = m.group(1), None, {}
+                if matcher is not None and not matcher.match(name):
+                    name = None
+                    continue
+                rest = line[m.end():]
+            elif name is None:
+                continue
+            else:
+                rest = line
+            if counters:
+                t = _parse_body(rest, fields)
+            elif kernel_time is None:
+                t = _parse_time(rest)
+            else:
+                continue
+            if t is not None and kernel_time is None:
+                kernel_time = t
+        if name is not None:
+            yield KernelRecord(index, name, kernel_time, fields)
+    finally:
+        if f is not source:
+            f.close()
+
+
+def iter_matches(source, matcher, counters=True):
+    """Yield (record, patterns) for each record matching at least one pattern."""
+    for record in iter_records(source, matcher, counters):
+        yield record, matcher.match(record.name)
+
+
+def collect_kernel_times(source, patterns, ignore_case=()):
+    """Return {pattern: [kernel time, ...]} in trace order for every pattern."""
+    matcher = patterns if isinstance(patterns, KernelMatcher) else KernelMatcher(patterns, ignore_case)
+    times = {p: [] for p in matcher.patterns}
+    for record, hit in iter_matches(source, matcher, counters=False):
+        if record.time is None:
+            continue
+        for p in hit:
+            times[p].append(record.time)
+    return times
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python pmcParser.py <pmc_results.txt> [kernel_list.txt]")
+        sys.exit(1)
+
+    patterns = ["*"]
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "r") as f:
+            patterns = [line.strip() for line in f if line.strip()]
+    matcher = KernelMatcher(patterns)
+    for record, _ in iter_matches(sys.argv[1], matcher):
+        print(f"{record.index}\t{record.time}\t{record.name}\t{record.counters}")
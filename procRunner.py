@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Shell-free subprocess execution with streamed output.
+
+Commands are argv lists started with asyncio (no shell). stdout and stderr
+are read line by line as the child writes them: a pid pattern is picked up
+the moment it is printed, only lines matching `keep` plus a short tail are
+held in memory, and a hung child (with its whole process group, e.g. the
+benchmark under hipprof) is killed after `timeout` seconds and optionally
+retried. A command that cannot be started (missing executable, no
+permission) gives a failed RunResult like the shell would (returncode 127
+or 126, pid None, the error in `tail`) instead of raising.
+"""
+import asyncio
+import os
+import re
+import shlex
+import signal
+import sys
+from collections import deque, namedtuple
+
+RunResult = namedtuple("RunResult", ["returncode", "pid", "kept", "tail", "timed_out"])
+
+HIPPROF_PID_RE = re.compile(r"HIP_PROF:process id '(\d+)'")
+TAIL_LINES = 50
+LINE_LIMIT = 1 << 20
+
+
+def to_argv(cmd):
+    """Split a configured command string ('hipprof --pmc') into argv; lists pass through."""
+    return shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def run_async(argv, timeout=None, pid_re=HIPPROF_PID_RE, keep=None, on_line=None, env=None):
+    """Run argv, streaming its output; return a RunResult.
+
+    `pid` is the first group of the first line matching pid_re, `kept` the
+    lines matching `keep`, `tail` the last TAIL_LINES lines. on_line(line)
+    is called for every line as it arrives.
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+            env=env, limit=LINE_LIMIT, start_new_session=True)
+    except OSError as e:
+        # exit codes of a shell that cannot find / execute the command
+        returncode = 127 if isinstance(e, FileNotFoundError) else 126
+        return RunResult(returncode, None, [], [f"{shlex.join(argv)}: {e}\n"], False)
+    state = {"pid": None}
+    kept = []
+    tail = deque(maxlen=TAIL_LINES)
+
+    async def pump():
+        while True:
+            try:
+                raw = await proc.stdout.readline()
+            except ValueError:
+                # line longer than LINE_LIMIT: drop the rest of it
+                raw = await proc.stdout.read(LINE_LIMIT)
+            if not raw:
+                break
+            line = raw.decode(errors="replace")
+            tail.append(line)
+            if on_line is not None:
+                on_line(line)
+            if state["pid"] is None and pid_re is not None:
+                m = pid_re.search(line)
+                if m:
+                    state["pid"] = m.group(1)
+            if keep is not None and keep.search(line):
+                kept.append(line)
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(asyncio.gather(pump(), proc.wait()), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        _kill_group(proc)
+        await proc.wait()
+    return RunResult(proc.returncode, state["pid"], kept, list(tail), timed_out)
+
+
+def run_command(argv, timeout=None, retries=0, pid_re=HIPPROF_PID_RE, keep=None, on_line=None, env=None):
+    """Synchronous run_async with up to `retries` reruns after a timeout."""
+    for attempt in range(retries + 1):
+        result = asyncio.run(run_async(argv, timeout, pid_re, keep, on_line, env))
+        if not result.timed_out:
+            return result
+        print(f"[WARN] timed out after {timeout}s (attempt {attempt + 1}/{retries + 1}): {shlex.join(argv)}")
+    return result
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python procRunner.py [--timeout S] <cmd> [args...]")
+        sys.exit(1)
+    args = sys.argv[1:]
+    run_timeout = None
+    if args[0] == "--timeout":
+        run_timeout, args = float(args[1]), args[2:]
+    res = run_command(args, run_timeout, on_line=lambda line: print(line, end=""))
+    sys.exit(124 if res.timed_out else res.returncode)
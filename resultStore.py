@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Persistent on-disk store of per-shape kernel time samples.
+
+Results live in a SQLite file keyed by (M, K, N, dtype, layout, kernel
+pattern, backend, tool version, device); the layout is the rest of the
+GEMM variant (see gemmVariant.py). Each result also keeps the stability
+score of its samples (see stability.py). Sweeps write each shape as soon as it is
+measured and ask the store which shapes are still missing or stale, so a
+restarted or overlapping sweep only measures what it does not have yet.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from gemmVariant import DEFAULT_LAYOUT
+from harnessProfile import span
+
+DEFAULT_PATH = os.path.join("temp", "results.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    m INTEGER NOT NULL,
+    k INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    dtype TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    kernel TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    tool_version TEXT NOT NULL,
+    device TEXT NOT NULL,
+    samples TEXT NOT NULL,
+    created REAL NOT NULL,
+    stability REAL,
+    PRIMARY KEY (m, k, n, dtype, layout, kernel, backend, tool_version, device)
+)
+"""
+
+# Stores written before results were keyed by layout hold the default layout
+MIGRATE_LAYOUT = f"""
+ALTER TABLE results RENAME TO results_old;
+{SCHEMA};
+INSERT INTO results (m, k, n, dtype, layout, kernel, backend, tool_version, device, samples, created)
+    SELECT m, k, n, dtype, '{DEFAULT_LAYOUT}', kernel, backend, tool_version, device, samples, created
+    FROM results_old;
+DROP TABLE results_old;
+"""
+
+# Result fields that describe where and how a shape was measured
+ENV_FIELDS = ("dtype", "layout", "backend", "tool_version", "device")
+
+_tool_versions = {}
+
+
+def tool_version(profiler="hipprof"):
+    """First line of `<profiler> --version`, or 'unknown' (cached per tool)."""
+    version = os.environ.get("HIPPROF_VERSION")
+    if version:
+        return version
+    exe = profiler.split()[0]
+    if exe not in _tool_versions:
+        try:
+            out = subprocess.run([exe, "--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 text=True, timeout=10).stdout
+            lines = [line.strip() for line in out.splitlines() if line.strip()]
+            _tool_versions[exe] = lines[0] if lines else "unknown"
+        except (OSError, subprocess.TimeoutExpired):
+            _tool_versions[exe] = "unknown"
+    return _tool_versions[exe]
+
+
+def torch_version():
+    """Version of the in-process backends' timing stack."""
+    try:
+        import torch
+    except ImportError:
+        return "unknown"
+    return f"torch {torch.__version__}"
+
+
+def query_torch(expr, default):
+    """Evaluate a torch expression in a child process, or return `default`.
+
+    Keeps the sweep driver from initializing the GPU runtime before it
+    forks its workers.
+    """
+    code = f"import torch; print({expr})"
+    try:
+        out = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, text=True, timeout=120)
+    except (OSError, subprocess.TimeoutExpired):
+        return default
+    out = out.stdout.strip()
+    return out if out else default
+
+
+def device_name():
+    """Device model name; shapes measured on identical devices share results."""
+    name = os.environ.get("GEMM_DEVICE_NAME")
+    if name:
+        return name
+    return query_torch("torch.cuda.get_device_name(0) if torch.cuda.is_available() else 'cpu'", "cpu")
+
+
+def current_env(dtype, backend="hipprof", profiler="hipprof", layout=DEFAULT_LAYOUT):
+    """The non-shape part of a result key for this machine."""
+    with span("env query"):
+        return {
+            "dtype": dtype,
+            "layout": layout,
+            "backend": backend,
+            "tool_version": tool_version(profiler) if backend == "hipprof" else torch_version(),
+            "device": device_name(),
+        }
+
+
+class ResultStore:
+    """SQLite-backed result store; `max_age` (seconds) marks old entries stale."""
+
+    def __init__(self, path=DEFAULT_PATH, max_age=None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_age = max_age
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(results)")]
+        if "layout" not in columns:
+            self.conn.executescript(MIGRATE_LAYOUT)
+        elif "stability" not in columns:
+            self.conn.execute("ALTER TABLE results ADD COLUMN stability REAL")
+        self.conn.commit()
+
+    def _key(self, shape, kernel, env):
+        m, k, n = shape
+        return (m, k, n, env["dtype"], env["layout"], kernel, env["backend"], env["tool_version"], env["device"])
+
+    def get(self, shape, kernel, env):
+        """Stored samples, or None when missing or stale.
+
+        A shape measured without any matching kernel is stored as [] and
+        counts as measured.
+        """
+        row = self.conn.execute(
+            "SELECT samples, created FROM results WHERE m=? AND k=? AND n=? AND dtype=? AND layout=?"
+            " AND kernel=? AND backend=? AND tool_version=? AND device=?",
+            self._key(shape, kernel, env)).fetchone()
+        if row is None:
+            return None
+        samples, created = json.loads(row[0]), row[1]
+        if self.max_age is not None and time.time() - created > self.max_age:
+            return None
+        return samples
+
+    def put(self, shape, times, env, stability=None):
+        """Store a {kernel: samples} dict (and {kernel: stability score}) for one shape in one transaction."""
+        now = time.time()
+        stability = stability or {}
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._key(shape, kernel, env) + (json.dumps(list(samples)), now, stability.get(kernel))
+                 for kernel, samples in times.items()])
+
+    def get_stability(self, shape, kernels, env):
+        """{kernel: stability score} (None when not recorded) for the kernels that have results."""
+        scores = {}
+        for kernel in kernels:
+            row = self.conn.execute(
+                "SELECT stability FROM results WHERE m=? AND k=? AND n=? AND dtype=? AND layout=?"
+                " AND kernel=? AND backend=? AND tool_version=? AND device=?",
+                self._key(shape, kernel, env)).fetchone()
+            if row is not None:
+                scores[kernel] = row[0]
+        return scores
+
+    def get_times(self, shape, kernels, env):
+        """{kernel: samples} for the kernels that have fresh results."""
+        times = {}
+        for kernel in kernels:
+            samples = self.get(shape, kernel, env)
+            if samples is not None:
+                times[kernel] = samples
+        return times
+
+    def missing(self, shapes, kernels, env):
+        """Shapes (in order, without duplicates) for which any kernel is missing or stale."""
+        return [s for s in dict.fromkeys(shapes) if len(self.get_times(s, kernels, env)) < len(kernels)]
+
+    def query(self, **where):
+        """(shape, kernel, env, samples, created) of every result whose fields match `where`, newest first.
+
+        `where` takes any of dtype, layout, kernel, backend, tool_version and device.
+        """
+        unknown = set(where) - set(ENV_FIELDS + ("kernel",))
+        if unknown:
+            raise ValueError(f"unknown result fields: {', '.join(sorted(unknown))}")
+        sql = "SELECT m, k, n, kernel, dtype, layout, backend, tool_version, device, samples, created FROM results"
+        if where:
+            sql += " WHERE " + " AND ".join(f"{field}=?" for field in where)
+        for row in self.conn.execute(sql + " ORDER BY created DESC", list(where.values())):
+            m, k, n, kernel = row[:4]
+            env = dict(zip(ENV_FIELDS, row[4:9]))
+            yield (m, k, n), kernel, env, json.loads(row[9]), row[10]
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH
+    store = ResultStore(path)
+    rows = store.conn.execute(
+        "SELECT m, k, n, dtype, layout, kernel, backend, device, samples FROM results ORDER BY m, k, n").fetchall()
+    for m, k, n, dtype, layout, kernel, backend, device, samples in rows:
+        print(f"{m}x{k}x{n}\t{dtype}\t{layout}\t{backend}\t{device}\t{kernel}\t{len(json.loads(samples))} samples")
+    print(f"{len(rows)} results in {path}")
@@ -1,86 +1,219 @@
 #!/usr/bin/env python3
-import subprocess
-import re
+import argparse
 import csv
 import os
 
+import harnessProfile
+from gemmVariant import DEFAULT_VARIANT, VARIANT_COLUMNS, layout_tag, variant_argv
+
 # === Configuration ===
 
-# Square matrix test configuration
-SQUARE_START = 256
-SQUARE_END = 4096
-SQUARE_STEP = 128
-
-# Non-square matrix test configuration [(M, K, N), ...]
-NON_SQUARE_SIZES = [
-    (1, 7168, 9216),
-    (1, 7168, 1536),
-    (1, 7168, 1024),
-    (1, 5120, 6144),
-    (1, 5120, 3584),
-    (1, 5120, 3072),
-    (1, 5120, 768),
-    (1, 5120, 256),
-    (1, 4608, 7168),
-    (1, 4096, 7168),
-    (1, 3072, 5120),
-    (1, 1536, 6144),
-    (1, 512, 7168),
-    (1, 384, 5120)
-]
+# Shapes to test (see shapeSpace.py): square matrices 256..4096 in steps of
+# 128, then the non-square decode-time linear layers (M = 1)
+SHAPE_SPACE = """
+square 256..4096:128
+model decode tokens=1
+"""
 
 KERNEL_LIST_FILE = "kernel_list.txt"
+PROFILER = os.environ.get("HIPPROF", "hipprof --pmc")
 FINAL_CSV = "gemm_sweep_results.csv"
 
+# Batch mode: profile every shape in one `benchGemm.py --batch` process
+BATCH = True
+BATCH_SHAPES_FILE = os.path.join("temp", "run_shapes.txt")
+WARMUP = 1
+
+# Adaptive repeats: stop once the 95% CI of the median is within REL_CI of it
+MIN_REPEAT = 5
+MAX_REPEAT = 30
+ROUND_REPEAT = 5
+REL_CI = 0.02
+
+# Measured shapes are kept here; a rerun only measures missing shapes
+RESULT_STORE = os.path.join("temp", "results.sqlite")
+
+# Hardware counters (see counterStore.py): every launch's counters go to
+# COUNTER_STORE as Parquet; COUNTERS adds counters to the default pmc set,
+# e.g. "memory,occupancy". Set COUNTER_STORE = None to keep only kernel times.
+COUNTERS = ""
+COUNTER_STORE = os.path.join("temp", "counters")
+
+# GEMM variants to sweep (dtype, transposes, batch count, ld padding, alpha, beta; see gemmVariant.py)
+VARIANTS = [DEFAULT_VARIANT]
+
+# Harness self-profiling (see harnessProfile.py): a directory for the Chrome
+# trace and the phase summary of the sweep, or None (HARNESS_PROFILE also works)
+HARNESS_PROFILE = None
+
 # === Utility functions ===
-def extract_average_from_csv(file_path):
-    """Extract the average kernel time from getKernelTime.py CSV output"""
-    with open(file_path, "r") as f:
-        lines = f.readlines()
-    for line in lines:
-        if line.startswith("Average,"):
-            parts = line.strip().split(",")
-            return [float(x) if x not in ("N/A", "") else None for x in parts[1:]]
-    return None
+def variant_env(variant, backend="hipprof"):
+    from resultStore import current_env
 
-# === Main function ===
-def main():
-    square_sizes = list(range(SQUARE_START, SQUARE_END + 1, SQUARE_STEP))
+    return current_env(variant.dtype, backend=backend, profiler=PROFILER, layout=layout_tag(variant))
 
-    # Open final CSV
-    with open(FINAL_CSV, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["M", "K", "N", "AverageKernelTime(s)"])
+def make_counter_writer(variant):
+    """Counter store writer for hipprof runs of `variant`, or None when COUNTER_STORE is unset."""
+    if not COUNTER_STORE:
+        return None
+    from counterStore import CounterWriter
+
+    try:
+        return CounterWriter(COUNTER_STORE, {"dtype": variant.dtype, "layout": layout_tag(variant)})
+    except RuntimeError as e:
+        print(f"[WARN] counters not kept: {e}")
+        return None
+
+def run_batch(shapes, variant):
+    """Profile all shapes not yet in the result store in one hipprof process.
+
+    Every pending shape first gets MIN_REPEAT runs; shapes whose median is
+    not yet stable (see sampleStats) are re-batched ROUND_REPEAT runs at a
+    time until they are, or until MAX_REPEAT runs.
+    """
+    from counterStore import parse_counter_set
+    from getKernelTime import run_hipprof_batch, read_kernel_list
+    from resultStore import ResultStore
+    from sampleStats import enough_samples
 
-        # 1. Square matrix tests
-        for size in square_sizes:
-            print(f"\n===== Running square GEMM {size}x{size}x{size} =====")
-            cmd = f"python getKernelTime.py 'python benchGemm.py {size} {size} {size}' {KERNEL_LIST_FILE}"
-            subprocess.run(cmd, shell=True, check=True)
+    kernel_names = read_kernel_list(KERNEL_LIST_FILE)
+    store = ResultStore(RESULT_STORE)
+    env = variant_env(variant)
+    todo = store.missing(shapes, kernel_names, env)
+    print(f"{len(shapes) - len(todo)} of {len(shapes)} shapes already in {RESULT_STORE}")
 
-            csv_files = [f for f in os.listdir(".") if f.startswith("hipprof_results_") and f.endswith(".csv")]
-            latest_csv = max(csv_files, key=os.path.getmtime)
+    counter_writer = make_counter_writer(variant)
+    samples = {shape: {k: [] for k in kernel_names} for shape in todo}
+    pending = todo
+    repeat = MIN_REPEAT
+    while pending:
+        os.makedirs("temp", exist_ok=True)
+        with open(BATCH_SHAPES_FILE, "w") as f:
+            for M, K, N in pending:
+                f.write(f"{M} {K} {N}\n")
 
-            averages = extract_average_from_csv(latest_csv)
-            avg_time = averages[0] if averages else None
-            writer.writerow([size, size, size, avg_time])
-            print(f"[OK] {size}x{size}x{size}: average kernel time = {avg_time:.6f}s")
+        results = run_hipprof_batch(BATCH_SHAPES_FILE, KERNEL_LIST_FILE, repeat=repeat, warmup=WARMUP,
+                                    profiler=PROFILER, bench_args=variant_argv(variant),
+                                    counters=parse_counter_set(COUNTERS), counter_writer=counter_writer)
+        for shape in pending:
+            per_kernel = results.get(shape, {})
+            for k in kernel_names:
+                samples[shape][k].extend(per_kernel.get(k, [None] * repeat))
+            times = {k: [v for v in vals if v is not None] for k, vals in samples[shape].items()}
+            if any(times.values()):
+                with harnessProfile.span("store", shape):
+                    store.put(shape, times, env)
 
-        # 2. Non-square matrix tests
-        for M, K, N in NON_SQUARE_SIZES:
-            print(f"\n===== Running non-square GEMM {M}x{K} * {K}x{N} =====")
-            cmd = f"python getKernelTime.py 'python benchGemm.py {M} {K} {N}' {KERNEL_LIST_FILE}"
-            subprocess.run(cmd, shell=True, check=True)
+        pending = [shape for shape in pending
+                   if not all(enough_samples(samples[shape][k], MIN_REPEAT, MAX_REPEAT, REL_CI)
+                              for k in kernel_names)]
+        if pending:
+            done_runs = max(len(samples[shape][kernel_names[0]]) for shape in pending)
+            repeat = min(ROUND_REPEAT, MAX_REPEAT - done_runs)
+            print(f"\n{len(pending)} shapes not yet stable, running {repeat} more repeats")
+    if counter_writer is not None:
+        counter_writer.close()
+    store.close()
 
-            csv_files = [f for f in os.listdir(".") if f.startswith("hipprof_results_") and f.endswith(".csv")]
-            latest_csv = max(csv_files, key=os.path.getmtime)
+def run_per_shape(shapes, variant):
+    """Profile each shape not yet in the result store in its own hipprof runs."""
+    from counterStore import parse_counter_set
+    from getKernelTime import read_kernel_list, run_hipprof
+    from resultStore import ResultStore
 
-            averages = extract_average_from_csv(latest_csv)
-            avg_time = averages[0] if averages else None
-            writer.writerow([M, K, N, avg_time])
-            print(f"[OK] {M}x{K}x{N}: average kernel time = {avg_time:.6f}s")
+    kernel_names = read_kernel_list(KERNEL_LIST_FILE)
+    store = ResultStore(RESULT_STORE)
+    env = variant_env(variant)
+    todo = store.missing(shapes, kernel_names, env)
+    print(f"{len(shapes) - len(todo)} of {len(shapes)} shapes already in {RESULT_STORE}")
+
+    counter_writer = make_counter_writer(variant)
+    for M, K, N in todo:
+        print(f"\n===== Running GEMM {M}x{K}x{N} =====")
+        res = run_hipprof(["python", "benchGemm.py", str(M), str(K), str(N)] + variant_argv(variant), kernel_names,
+                          MIN_REPEAT, MAX_REPEAT, REL_CI, profiler=PROFILER, shape=(M, K, N),
+                          counters=parse_counter_set(COUNTERS), counter_writer=counter_writer)
+        times = {k: [v for v in vals if v is not None] for k, vals in res.samples.items()}
+        if any(times.values()):
+            with harnessProfile.span("store", (M, K, N)):
+                store.put((M, K, N), times, env)
+    if counter_writer is not None:
+        counter_writer.close()
+    store.close()
+
+def run_backend(shapes, variant, backend_name):
+    """Measure all shapes not yet in the result store with an in-process timing backend."""
+    from getKernelTime import make_backend, measure, read_kernel_list
+    from resultStore import ResultStore
+
+    kernel_names = read_kernel_list(KERNEL_LIST_FILE)
+    store = ResultStore(RESULT_STORE)
+    env = variant_env(variant, backend_name)
+    todo = store.missing(shapes, kernel_names, env)
+    print(f"{len(shapes) - len(todo)} of {len(shapes)} shapes already in {RESULT_STORE}")
+
+    backend = make_backend({"backend": backend_name, "bench_cmd": "python benchGemm.py", "patterns": kernel_names,
+                            "variant": variant})
+    for M, K, N in todo:
+        print(f"\n===== Running GEMM {M}x{K}x{N} ({backend_name}) =====")
+        times = measure(backend, (M, K, N), MIN_REPEAT, MAX_REPEAT, REL_CI)
+        if any(times.values()):
+            with harnessProfile.span("store", (M, K, N)):
+                store.put((M, K, N), times, env)
+    store.close()
+
+def write_final_csv(shapes, backend="hipprof"):
+    from getKernelTime import read_kernel_list, trimmed_mean
+    from resultStore import ResultStore
+    from sampleStats import summarize
+
+    kernel_pattern = read_kernel_list(KERNEL_LIST_FILE)[0]
+    store = ResultStore(RESULT_STORE)
+    with harnessProfile.span("csv"), open(FINAL_CSV, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["M", "K", "N"] + VARIANT_COLUMNS + ["AverageKernelTime(s)",
+                         "Median(s)", "IQR(s)", "CI95_low(s)", "CI95_high(s)", "Samples"])
+        for variant in VARIANTS:
+            env = variant_env(variant, backend)
+            for M, K, N in shapes:
+                times = store.get_times((M, K, N), [kernel_pattern], env).get(kernel_pattern, [])
+                avg_time = trimmed_mean(times)
+                stats = summarize(times)
+                writer.writerow([M, K, N] + list(variant) + [avg_time, stats["median"], stats["iqr"],
+                                 stats["ci_low"], stats["ci_high"], stats["n"]])
+                label = f"{M}x{K}x{N} {variant.dtype} {env['layout']}"
+                if avg_time is not None:
+                    print(f"[OK] {label}: average kernel time = {avg_time:.6f}s (n={stats['n']})")
+                else:
+                    print(f"[WARN] {label}: no kernel time collected")
+    store.close()
 
     print(f"\nAll GEMM test results saved to: {FINAL_CSV}")
 
+# === Main function ===
+def main():
+    from getKernelTime import BACKENDS
+    from shapeSpace import load_space, parse_space
+
+    parser = argparse.ArgumentParser(description="Run the GEMM shape sweep.")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="hipprof",
+                        help="timing backend; everything but hipprof times benchGemm.py's ops in-process")
+    parser.add_argument("--space", help="shape file or shape space file instead of SHAPE_SPACE")
+    parser.add_argument("--harness-profile", default=HARNESS_PROFILE,
+                        help="record where the sweep's time goes into this directory (see harnessProfile.py)")
+    args = parser.parse_args()
+
+    shapes = load_space(args.space) if args.space else parse_space(SHAPE_SPACE)
+
+    with harnessProfile.session(args.harness_profile):
+        for variant in VARIANTS:
+            if args.backend != "hipprof":
+                run_backend(shapes, variant, args.backend)
+            elif BATCH:
+                run_batch(shapes, variant)
+            else:
+                run_per_shape(shapes, variant)
+        write_final_csv(shapes, args.backend)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Summary statistics and the adaptive stopping rule for kernel time samples.
+
+Instead of a fixed number of runs, a shape is measured until the 95%
+confidence interval of the median is narrower than `rel_ci` of the median
+(or the coefficient of variation drops below `max_cv`), bounded by
+`min_runs` and `max_runs` attempts. Failed runs are passed as None; they
+count as attempts but not as samples.
+"""
+import math
+import statistics
+
+MIN_RUNS = 5
+MAX_RUNS = 30
+REL_CI = 0.02
+Z95 = 1.96
+
+SUMMARY_FIELDS = ["median", "q1", "q3", "iqr", "ci_low", "ci_high", "cv", "n"]
+
+
+def median_ci(sorted_values, z=Z95):
+    """Distribution-free CI of the median from order statistics (normal approx.)."""
+    n = len(sorted_values)
+    half = z * math.sqrt(n) / 2
+    lo = max(int(math.floor(n / 2 - half)), 0)
+    hi = min(int(math.ceil(n / 2 + half)), n - 1)
+    return sorted_values[lo], sorted_values[hi]
+
+
+def summarize(samples):
+    """Median, quartiles, IQR, 95% CI of the median, CV and sample count."""
+    values = sorted(v for v in samples if v is not None)
+    n = len(values)
+    if n == 0:
+        return dict(dict.fromkeys(SUMMARY_FIELDS), n=0)
+    median = statistics.median(values)
+    if n >= 2:
+        q1, _, q3 = statistics.quantiles(values, n=4, method="inclusive")
+        mean = statistics.mean(values)
+        cv = statistics.stdev(values) / mean if mean else None
+    else:
+        q1 = q3 = values[0]
+        cv = None
+    ci_low, ci_high = median_ci(values)
+    return {
+        "median": median,
+        "q1": q1,
+        "q3": q3,
+        "iqr": q3 - q1,
+        "ci_low": ci_low,
+        "ci_high": ci_high,
+        "cv": cv,
+        "n": n,
+    }
+
+
+def enough_samples(samples, min_runs=MIN_RUNS, max_runs=MAX_RUNS, rel_ci=REL_CI, max_cv=None):
+    """True once `samples` (None = failed run) meets the stopping rule."""
+    attempts = len(samples)
+    if attempts >= max_runs:
+        return True
+    if attempts < min_runs:
+        return False
+    s = summarize(samples)
+    if s["n"] == 0:
+        # kernel never matched; more runs will not change that
+        return True
+    if s["n"] < min_runs or not s["median"]:
+        return False
+    if rel_ci is not None and (s["ci_high"] - s["ci_low"]) / s["median"] <= rel_ci:
+        return True
+    if max_cv is not None and s["cv"] is not None and s["cv"] <= max_cv:
+        return True
+    return False
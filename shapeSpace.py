@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""GEMM shape spaces: a small declaration language and an adaptive explorer.
+
+A shape space is a list of lines. Each line is one of:
+
+    64 64 64                                  literal shape (as in shape files)
+    grid M=<axis> K=<axis> N=<axis> [where <expr>]
+    square <axis>                             (s, s, s) for every s in axis
+    model <name|KxN,...> tokens=<axis>        (t, K, N) for every linear layer
+    trace <file> [dtype=..] [trans=..]        (M, K, N) captured from a model
+
+An axis is a comma-separated list of integers, ranges `a..b` (step 1),
+`a..b:step`, `a..b:pow2` (powers of two in [a, b]) and presets such as
+`@autoperf`. `where` is a Python expression over M, K and N. `#` starts a
+comment. Shapes are returned in order without duplicates.
+
+A `trace` line reads a trace written by `modelTrace.py capture`. Its
+key=value filters select trace rows by the GemmVariant fields (dtype,
+trans, batch, pad, alpha, beta).
+
+The explorer measures a coarse sub-grid of a `grid` line first. It then
+bisects, along each axis, only the gaps where the winning kernel changes
+or where the log time ratio of the kernels bends by more than `smooth_tol`
+at a measured point. That gives the decision boundary for kernel selection
+from a fraction of the dense grid.
+"""
+import math
+import os
+import re
+import sys
+
+# The hand-picked sizes autoPerf.py and autoVerify.py sweep on every axis
+PRESET_AXES = {
+    "autoperf": [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 7168, 8192, 9216],
+}
+
+# (K, N) of linear layers, measured with M = number of tokens
+MODELS = {
+    # decode-time projections run.py measures with M = 1
+    "decode": [
+        (7168, 9216), (7168, 1536), (7168, 1024), (5120, 6144), (5120, 3584), (5120, 3072), (5120, 768),
+        (5120, 256), (4608, 7168), (4096, 7168), (3072, 5120), (1536, 6144), (512, 7168), (384, 5120),
+    ],
+}
+
+AUTOPERF_SPACE = "grid M=@autoperf K=@autoperf N=@autoperf where M*K*N < 1024*1024"
+
+RANGE_RE = re.compile(r"^(\d+)\.\.(\d+)(?::(\w+))?$")
+PAIR_RE = re.compile(r"^(\d+)x(\d+)$")
+SMOOTH_TOL = 0.1
+
+
+def parse_axis(text):
+    """Sorted, de-duplicated axis values from an axis expression."""
+    values = set()
+    for token in text.split(","):
+        token = token.strip()
+        if not token:
+            continue
+        if token.startswith("@"):
+            if token[1:] not in PRESET_AXES:
+                raise ValueError(f"unknown axis preset: {token}")
+            values.update(PRESET_AXES[token[1:]])
+            continue
+        m = RANGE_RE.match(token)
+        if m is None:
+            values.add(int(token))
+            continue
+        lo, hi, step = int(m.group(1)), int(m.group(2)), m.group(3) or "1"
+        if step == "pow2":
+            values.update(1 << e for e in range(hi.bit_length()) if lo <= 1 << e <= hi)
+        else:
+            values.update(range(lo, hi + 1, int(step)))
+    return sorted(values)
+
+
+def parse_where(expr):
+    """Predicate f(m, k, n) for a `where` expression (None when expr is empty)."""
+    if not expr:
+        return None
+    code = compile(expr, "<where>", "eval")
+    unknown = set(code.co_names) - {"M", "K", "N", "min", "max", "abs"}
+    if unknown:
+        raise ValueError(f"unknown names in where clause: {', '.join(sorted(unknown))}")
+    names = {"__builtins__": {}, "min": min, "max": max, "abs": abs}
+    return lambda m, k, n: bool(eval(code, names, {"M": m, "K": k, "N": n}))
+
+
+def _split_where(rest):
+    body, _, where = rest.partition(" where ")
+    return body.split(), where.strip()
+
+
+def _keywords(tokens, line):
+    kw = {}
+    for token in tokens:
+        key, sep, value = token.partition("=")
+        if not sep:
+            raise ValueError(f"expected key=value in: {line}")
+        kw[key] = value
+    return kw
+
+
+def parse_grid(line):
+    """(m_axis, k_axis, n_axis, where) of a `grid` line."""
+    head, _, rest = line.strip().partition(" ")
+    if head != "grid":
+        raise ValueError(f"not a grid line: {line}")
+    tokens, where = _split_where(rest)
+    kw = _keywords(tokens, line)
+    if set(kw) != {"M", "K", "N"}:
+        raise ValueError(f"grid needs M=, K= and N=: {line}")
+    return parse_axis(kw["M"]), parse_axis(kw["K"]), parse_axis(kw["N"]), parse_where(where)
+
+
+def model_pairs(spec):
+    """(K, N) pairs of a model name or an inline 'KxN,KxN' list."""
+    if spec in MODELS:
+        return MODELS[spec]
+    pairs = []
+    for token in spec.split(","):
+        m = PAIR_RE.match(token.strip())
+        if m is None:
+            raise ValueError(f"unknown model: {spec}")
+        pairs.append((int(m.group(1)), int(m.group(2))))
+    return pairs
+
+
+def expand_line(line):
+    """Shapes declared by one line."""
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return []
+    head, _, rest = line.partition(" ")
+    if head == "grid":
+        m_axis, k_axis, n_axis, where = parse_grid(line)
+        return [(m, k, n) for m in m_axis for k in k_axis for n in n_axis
+                if where is None or where(m, k, n)]
+    if head == "square":
+        tokens, where = _split_where(rest)
+        pred = parse_where(where)
+        return [(s, s, s) for s in parse_axis("".join(tokens)) if pred is None or pred(s, s, s)]
+    if head == "model":
+        tokens, where = _split_where(rest)
+        pred = parse_where(where)
+        kw = _keywords(tokens[1:], line)
+        tokens_axis = parse_axis(kw.get("tokens", "1"))
+        return [(t, k, n) for k, n in model_pairs(tokens[0]) for t in tokens_axis
+                if pred is None or pred(t, k, n)]
+    if head == "trace":
+        # Imported here so that other spaces do not pull in torch
+        from modelTrace import trace_shapes
+
+        tokens, where = _split_where(rest)
+        pred = parse_where(where)
+        return [s for s in trace_shapes(tokens[0], _keywords(tokens[1:], line)) if pred is None or pred(*s)]
+    m, k, n = (int(x) for x in line.replace(",", " ").split()[:3])
+    return [(m, k, n)]
+
+
+def parse_space(spec):
+    """Shapes of a space given as a string or a list of lines."""
+    lines = spec.splitlines() if isinstance(spec, str) else spec
+    shapes = {}
+    for line in lines:
+        for shape in expand_line(line):
+            shapes.setdefault(shape, None)
+    return list(shapes)
+
+
+def load_space(source):
+    """Shapes of a space file (plain shape files are valid spaces), or stdin for '-'."""
+    if source == "-":
+        return parse_space(sys.stdin.read())
+    with open(source, "r") as f:
+        return parse_space(f.read())
+
+
+# === Adaptive explorer ===
+
+def winner(times):
+    """Label of the fastest kernel, or None unless every kernel has a time."""
+    if not times or any(t is None for t in times.values()):
+        return None
+    return min(times, key=times.get)
+
+
+def _coarse(length, stride):
+    idx = list(range(0, length, stride))
+    if idx[-1] != length - 1:
+        idx.append(length - 1)
+    return idx
+
+
+def _curve(times):
+    """Log of the quantity whose smoothness matters: the time ratio of the
+    first two kernels (it decides the winner), or the time of a single kernel."""
+    values = [t for t in times.values() if t]
+    if len(values) != len(times) or not values:
+        return None
+    return math.log(values[0] / values[1]) if len(values) > 1 else math.log(values[0])
+
+
+def _bends(axis, a, p, b, ta, tp, tb, smooth_tol):
+    """True when the curve at p deviates from the log-log line through a and b."""
+    ya, yp, yb = _curve(ta), _curve(tp), _curve(tb)
+    if ya is None or yp is None or yb is None:
+        return False
+    xa, xp, xb = (math.log2(axis[i]) for i in (a, p, b))
+    return abs(yp - (ya + (yb - ya) * (xp - xa) / (xb - xa))) > math.log1p(smooth_tol)
+
+
+def refine(axes, measured, where=None, smooth_tol=SMOOTH_TOL):
+    """Index triples to measure next: midpoints of gaps that need bisecting.
+
+    `measured` maps index triples to {label: time}. Along each axis,
+    consecutive measured points on a line form a gap. A gap is bisected
+    when its two ends have different winners, or when the curve bends at
+    either end.
+    """
+    todo = set()
+    for d, axis in enumerate(axes):
+        lines = {}
+        for idx in measured:
+            lines.setdefault(idx[:d] + idx[d + 1:], []).append(idx[d])
+        for rest, positions in lines.items():
+            positions.sort()
+            full = [rest[:d] + (i,) + rest[d:] for i in positions]
+            bent = set()
+            for a, p, b in zip(full, full[1:], full[2:]):
+                if _bends(axis, a[d], p[d], b[d], measured[a], measured[p], measured[b], smooth_tol):
+                    bent.update((a, p, b))
+            for a, b in zip(full, full[1:]):
+                if b[d] - a[d] < 2:
+                    continue
+                if winner(measured[a]) == winner(measured[b]) and a not in bent and b not in bent:
+                    continue
+                mid = _allowed_between(axes, a, b, d, where)
+                if mid is not None and mid not in measured:
+                    todo.add(mid)
+    return sorted(todo)
+
+
+def _allowed_between(axes, a, b, d, where):
+    """Index triple strictly between a and b on axis d closest to the middle that `where` allows."""
+    lo, hi = a[d], b[d]
+    mid = (lo + hi) // 2
+    for i in sorted(range(lo + 1, hi), key=lambda i: abs(i - mid)):
+        idx = a[:d] + (i,) + a[d + 1:]
+        if where is None or where(*(axes[j][idx[j]] for j in range(3))):
+            return idx
+    return None
+
+
+def explore(axes, measure, where=None, stride=4, smooth_tol=SMOOTH_TOL, max_points=None):
+    """Adaptively measure the grid axes = (m_axis, k_axis, n_axis).
+
+    measure(shapes) returns {shape: {label: time or None}} for a list of
+    shapes. Returns {shape: times} for every measured shape.
+    """
+    def shape_of(idx):
+        return tuple(axes[j][idx[j]] for j in range(3))
+
+    coarse = [(i, j, l) for i in _coarse(len(axes[0]), stride) for j in _coarse(len(axes[1]), stride)
+              for l in _coarse(len(axes[2]), stride)]
+    batch = [idx for idx in coarse if where is None or where(*shape_of(idx))]
+    measured = {}
+    rounds = 0
+    while batch:
+        if max_points is not None:
+            batch = batch[:max(0, max_points - len(measured))]
+            if not batch:
+                break
+        rounds += 1
+        results = measure([shape_of(idx) for idx in batch])
+        for idx in batch:
+            measured[idx] = results.get(shape_of(idx), {})
+        print(f"[explore] round {rounds}: measured {len(batch)} shapes ({len(measured)} total)")
+        batch = refine(axes, measured, where, smooth_tol)
+    return {shape_of(idx): times for idx, times in measured.items()}
+
+
+def dense_size(axes, where=None):
+    """Number of grid points `where` allows (the cost of a dense sweep)."""
+    return sum(1 for m in axes[0] for k in axes[1] for n in axes[2] if where is None or where(m, k, n))
+
+
+if __name__ == "__main__":
+    # Print the shapes of spec files or spec lines, one 'M K N' per line
+    if len(sys.argv) < 2:
+        print("Usage: python shapeSpace.py <space file | spec line> ...")
+        print("Example: python shapeSpace.py 'square 256..4096:128' 'model decode tokens=1,16' > shapes.txt")
+        sys.exit(1)
+    lines = []
+    for arg in sys.argv[1:]:
+        if os.path.isfile(arg):
+            with open(arg, "r") as f:
+                lines.extend(f.read().splitlines())
+        else:
+            lines.append(arg)
+    for m, k, n in parse_space(lines):
+        print(f"{m} {k} {n}")
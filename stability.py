@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Measurement-stability controls for long sweeps.
+
+Measuring every repeat of a shape back-to-back, in a fixed shape order,
+turns thermal and clock drift during a multi-hour sweep into a systematic
+bias across the grid. This module provides three controls:
+
+- Run order. measure_window() keeps a window of shapes in flight and
+  takes one run of each per round, in a fixed ('interleave') or shuffled
+  ('random') order. A shape leaves the window as soon as its samples meet
+  the stopping rule, and the next shape from the queue takes its place.
+  The in-process backends also shuffle the order of their ops.
+- A sentinel. DriftMonitor re-measures a fixed sentinel shape every few
+  runs. The ratio of its baseline time to its current time is the drift
+  factor, and every sample is multiplied by the factor in effect when it
+  was taken.
+- CPU affinity. cpu_slice() and pin_process() pin a sweep worker, and the
+  benchmark processes it launches, to a set of CPUs.
+
+Every result gets a stability score in (0, 1]:
+
+    1 / (1 + ci_width / rel_ci + drift / DRIFT_TOL + |trend|)
+
+where ci_width is the relative width of the 95% CI of the median, drift
+is the relative range of the drift factor over the shape's runs, and
+trend is the rank correlation between the samples and their run order.
+Drift that the sentinel did not remove shows up as a trend. A shape that
+just meets the CI target with no drift scores 0.5.
+"""
+import csv
+import os
+import random
+import statistics
+
+from harnessProfile import profiled_run
+from sampleStats import MAX_RUNS, MIN_RUNS, REL_CI, enough_samples, summarize
+
+ORDERS = ("sequential", "interleave", "random")
+WINDOW = 8
+SENTINEL_EVERY = 20
+# Sentinel readings that make up the baseline, and the readings the current drift factor is the median of
+SENTINEL_BASELINE = 3
+SENTINEL_RECENT = 3
+# Relative drift that costs as much stability score as a CI at the rel_ci target
+DRIFT_TOL = 0.02
+
+
+def _ranks(values):
+    order = sorted(range(len(values)), key=values.__getitem__)
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for t in range(i, j + 1):
+            ranks[order[t]] = (i + j) / 2
+        i = j + 1
+    return ranks
+
+
+def trend(samples):
+    """Spearman rank correlation of the samples with their run order (0 for fewer than 5)."""
+    values = [v for v in samples if v is not None]
+    if len(values) < 5:
+        return 0.0
+    ranks = _ranks(values)
+    if len(set(ranks)) < 2:
+        return 0.0
+    return statistics.correlation(list(range(len(values))), ranks)
+
+
+def stability_score(samples, factors=(), rel_ci=REL_CI):
+    """Stability score of one shape's samples (see the module docstring); None without samples."""
+    s = summarize(samples)
+    if not s["n"] or not s["median"]:
+        return None
+    width = (s["ci_high"] - s["ci_low"]) / s["median"]
+    drift = (max(factors) / min(factors) - 1) if factors else 0.0
+    return 1.0 / (1.0 + width / (rel_ci or REL_CI) + drift / DRIFT_TOL + abs(trend(samples)))
+
+
+def parse_sentinel(text):
+    """'1024 1024 1024' (or '1024,1024,1024') -> (1024, 1024, 1024); None for no sentinel."""
+    if not text:
+        return None
+    m, k, n = (int(x) for x in text.replace(",", " ").split())
+    return (m, k, n)
+
+
+def parse_cpus(text):
+    """'0-3,8' -> [0, 1, 2, 3, 8]."""
+    cpus = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return sorted(cpus)
+
+
+def cpu_slice(spec, slot=0, slots=1):
+    """CPUs for worker `slot` of `slots`.
+
+    'auto' splits the CPUs this process may use evenly across the workers;
+    otherwise spec is a CPU list ('0-7') shared by all workers, or one list
+    per worker separated by ';' ('0-3;4-7').
+    """
+    if not spec:
+        return None
+    if spec == "auto":
+        cpus = sorted(os.sched_getaffinity(0))
+        per = max(1, len(cpus) // max(slots, 1))
+        return cpus[slot * per:(slot + 1) * per] or cpus
+    groups = spec.split(";")
+    return parse_cpus(groups[slot % len(groups)])
+
+
+def pin_process(cpus):
+    """Pin this process (and the processes it starts) to `cpus`."""
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+
+class DriftMonitor:
+    """Re-measure `sentinel` every `every` runs and track the drift factor.
+
+    factor() is baseline / current, where baseline is the median of the
+    first SENTINEL_BASELINE sentinel times and current the median of the
+    last SENTINEL_RECENT. It is 1.0 until the baseline exists. The first
+    sentinel run is a warm-up and not recorded. Readings are logged to
+    `log_path` (CSV) when given; a warning is printed each time the factor
+    moves out of DRIFT_TOL.
+    """
+
+    def __init__(self, backend, sentinel, every=SENTINEL_EVERY, log_path=None):
+        self.backend = backend
+        self.sentinel = tuple(sentinel)
+        self.every = max(1, every)
+        self.runs = 0
+        self.readings = []
+        self.baseline = None
+        self._factor = 1.0
+        self._drifting = False
+        self.log_path = log_path
+        if log_path:
+            with open(log_path, "w", newline="") as f:
+                csv.writer(f).writerow(["Run", "SentinelTime(s)", "DriftFactor"])
+        profiled_run(backend, self.sentinel, "sentinel")
+        self.measure()
+
+    def measure(self):
+        times = profiled_run(self.backend, self.sentinel, "sentinel")
+        value = next((t for t in times.values() if t is not None), None)
+        if value is None:
+            return
+        self.readings.append(value)
+        if self.baseline is None and len(self.readings) >= SENTINEL_BASELINE:
+            self.baseline = statistics.median(self.readings[:SENTINEL_BASELINE])
+        if self.baseline is not None:
+            self._factor = self.baseline / statistics.median(self.readings[-SENTINEL_RECENT:])
+        if self.log_path:
+            with open(self.log_path, "a", newline="") as f:
+                csv.writer(f).writerow([self.runs, value, self._factor])
+        drifting = abs(self._factor - 1) > DRIFT_TOL
+        if drifting and not self._drifting:
+            print(f"[WARN] drift: sentinel {'x'.join(map(str, self.sentinel))} at {value:.6f}s, "
+                  f"correcting by {self._factor:.3f}")
+        self._drifting = drifting
+
+    def factor(self):
+        return self._factor
+
+    def tick(self):
+        """Count one measured run; re-measure the sentinel when due."""
+        self.runs += 1
+        if self.runs % self.every == 0:
+            self.measure()
+
+
+def measure_window(backend, pull, order="interleave", window=WINDOW, min_repeat=MIN_RUNS, max_repeat=MAX_RUNS,
+                   rel_ci=REL_CI, max_cv=None, monitor=None, seed=None):
+    """Measure shapes from pull() interleaved; yield (key, shape, times, stability) as each one finishes.
+
+    pull() returns the next (key, shape) or None when there are no more.
+    Up to `window` shapes are in flight; each round runs every one of them
+    once, shuffled when order is 'random'. Samples are corrected by the
+    monitor's drift factor. times is {pattern: [time, ...]} without failed
+    runs, and stability is {pattern: score}.
+    """
+    rng = random.Random(seed)
+    active = {}
+    exhausted = False
+    while True:
+        while not exhausted and len(active) < window:
+            task = pull()
+            if task is None:
+                exhausted = True
+                break
+            key, shape = task
+            active[key] = (shape, {p: [] for p in backend.patterns}, [])
+        if not active:
+            return
+        keys = list(active)
+        if order == "random":
+            rng.shuffle(keys)
+        for key in keys:
+            shape, times, factors = active[key]
+            factor = monitor.factor() if monitor is not None else 1.0
+            for p, t in profiled_run(backend, shape).items():
+                times[p].append(None if t is None else t * factor)
+            factors.append(factor)
+            if monitor is not None:
+                monitor.tick()
+            if all(enough_samples(v, min_repeat, max_repeat, rel_ci, max_cv) for v in times.values()):
+                del active[key]
+                backend.release(shape)
+                times = {p: [v for v in values if v is not None] for p, values in times.items()}
+                yield key, shape, times, {p: stability_score(v, factors, rel_ci) for p, v in times.items()}
@@ -0,0 +1,643 @@
+#!/usr/bin/env python3
+"""Spread a GEMM shape sweep across several nodes through a work-queue server.
+
+The coordinator (`serve`) keeps the sweep's shape tasks in a SQLite queue
+and serves them over HTTP with JSON bodies. Worker agents (`worker`) run on
+the GPU nodes, one process per device as in sweepScheduler.py. Each one
+repeats four steps:
+
+1. Lease a task (largest FLOPs first).
+2. Measure it with the existing backends (getKernelTime.make_backend and
+   sweepScheduler.measure_shape). A heartbeat thread extends the lease in
+   the meantime.
+3. Upload the raw pmc traces of the task; the coordinator archives them in
+   its trace archive.
+4. Upload the samples. The coordinator writes them to its result store,
+   keyed by the worker's environment (device, tool version).
+
+A lease that is not renewed within --lease seconds (the worker died or
+lost the network) expires, and the task goes back to the queue. A task
+whose leases expire or fail --max-attempts times is marked failed. The
+queue file survives a coordinator restart: serving the same queue again
+resumes the sweep, and finished shapes are not measured twice.
+
+Sweep-wide settings (bench command, backend, kernel patterns, stopping
+rule, variant) come from the coordinator with every lease. Node-local
+settings (profiler command, devices, temp dir, timeouts) are options of
+the worker.
+
+Endpoints (POST bodies and replies are JSON):
+    POST /lease      {worker, count}              -> {tasks, options, done}
+    POST /heartbeat  {worker, tasks}              -> {tasks: ids still leased}
+    POST /complete   {worker, task, env, times, stability}
+    POST /fail       {worker, task, error}
+    POST /trace?worker=&task=&repeat=&run_id=&codec=
+                                                  one pmc trace, compressed as in the
+                                                  worker's archive (gzip or zstd)
+    GET  /status                                  -> {counts, workers}
+
+Everything runs on one machine too, e.g. with a stand-in profiler:
+
+    python sweepCluster.py serve shapes.txt kernel_list.txt --port 8765 &
+    python sweepCluster.py worker http://127.0.0.1:8765 --devices 0,1 --profiler 'python fakeprof.py'
+"""
+import argparse
+import io
+import json
+import multiprocessing as mp
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gemmVariant import GemmVariant, add_variant_sweep_args, layout_tag, variants_from_args
+from getKernelTime import BACKENDS, RUN_RETRIES, RUN_TIMEOUT, make_backend, read_kernel_list
+from resultStore import ResultStore, current_env
+from sampleStats import MAX_RUNS, MIN_RUNS, REL_CI
+from shapeSpace import load_space
+from stability import stability_score
+from sweepScheduler import estimate_flops, measure_shape, visible_devices, write_csv
+from traceArchive import LimitedReader, TraceArchive, decompress_stream
+
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE = os.path.join("temp", "queue.sqlite")
+LEASE_SECONDS = 120.0
+MAX_ATTEMPTS = 3
+# Worker poll interval while every remaining task is leased elsewhere
+POLL_SECONDS = 2.0
+# Seconds a worker keeps retrying an unreachable coordinator
+CONNECT_RETRY_SECONDS = 60.0
+HTTP_TIMEOUT = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    m INTEGER NOT NULL,
+    k INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    dtype TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    priority REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL,
+    UNIQUE (m, k, n, dtype, layout)
+);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    host TEXT,
+    last_seen REAL NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+STATES = ("pending", "leased", "done", "failed")
+
+
+# === Queue ===
+
+class TaskQueue:
+    """SQLite-backed task queue with leases; safe to share between server threads."""
+
+    def __init__(self, path=DEFAULT_QUEUE, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def add(self, shapes, variant):
+        """Queue every shape for `variant` (already queued shapes are kept); returns the number added."""
+        now = time.time()
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tasks (m, k, n, dtype, layout, variant, priority, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(m, k, n, variant.dtype, layout_tag(variant), json.dumps(list(variant)),
+                  estimate_flops((m, k, n)) * variant.batch, now) for m, k, n in shapes])
+            return self.conn.total_changes - before
+
+    def _seen(self, worker, host=None, done=0):
+        self.conn.execute(
+            "INSERT INTO workers (name, host, last_seen, done) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET last_seen=excluded.last_seen, done=done+excluded.done,"
+            " host=COALESCE(excluded.host, host)", (worker, host, time.time(), done))
+
+    def _reclaim(self, now):
+        rows = self.conn.execute("SELECT id, worker FROM tasks WHERE state='leased' AND lease_expires < ?",
+                                 (now,)).fetchall()
+        for task_id, worker in rows:
+            print(f"[WARN] lease of task {task_id} held by {worker} expired")
+        self.conn.execute(
+            "UPDATE tasks SET state=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+            " worker=NULL, lease_expires=NULL, error='lease expired', updated=?"
+            " WHERE state='leased' AND lease_expires < ?", (self.max_attempts, now, now))
+        return len(rows)
+
+    def reclaim(self):
+        """Return expired leases to the queue (or fail them); returns how many expired."""
+        with self.lock, self.conn:
+            return self._reclaim(time.time())
+
+    def lease(self, worker, count=1, host=None):
+        """Lease up to `count` pending tasks to `worker`; returns [(id, shape, variant), ...]."""
+        now = time.time()
+        with self.lock, self.conn:
+            self._reclaim(now)
+            self._seen(worker, host)
+            rows = self.conn.execute(
+                "SELECT id, m, k, n, variant FROM tasks WHERE state='pending' ORDER BY priority DESC, id LIMIT ?",
+                (count,)).fetchall()
+            self.conn.executemany(
+                "UPDATE tasks SET state='leased', worker=?, lease_expires=?, attempts=attempts+1, updated=?"
+                " WHERE id=?", [(worker, now + self.lease_seconds, now, row[0]) for row in rows])
+        return [(task_id, (m, k, n), GemmVariant(*json.loads(variant))) for task_id, m, k, n, variant in rows]
+
+    def heartbeat(self, worker, task_ids):
+        """Extend the worker's leases on task_ids; returns the ids it still holds."""
+        now = time.time()
+        with self.lock, self.conn:
+            self._seen(worker)
+            held = []
+            for task_id in task_ids:
+                cur = self.conn.execute(
+                    "UPDATE tasks SET lease_expires=?, updated=? WHERE id=? AND worker=? AND state='leased'",
+                    (now + self.lease_seconds, now, task_id, worker))
+                if cur.rowcount:
+                    held.append(task_id)
+        return held
+
+    def task(self, task_id):
+        with self.lock:
+            row = self.conn.execute("SELECT m, k, n, variant, state FROM tasks WHERE id=?", (task_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"no task {task_id}")
+        m, k, n, variant, state = row
+        return (m, k, n), GemmVariant(*json.loads(variant)), state
+
+    def complete(self, worker, task_id, result):
+        """Record a task's result; False when it was already done (e.g. finished by a second lease)."""
+        with self.lock, self.conn:
+            self._seen(worker, done=1)
+            cur = self.conn.execute(
+                "UPDATE tasks SET state='done', worker=?, lease_expires=NULL, result=?, error=NULL, updated=?"
+                " WHERE id=? AND state != 'done'", (worker, json.dumps(result), time.time(), task_id))
+            return cur.rowcount > 0
+
+    def fail(self, worker, task_id, error):
+        """Return a failed task to the queue, or mark it failed after max_attempts."""
+        with self.lock, self.conn:
+            self._seen(worker)
+            self.conn.execute(
+                "UPDATE tasks SET state=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+                " worker=NULL, lease_expires=NULL, error=?, updated=? WHERE id=? AND worker=? AND state='leased'",
+                (self.max_attempts, str(error), time.time(), task_id, worker))
+
+    def counts(self):
+        counts = dict.fromkeys(STATES, 0)
+        with self.lock:
+            counts.update(self.conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+        return counts
+
+    def finished(self):
+        counts = self.counts()
+        return counts["pending"] == 0 and counts["leased"] == 0
+
+    def workers(self):
+        with self.lock:
+            return self.conn.execute("SELECT name, host, last_seen, done FROM workers ORDER BY name").fetchall()
+
+    def results(self):
+        """(shape, variant, worker, {pattern: samples}, {pattern: stability}) of every finished task."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT m, k, n, variant, worker, result FROM tasks WHERE state='done' ORDER BY id").fetchall()
+        out = []
+        for m, k, n, variant, worker, result in rows:
+            result = json.loads(result)
+            out.append(((m, k, n), GemmVariant(*json.loads(variant)), worker, result["times"], result["stability"]))
+        return out
+
+    def close(self):
+        self.conn.close()
+
+
+# === Coordinator ===
+
+class Coordinator:
+    """Queue, result store and trace archive behind the HTTP handler.
+
+    The store and the archive are opened per request, since every request
+    is handled in its own thread and SQLite connections stay in the thread
+    that opened them.
+    """
+
+    def __init__(self, queue, store_path, traces_root, options):
+        self.queue = queue
+        self.store_path = store_path
+        self.traces_root = traces_root
+        self.options = options
+        self.lock = threading.Lock()
+
+    def lease(self, body):
+        tasks = self.queue.lease(body["worker"], body.get("count", 1), body.get("host"))
+        return {"tasks": [{"id": task_id, "shape": list(shape), "variant": list(variant)}
+                          for task_id, shape, variant in tasks],
+                "options": self.options, "done": not tasks and self.queue.finished()}
+
+    def heartbeat(self, body):
+        return {"tasks": self.queue.heartbeat(body["worker"], body.get("tasks", []))}
+
+    def complete(self, body):
+        shape, variant, _ = self.queue.task(body["task"])
+        recorded = self.queue.complete(body["worker"], body["task"],
+                                       {"env": body["env"], "times": body["times"],
+                                        "stability": body.get("stability", {})})
+        if recorded and any(body["times"].values()):
+            with self.lock:
+                store = ResultStore(self.store_path)
+                store.put(shape, body["times"], body["env"], body.get("stability"))
+                store.close()
+        m, k, n = shape
+        print(f"<== [{body['worker']}] M={m}, K={k}, N={n} {'done' if recorded else 'already done'}")
+        return {"recorded": recorded}
+
+    def fail(self, body):
+        self.queue.fail(body["worker"], body["task"], body.get("error", ""))
+        print(f"[WARN] {body['worker']} failed task {body['task']}: {body.get('error', '')}")
+        return {}
+
+    def trace(self, query, body):
+        """Archive one trace from the binary stream `body`, decompressed as it is read."""
+        shape, _, _ = self.queue.task(int(query["task"]))
+        with self.lock:
+            archive = TraceArchive(self.traces_root)
+            try:
+                entry_id = archive.add_stream(decompress_stream(query.get("codec", "gzip"), body), shape,
+                                              int(query.get("repeat", 0)) or None,
+                                              f"{query.get('worker', '')}:{query.get('run_id', '')}")
+            finally:
+                archive.close()
+        return {"id": entry_id}
+
+    def status(self):
+        return {"counts": self.queue.counts(),
+                "workers": [{"name": name, "host": host, "idle_seconds": round(time.time() - last_seen, 1),
+                             "done": done} for name, host, last_seen, done in self.queue.workers()]}
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    routes = ("lease", "heartbeat", "complete", "fail")
+
+    def _reply(self, code, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urllib.parse.urlparse(self.path).path == "/status":
+            self._reply(200, self.server.coordinator.status())
+        else:
+            self._reply(404, {"error": f"unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        route = url.path.strip("/")
+        length = int(self.headers.get("Content-Length", 0))
+        coordinator = self.server.coordinator
+        try:
+            if route == "trace":
+                # traces can be large: stream the body instead of reading it whole
+                query = dict(urllib.parse.parse_qsl(url.query))
+                with io.BufferedReader(LimitedReader(self.rfile, length)) as body:
+                    self._reply(200, coordinator.trace(query, body))
+            elif route in self.routes:
+                self._reply(200, getattr(coordinator, route)(json.loads(self.rfile.read(length) or b"{}")))
+            else:
+                self._reply(404, {"error": f"unknown endpoint {self.path}"})
+        except (KeyError, ValueError, OSError, EOFError, RuntimeError) as e:
+            self._reply(400, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(coordinator, host="0.0.0.0", port=DEFAULT_PORT, linger=2 * POLL_SECONDS, keep_serving=False):
+    """Serve until every task is done or failed (forever with keep_serving).
+
+    The server stays up `linger` seconds after the last task so that polling
+    workers learn that the sweep is over.
+    """
+    server = ThreadingHTTPServer((host, port), CoordinatorHandler)
+    server.daemon_threads = True
+    server.coordinator = coordinator
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"Coordinator listening on {host}:{server.server_address[1]}")
+    last = None
+    try:
+        while True:
+            time.sleep(min(coordinator.queue.lease_seconds / 4, 1.0))
+            coordinator.queue.reclaim()
+            counts = coordinator.queue.counts()
+            if counts != last:
+                print("[queue] " + ", ".join(f"{state} {counts[state]}" for state in STATES))
+                last = counts
+            if not keep_serving and coordinator.queue.finished():
+                time.sleep(linger)
+                break
+    except KeyboardInterrupt:
+        print("[WARN] interrupted; the queue is kept, serve it again to resume")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# === Worker agent ===
+
+class Client:
+    """JSON-over-HTTP client that retries while the coordinator is unreachable."""
+
+    def __init__(self, url, retry_seconds=CONNECT_RETRY_SECONDS):
+        self.url = url.rstrip("/")
+        self.retry_seconds = retry_seconds
+
+    def _open(self, request, open_body=None, length=None):
+        """Send `request`; with open_body, its body is the stream open_body() returns, reopened per attempt."""
+        deadline = time.time() + self.retry_seconds
+        while True:
+            body = None
+            if open_body is not None:
+                body = open_body()
+                request.data = body
+                # without a length urllib would send the stream chunked, which the coordinator does not read
+                request.add_header("Content-Length", str(length))
+            try:
+                with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+                    return json.loads(response.read() or b"{}")
+            except urllib.error.HTTPError as e:
+                raise RuntimeError(f"{request.full_url}: {e.code} {e.read().decode(errors='replace')}")
+            except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+                if time.time() > deadline:
+                    raise ConnectionError(f"coordinator {self.url} unreachable: {e}")
+                time.sleep(POLL_SECONDS)
+            finally:
+                if body is not None:
+                    body.close()
+
+    def post(self, endpoint, payload):
+        request = urllib.request.Request(f"{self.url}/{endpoint}", data=json.dumps(payload).encode(),
+                                         headers={"Content-Type": "application/json"})
+        return self._open(request)
+
+    def upload(self, endpoint, query, open_body, length):
+        """POST the `length`-byte binary stream open_body() returns."""
+        request = urllib.request.Request(f"{self.url}/{endpoint}?{urllib.parse.urlencode(query)}",
+                                         headers={"Content-Type": "application/octet-stream"})
+        return self._open(request, open_body, length)
+
+    def get(self, endpoint):
+        return self._open(urllib.request.Request(f"{self.url}/{endpoint}"))
+
+
+class Heartbeat(threading.Thread):
+    """Renews the lease of the task being measured every `interval` seconds."""
+
+    def __init__(self, client, worker, interval):
+        super().__init__(daemon=True)
+        self.client = client
+        self.worker = worker
+        self.interval = interval
+        self.task = None
+        self.lost = False
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            task = self.task
+            try:
+                held = self.client.post("heartbeat", {"worker": self.worker, "tasks": [task] if task else []})
+            except (ConnectionError, RuntimeError) as e:
+                print(f"[WARN] {self.worker}: heartbeat failed: {e}")
+                continue
+            if task is not None and task == self.task and task not in held["tasks"]:
+                print(f"[WARN] {self.worker}: lost the lease of task {task}")
+                self.lost = True
+
+    def stop(self):
+        self.stopped.set()
+
+
+def last_trace_id(backend):
+    """Id of the newest trace in the backend's archive (0 when it has none)."""
+    archive = getattr(backend, "archive", None)
+    return archive.last_id() if archive is not None else 0
+
+
+def upload_traces(client, worker, task_id, backend, shape, after):
+    """Send the traces the backend archived for `shape` with ids above `after`; returns how many.
+
+    `after` is last_trace_id() from before the task was measured. The archive
+    outlives the agent and holds earlier runs and variants of the same shape,
+    which must not be uploaded under this task. Each trace is sent as its
+    compressed archive member, read straight from the chunk file.
+    """
+    archive = getattr(backend, "archive", None)
+    if archive is None:
+        return 0
+    count = 0
+    for entry in archive.find(shape, after=after):
+        client.upload("trace", {"worker": worker, "task": task_id, "repeat": entry.repeat or 0,
+                                "run_id": entry.run_id or "", "codec": entry.codec},
+                      lambda entry=entry: archive.open_raw(entry), entry.length)
+        count += 1
+    return count
+
+
+def agent(url, device, local, heartbeat_interval=None):
+    """Lease, measure and upload tasks on one device until the coordinator has none left."""
+    os.environ["HIP_VISIBLE_DEVICES"] = device
+    # each device archives its own traces, so only this agent's traces are uploaded
+    local = dict(local, temp_dir=os.path.join(local.get("temp_dir", "temp"), f"device{device}"))
+    os.makedirs(local["temp_dir"], exist_ok=True)
+    worker = f"{socket.gethostname()}-{os.getpid()}-dev{device}"
+    client = Client(url)
+    heartbeat = None
+    backend, backend_key = None, None
+    try:
+        while True:
+            reply = client.post("lease", {"worker": worker, "count": 1, "host": socket.gethostname()})
+            if not reply["tasks"]:
+                if reply["done"]:
+                    break
+                time.sleep(POLL_SECONDS)
+                continue
+            if heartbeat is None:
+                interval = heartbeat_interval or reply["options"].get("lease_seconds", LEASE_SECONDS) / 3
+                heartbeat = Heartbeat(client, worker, interval)
+                heartbeat.start()
+            task = reply["tasks"][0]
+            shape, variant = tuple(task["shape"]), GemmVariant(*task["variant"])
+            options = dict(reply["options"], **local)
+            options["variant"] = variant
+            m, k, n = shape
+            print(f"==> [{worker}] Running M={m}, K={k}, N={n}")
+            # the lease is renewed from here until the results are uploaded
+            heartbeat.task, heartbeat.lost = task["id"], False
+            try:
+                key = json.dumps(options, sort_keys=True)
+                if key != backend_key:
+                    if backend is not None:
+                        backend.close()
+                    backend, backend_key = make_backend(options), key
+                    env = current_env(variant.dtype, backend=options["backend"],
+                                      profiler=options.get("profiler", "hipprof"), layout=layout_tag(variant))
+                before = last_trace_id(backend)
+                times = measure_shape(shape, options, backend)
+                upload_traces(client, worker, task["id"], backend, shape, before)
+                if not any(times.values()):
+                    # every run failed: hand the task back so it is retried and counted against max_attempts
+                    client.post("fail", {"worker": worker, "task": task["id"], "error": "no kernel times"})
+                    continue
+                client.post("complete", {"worker": worker, "task": task["id"], "env": env, "times": times,
+                                         "stability": {p: stability_score(v) for p, v in times.items()}})
+            except ConnectionError:
+                raise
+            except (Exception, SystemExit) as e:
+                # any backend error (including a backend that exits) fails the task, not the agent
+                print(f"[WARN] {worker}: task {task['id']} failed: {type(e).__name__}: {e}")
+                client.post("fail", {"worker": worker, "task": task["id"], "error": f"{type(e).__name__}: {e}"})
+            finally:
+                heartbeat.task = None
+    except ConnectionError as e:
+        print(f"Error: {e}")
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
+        if backend is not None:
+            backend.close()
+    print(f"[OK] {worker} finished")
+
+
+def run_agents(url, devices, local):
+    """One agent process per device; returns when all of them exit."""
+    workers = [mp.Process(target=agent, args=(url, d, local)) for d in devices]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+
+# === Command line ===
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-node GEMM sweep: a work-queue coordinator and worker agents.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serve = sub.add_parser("serve", help="queue a sweep and serve its tasks to workers")
+    p_serve.add_argument("shapes", help="shape file or shape space (see shapeSpace.py)")
+    p_serve.add_argument("kernel_list", help="kernel name patterns, one per line")
+    p_serve.add_argument("--host", default="0.0.0.0")
+    p_serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p_serve.add_argument("--queue", default=DEFAULT_QUEUE, help="task queue file; serve it again to resume")
+    p_serve.add_argument("--store", default=os.path.join("temp", "results.sqlite"), help="result store")
+    p_serve.add_argument("--traces", default=os.path.join("temp", "traces"), help="archive for uploaded traces")
+    p_serve.add_argument("--lease", type=float, default=LEASE_SECONDS,
+                         help="seconds a task stays leased without a heartbeat")
+    p_serve.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    p_serve.add_argument("--keep-serving", action="store_true", help="keep serving after the queue is empty")
+    p_serve.add_argument("--bench", default="python benchGemm.py", help="benchmark command, M K N are appended")
+    p_serve.add_argument("--backend", choices=sorted(BACKENDS), default="hipprof", help="timing backend")
+    p_serve.add_argument("--min-repeat", type=int, default=MIN_RUNS)
+    p_serve.add_argument("--repeat", type=int, default=MAX_RUNS, help="maximum runs per shape")
+    p_serve.add_argument("--rel-ci", type=float, default=REL_CI)
+    p_serve.add_argument("--pick", choices=["min", "first"], default="first")
+    p_serve.add_argument("--ignore-case", action="append", default=[],
+                         help="kernel pattern matched case-insensitively (repeatable)")
+    p_serve.add_argument("--output", default="gemm_sweep_results.csv")
+    add_variant_sweep_args(p_serve)
+
+    p_worker = sub.add_parser("worker", help="measure tasks from a coordinator on this node's devices")
+    p_worker.add_argument("url", help="coordinator URL, e.g. http://host:8765")
+    p_worker.add_argument("--devices", help="comma-separated device ids (default: all visible)")
+    p_worker.add_argument("--profiler", default="hipprof --pmc", help="profiler command (or a stand-in script)")
+    p_worker.add_argument("--temp-dir", default="temp")
+    p_worker.add_argument("--run-timeout", type=float, default=RUN_TIMEOUT)
+    p_worker.add_argument("--retries", type=int, default=RUN_RETRIES)
+
+    p_status = sub.add_parser("status", help="print the queue and worker status of a coordinator")
+    p_status.add_argument("url")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        local = {"profiler": args.profiler, "temp_dir": args.temp_dir, "run_timeout": args.run_timeout,
+                 "retries": args.retries}
+        os.makedirs(args.temp_dir, exist_ok=True)
+        run_agents(args.url, args.devices.split(",") if args.devices else visible_devices(), local)
+        return
+    if args.command == "status":
+        try:
+            status = Client(args.url, retry_seconds=0).get("status")
+        except (ConnectionError, RuntimeError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(", ".join(f"{state} {status['counts'][state]}" for state in STATES))
+        for w in status["workers"]:
+            print(f"{w['name']}\t{w['host']}\t{w['done']} done\tlast seen {w['idle_seconds']}s ago")
+        return
+
+    try:
+        variants = variants_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    shapes = load_space(args.shapes)
+    patterns = read_kernel_list(args.kernel_list)
+    if not patterns:
+        print("Error: kernel list file is empty or not found.")
+        sys.exit(1)
+    options = {
+        "backend": args.backend,
+        "bench_cmd": args.bench,
+        "patterns": patterns,
+        "ignore_case": args.ignore_case,
+        "pick": args.pick,
+        "min_repeat": args.min_repeat,
+        "repeat": args.repeat,
+        "rel_ci": args.rel_ci,
+        "lease_seconds": args.lease,
+    }
+    queue = TaskQueue(args.queue, args.lease, args.max_attempts)
+    for variant in variants:
+        added = queue.add(shapes, variant)
+        print(f"[{variant.dtype} {layout_tag(variant)}] {added} of {len(shapes)} shapes queued "
+              f"({len(shapes) - added} already in {args.queue})")
+    serve(Coordinator(queue, args.store, args.traces, options), args.host, args.port, keep_serving=args.keep_serving)
+
+    results = queue.results()
+    write_csv(args.output, results, patterns)
+    counts = queue.counts()
+    print(f"\n{counts['done']} shapes done, {counts['failed']} failed; results saved to: {args.output}")
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Spread a GEMM shape sweep across all visible devices.
+
+One worker process per device pins itself with HIP_VISIBLE_DEVICES and
+pulls shapes from a shared queue. The queue is ordered by estimated FLOPs
+(largest first), so the long shapes start early and the small ones fill in
+the gaps at the end. Each worker finds its pmc file through the pid that
+hipprof prints, so concurrent runs never pick up each other's traces.
+
+--order interleaves the runs of several shapes, --sentinel corrects clock
+and thermal drift with a re-measured reference shape, and --pin-cpus pins
+the workers; every result carries a stability score (see stability.py).
+
+--dtype, --trans, --batch-count, --pad, --alpha and --beta take
+comma-separated lists; the sweep runs once per combination (see
+gemmVariant.py). --harness-profile records where the sweep's time goes
+(see harnessProfile.py).
+"""
+import argparse
+import csv
+import math
+import multiprocessing as mp
+import os
+import queue
+import statistics
+import sys
+
+import harnessProfile
+from counterStore import COUNTER_SETS, parse_counter_set
+from gemmVariant import VARIANT_COLUMNS, add_variant_sweep_args, layout_tag, variants_from_args
+from getKernelTime import BACKENDS, RUN_RETRIES, RUN_TIMEOUT, make_backend, measure, read_kernel_list
+from resultStore import ResultStore, current_env, query_torch
+from sampleStats import MAX_RUNS, MIN_RUNS, REL_CI, summarize
+from shapeSpace import load_space
+from stability import (ORDERS, SENTINEL_EVERY, WINDOW, DriftMonitor, cpu_slice, measure_window, parse_sentinel,
+                       pin_process)
+
+DEVICE_ENV_VARS = ("HIP_VISIBLE_DEVICES", "ROCR_VISIBLE_DEVICES", "CUDA_VISIBLE_DEVICES")
+
+
+def estimate_flops(shape):
+    m, k, n = shape
+    return 2 * m * k * n
+
+
+def visible_devices():
+    """Device ids from the *_VISIBLE_DEVICES variables, else torch's device count."""
+    for var in DEVICE_ENV_VARS:
+        value = os.environ.get(var)
+        if value:
+            return [d.strip() for d in value.split(",") if d.strip()]
+    count = int(query_torch("torch.cuda.device_count()", "0"))
+    return [str(i) for i in range(count)] or ["0"]
+
+
+def measure_shape(shape, options, backend=None):
+    """Measure one shape until stable; return {pattern: [per-run time, ...]}.
+
+    Runs continue until every pattern meets the sampleStats stopping rule
+    between options["min_repeat"] and options["repeat"] attempts (a fixed
+    `repeat` runs when min_repeat is not given). options["backend"] selects
+    the timing backend (see getKernelTime.BACKENDS); with hipprof, the min
+    (autoPerf) or first (getKernelTime) matching kernel time of each run is
+    kept, depending on options["pick"].
+    """
+    backend = backend or make_backend(options)
+    max_repeat = options["repeat"]
+    return measure(backend, shape, options.get("min_repeat", max_repeat), max_repeat,
+                   options.get("rel_ci", REL_CI), options.get("max_cv"))
+
+
+def _worker(device, tasks, results, options, slot=0, slots=1):
+    os.environ["HIP_VISIBLE_DEVICES"] = device
+    with harnessProfile.span("worker", device=device):
+        pin_process(cpu_slice(options.get("cpus"), slot, slots))
+        backend = make_backend(options)
+        monitor = None
+        if options.get("sentinel"):
+            log_path = os.path.join(options.get("temp_dir", "temp"), f"drift_device{device}.csv")
+            monitor = DriftMonitor(backend, options["sentinel"], options.get("sentinel_every", SENTINEL_EVERY),
+                                   log_path)
+
+        def pull():
+            task = tasks.get()
+            if task is not None:
+                shape = task[1]
+                print(f"==> [device {device}] Running M={shape[0]}, K={shape[1]}, N={shape[2]}")
+            return task
+
+        order = options.get("order", "sequential")
+        window = 1 if order == "sequential" else options.get("window", WINDOW)
+        max_repeat = options["repeat"]
+        for index, _, times, stability in measure_window(
+                backend, pull, order, window, options.get("min_repeat", max_repeat), max_repeat,
+                options.get("rel_ci", REL_CI), options.get("max_cv"), monitor, options.get("seed")):
+            results.put((index, device, times, stability))
+        backend.close()
+
+
+def run_sweep(shapes, options, devices=None, on_result=None):
+    """Measure all shapes across devices; return {shape: (device, times, stability)}.
+
+    `options` holds backend, bench_cmd, patterns, ignore_case, pick, repeat,
+    profiler, temp_dir, wait_timeout, run_timeout, retries, variant, counters
+    and counter_store (see measure_shape), and the stability controls order,
+    window, sentinel, sentinel_every, cpus and seed (see stability.py).
+    on_result(shape, device, times, stability) is called in this process as
+    soon as each shape finishes; stability is {pattern: score}.
+
+    A worker pulls a whole window of shapes at once, so the window is capped
+    at the sweep's share per device; otherwise a small sweep would all land
+    on the first worker.
+    """
+    devices = devices or visible_devices()
+    share = max(1, math.ceil(len(shapes) / len(devices)))
+    options = dict(options, window=min(options.get("window", WINDOW), share))
+    os.makedirs(options.get("temp_dir", "temp"), exist_ok=True)
+
+    tasks = mp.Queue()
+    results = mp.Queue()
+    order = sorted(range(len(shapes)), key=lambda i: estimate_flops(shapes[i]), reverse=True)
+    for i in order:
+        tasks.put((i, shapes[i]))
+    for _ in devices:
+        tasks.put(None)
+
+    workers = [mp.Process(target=_worker, args=(d, tasks, results, options, i, len(devices)))
+               for i, d in enumerate(devices)]
+    for w in workers:
+        w.start()
+
+    done = {}
+    while len(done) < len(shapes):
+        try:
+            index, device, times, stability = results.get(timeout=1)
+        except queue.Empty:
+            if not any(w.is_alive() for w in workers):
+                print(f"[WARN] all workers exited with {len(shapes) - len(done)} shapes unmeasured")
+                break
+            continue
+        done[index] = (device, times, stability)
+        if on_result is not None:
+            on_result(shapes[index], device, times, stability)
+
+    for w in workers:
+        w.join()
+    return {shapes[i]: done[i] for i in sorted(done)}
+
+
+def filter_and_average(values):
+    """Average excluding max and min (plain mean for 2 values or fewer)."""
+    if not values:
+        return None
+    if len(values) <= 2:
+        return statistics.mean(values)
+    return statistics.mean(sorted(values)[1:-1])
+
+
+STAT_COLUMNS = [("median", "median(s)"), ("iqr", "iqr(s)"), ("ci_low", "ci95_low(s)"),
+                ("ci_high", "ci95_high(s)"), ("n", "n")]
+
+
+def stat_columns(prefix):
+    return [f"{prefix}_{label}" for _, label in STAT_COLUMNS]
+
+
+def stat_values(samples):
+    s = summarize(samples)
+    return [s[field] if s[field] is not None else "N/A" for field, _ in STAT_COLUMNS]
+
+
+def write_csv(path, rows, patterns):
+    """rows: (shape, variant, device, {pattern: samples}, {pattern: stability}) in output order."""
+    with harnessProfile.span("csv"), open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        header = ["M", "K", "N"] + VARIANT_COLUMNS + [f"{p}_avg(s)" for p in patterns]
+        for p in patterns:
+            header += stat_columns(p) + [f"{p}_stability"]
+        writer.writerow(header + ["Device"])
+        for shape, variant, device, times, stability in rows:
+            avgs = [filter_and_average(times.get(p, [])) for p in patterns]
+            row = list(shape) + list(variant) + [a if a is not None else "N/A" for a in avgs]
+            for p in patterns:
+                score = stability.get(p)
+                row += stat_values(times.get(p, [])) + [score if score is not None else "N/A"]
+            writer.writerow(row + [device])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a GEMM shape sweep across all visible devices.")
+    parser.add_argument("shapes", help="shape file or shape space (see shapeSpace.py), or '-' for stdin")
+    parser.add_argument("kernel_list", help="kernel name patterns, one per line")
+    parser.add_argument("--bench", default="python benchGemm.py", help="benchmark command, M K N are appended")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="hipprof", help="timing backend")
+    parser.add_argument("--profiler", default="hipprof --pmc", help="profiler command (or a stand-in script)")
+    parser.add_argument("--devices", help="comma-separated device ids (default: all visible)")
+    parser.add_argument("--run-timeout", type=float, default=RUN_TIMEOUT,
+                        help="kill a profiled run after this many seconds")
+    parser.add_argument("--retries", type=int, default=RUN_RETRIES, help="reruns after a timeout")
+    parser.add_argument("--min-repeat", type=int, default=MIN_RUNS)
+    parser.add_argument("--repeat", type=int, default=MAX_RUNS, help="maximum runs per shape")
+    parser.add_argument("--rel-ci", type=float, default=REL_CI,
+                        help="stop once the 95%% CI of the median is this fraction of the median")
+    parser.add_argument("--pick", choices=["min", "first"], default="first",
+                        help="which matching kernel to keep per run")
+    parser.add_argument("--output", default="gemm_sweep_results.csv")
+    parser.add_argument("--store", default=os.path.join("temp", "results.sqlite"),
+                        help="result store; shapes already in it are skipped")
+    parser.add_argument("--max-age", type=float, help="re-measure results older than this many hours")
+    parser.add_argument("--counters", help="extra hardware counters for hipprof: set names "
+                        f"({', '.join(COUNTER_SETS)}) and/or counter names, comma-separated")
+    parser.add_argument("--counter-store", help="write every launch's counters to this Parquet store "
+                        "(see counterStore.py)")
+    parser.add_argument("--order", choices=ORDERS, default="sequential",
+                        help="run order: all repeats of a shape back-to-back, or one run per shape per round "
+                        "over a window of shapes (interleave) in shuffled order (random)")
+    parser.add_argument("--window", type=int, default=WINDOW, help="shapes in flight per device for interleaved orders")
+    parser.add_argument("--sentinel", help="'M K N' re-measured every --sentinel-every runs to correct drift")
+    parser.add_argument("--sentinel-every", type=int, default=SENTINEL_EVERY)
+    parser.add_argument("--pin-cpus", help="pin each worker to CPUs: 'auto', a list such as '0-7', "
+                        "or one list per worker such as '0-3;4-7'")
+    parser.add_argument("--seed", type=int, help="seed of the random run order")
+    parser.add_argument("--harness-profile", help="record where the sweep's time goes into this directory "
+                        "(Chrome trace + summary, see harnessProfile.py)")
+    add_variant_sweep_args(parser)
+    args = parser.parse_args()
+    harnessProfile.start(args.harness_profile)
+
+    try:
+        variants = variants_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    shapes = load_space(args.shapes)
+    patterns = read_kernel_list(args.kernel_list)
+    if not patterns:
+        print("Error: kernel list file is empty or not found.")
+        sys.exit(1)
+
+    options = {
+        "backend": args.backend,
+        "bench_cmd": args.bench,
+        "patterns": patterns,
+        "pick": args.pick,
+        "min_repeat": args.min_repeat,
+        "repeat": args.repeat,
+        "rel_ci": args.rel_ci,
+        "profiler": args.profiler,
+        "temp_dir": "temp",
+        "run_timeout": args.run_timeout,
+        "retries": args.retries,
+        "counters": parse_counter_set(args.counters),
+        "counter_store": args.counter_store,
+        "order": args.order,
+        "window": args.window,
+        "sentinel": parse_sentinel(args.sentinel),
+        "sentinel_every": args.sentinel_every,
+        "cpus": args.pin_cpus,
+        "seed": args.seed,
+    }
+    devices = args.devices.split(",") if args.devices else None
+
+    store = ResultStore(args.store, args.max_age * 3600 if args.max_age else None)
+    rows = []
+    for variant in variants:
+        env = current_env(variant.dtype, backend=args.backend, profiler=args.profiler, layout=layout_tag(variant))
+        todo = store.missing(shapes, patterns, env)
+        print(f"[{variant.dtype} {env['layout']}] {len(shapes) - len(todo)} of {len(shapes)} shapes "
+              f"already in {args.store}")
+
+        def save(shape, device, times, stability, env=env):
+            if any(times.values()):
+                with harnessProfile.span("store", shape):
+                    store.put(shape, times, env, stability)
+
+        options["variant"] = variant
+        measured = run_sweep(todo, options, devices, on_result=save) if todo else {}
+        rows += [(s, variant, measured[s][0] if s in measured else "cached", store.get_times(s, patterns, env),
+                  store.get_stability(s, patterns, env)) for s in shapes]
+    write_csv(args.output, rows, patterns)
+    print(f"\nAll sweep results saved to: {args.output}")
+    harnessProfile.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""Compressed, indexed archive for raw hipprof pmc traces.
+
+Instead of one loose text file per run in temp/, every trace is compressed
+as an independent member (zstd when the `zstandard` package is installed,
+gzip otherwise) and appended to a chunk file; a new chunk file is started
+once the last one has reached CHUNK_BYTES. A SQLite index maps (M, K, N,
+repeat, run id) to the chunk, offset and length of its member, so any
+single trace can be read back and re-parsed without touching the rest of
+the archive. Appends are serialized with a lock file, so the sweep workers
+of several devices can share one archive.
+
+Traces are compressed and decompressed as streams in BLOCK_BYTES blocks:
+archiving a multi-GB trace, or re-parsing it with
+pmcParser.iter_records(archive.open(entry)), never holds the whole trace in
+memory.
+"""
+import argparse
+import fcntl
+import gzip
+import io
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_ROOT = os.path.join("temp", "traces")
+CHUNK_BYTES = 64 << 20
+BLOCK_BYTES = 1 << 20
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS traces (
+    id INTEGER PRIMARY KEY,
+    m INTEGER,
+    k INTEGER,
+    n INTEGER,
+    repeat INTEGER,
+    run_id TEXT,
+    source TEXT,
+    chunk INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    created REAL NOT NULL
+)
+"""
+INDEX = "CREATE INDEX IF NOT EXISTS traces_shape ON traces (m, k, n, repeat)"
+
+TraceEntry = namedtuple("TraceEntry", ["id", "m", "k", "n", "repeat", "run_id", "source",
+                                       "chunk", "offset", "length", "raw_size", "codec", "created"])
+
+# Loose trace names left in temp/ by earlier versions of the tools
+SHAPE_NAME_RE = re.compile(r"M(\d+)_K(\d+)_N(\d+)_(\d+)\.txt$")
+PID_NAME_RE = re.compile(r"pmc_results_(\d+)\.txt$")
+
+
+def compress_stream(src, dst):
+    """Compress the binary stream src onto dst block by block; returns (codec, raw bytes read)."""
+    if zstandard is not None:
+        raw, _ = zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, dst, read_size=BLOCK_BYTES)
+        return "zstd", raw
+    raw = 0
+    # filename="" keeps the chunk file's name out of the member header
+    with gzip.GzipFile(filename="", mode="wb", compresslevel=GZIP_LEVEL, fileobj=dst, mtime=0) as z:
+        while True:
+            block = src.read(BLOCK_BYTES)
+            if not block:
+                break
+            z.write(block)
+            raw += len(block)
+    return "gzip", raw
+
+
+def decompress_stream(codec, src):
+    """Binary reader of the decompressed data of the compressed stream src."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("trace is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().stream_reader(src, read_size=BLOCK_BYTES)
+    return gzip.GzipFile(mode="rb", fileobj=src)
+
+
+class LimitedReader(io.RawIOBase):
+    """Raw reader of the next `length` bytes of the binary stream `raw`."""
+
+    def __init__(self, raw, length, close_raw=False):
+        super().__init__()
+        self.raw = raw
+        self.remaining = length
+        self.close_raw = close_raw
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.remaining <= 0:
+            return 0
+        with memoryview(b) as view:
+            n = self.raw.readinto(view[:self.remaining]) or 0
+        self.remaining -= n
+        return n
+
+    def close(self):
+        if not self.closed and self.close_raw:
+            self.raw.close()
+        super().close()
+
+
+class TraceReader(io.TextIOWrapper):
+    """Text stream over one archived trace; closing it also closes the chunk file."""
+
+    def __init__(self, member, chunk_file):
+        super().__init__(member, encoding="utf-8", errors="replace")
+        self.chunk_file = chunk_file
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.chunk_file.close()
+
+
+class TraceArchive:
+    """Chunked trace archive under `root` (chunk_<n>.bin files plus index.sqlite)."""
+
+    def __init__(self, root=DEFAULT_ROOT, chunk_bytes=CHUNK_BYTES):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.chunk_bytes = chunk_bytes
+        self.conn = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+        self.conn.execute(INDEX)
+        self.conn.commit()
+
+    def _chunk_path(self, chunk):
+        return os.path.join(self.root, f"chunk_{chunk:05d}.bin")
+
+    def _current_chunk(self):
+        """Chunk to append to; starts a new one once the last has reached chunk_bytes."""
+        row = self.conn.execute("SELECT MAX(chunk) FROM traces").fetchone()
+        chunk = row[0] or 0
+        path = self._chunk_path(chunk)
+        if os.path.exists(path) and os.path.getsize(path) >= self.chunk_bytes:
+            chunk += 1
+        return chunk
+
+    def add_stream(self, stream, shape=None, repeat=None, run_id=None, source=None):
+        """Archive the trace read from the binary stream `stream`; returns its id.
+
+        The trace is compressed straight into the chunk file, and the
+        member's offset and length are recorded once it is written.
+        """
+        m, k, n = shape if shape is not None else (None, None, None)
+        with open(os.path.join(self.root, "archive.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            chunk = self._current_chunk()
+            with open(self._chunk_path(chunk), "ab") as f:
+                offset = f.tell()
+                try:
+                    codec, raw_size = compress_stream(stream, f)
+                except BaseException:
+                    # drop the partial member so the chunk ends with a complete one
+                    f.truncate(offset)
+                    raise
+                length = f.tell() - offset
+            with self.conn:
+                cur = self.conn.execute(
+                    "INSERT INTO traces (m, k, n, repeat, run_id, source, chunk, offset, length, raw_size,"
+                    " codec, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (m, k, n, repeat, None if run_id is None else str(run_id), source,
+                     chunk, offset, length, raw_size, codec, time.time()))
+        return cur.lastrowid
+
+    def add_bytes(self, data, shape=None, repeat=None, run_id=None, source=None):
+        """Archive one trace held in memory; returns its id."""
+        return self.add_stream(io.BytesIO(data), shape, repeat, run_id, source)
+
+    def add(self, path, shape=None, repeat=None, run_id=None, remove=True):
+        """Archive the trace file at `path` (deleted afterwards unless remove=False)."""
+        with open(path, "rb") as f:
+            entry_id = self.add_stream(f, shape, repeat, run_id, os.path.basename(path))
+        if remove:
+            os.remove(path)
+        return entry_id
+
+    def find(self, shape=None, repeat=None, run_id=None, after=None):
+        """TraceEntry list (oldest first) matching every given key; `after` keeps ids above it."""
+        where, args = [], []
+        if shape is not None:
+            where.append("m=? AND k=? AND n=?")
+            args.extend(shape)
+        if repeat is not None:
+            where.append("repeat=?")
+            args.append(repeat)
+        if run_id is not None:
+            where.append("run_id=?")
+            args.append(str(run_id))
+        if after is not None:
+            where.append("id>?")
+            args.append(after)
+        sql = "SELECT * FROM traces"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return [TraceEntry(*row) for row in self.conn.execute(sql + " ORDER BY id", args)]
+
+    def last_id(self):
+        """Id of the newest trace (0 for an empty archive)."""
+        return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM traces").fetchone()[0]
+
+    def entry(self, entry_id):
+        row = self.conn.execute("SELECT * FROM traces WHERE id=?", (entry_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"no trace with id {entry_id}")
+        return TraceEntry(*row)
+
+    def open_raw(self, entry):
+        """Binary reader of the compressed member of one trace (a TraceEntry or an id)."""
+        if not isinstance(entry, TraceEntry):
+            entry = self.entry(entry)
+        f = open(self._chunk_path(entry.chunk), "rb")
+        f.seek(entry.offset)
+        return io.BufferedReader(LimitedReader(f, entry.length, close_raw=True), BLOCK_BYTES)
+
+    def open(self, entry):
+        """Text stream over one trace, decompressed as it is read, e.g. for pmcParser.iter_records()."""
+        if not isinstance(entry, TraceEntry):
+            entry = self.entry(entry)
+        member = self.open_raw(entry)
+        try:
+            return TraceReader(decompress_stream(entry.codec, member), member)
+        except BaseException:
+            member.close()
+            raise
+
+    def read(self, entry):
+        """Decompressed text of one trace; prefer open() for large traces."""
+        with self.open(entry) as f:
+            return f.read()
+
+    def stats(self):
+        """(traces, raw bytes, archived bytes, chunk files)."""
+        count, raw, packed = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(length), 0) FROM traces").fetchone()
+        chunks = self.conn.execute("SELECT COUNT(DISTINCT chunk) FROM traces").fetchone()[0]
+        return count, raw, packed, chunks
+
+    def close(self):
+        self.conn.close()
+
+
+def import_files(archive, paths, remove=True):
+    """Move loose trace files (M{m}_K{k}_N{n}_{x}.txt, pmc_results_{pid}.txt) into the archive."""
+    count = 0
+    for path in paths:
+        name = os.path.basename(path)
+        shape_match = SHAPE_NAME_RE.search(name)
+        pid_match = PID_NAME_RE.search(name)
+        if shape_match:
+            m, k, n, run_id = shape_match.groups()
+            archive.add(path, (int(m), int(k), int(n)), run_id=run_id, remove=remove)
+        elif pid_match:
+            archive.add(path, run_id=pid_match.group(1), remove=remove)
+        else:
+            print(f"[WARN] skipping {path}: not a trace file name")
+            continue
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compressed archive of raw pmc traces.")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="archive directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_list = sub.add_parser("list", help="list archived traces")
+    p_list.add_argument("shape", nargs="*", type=int, help="optional M K N filter")
+    p_cat = sub.add_parser("cat", help="print one trace")
+    p_cat.add_argument("id", type=int)
+    p_import = sub.add_parser("import", help="move loose trace files into the archive")
+    p_import.add_argument("files", nargs="+")
+    p_import.add_argument("--keep", action="store_true", help="do not delete the imported files")
+    sub.add_parser("stats", help="archive size summary")
+    args = parser.parse_args(argv)
+
+    archive = TraceArchive(args.root)
+    if args.command == "list":
+        if args.shape and len(args.shape) != 3:
+            parser.error("shape filter is M K N")
+        for e in archive.find(tuple(args.shape) if args.shape else None):
+            shape = f"{e.m}x{e.k}x{e.n}" if e.m is not None else "-"
+            print(f"{e.id}\t{shape}\trepeat={e.repeat}\trun={e.run_id}\t{e.raw_size}B -> {e.length}B ({e.codec})")
+    elif args.command == "cat":
+        with archive.open(args.id) as f:
+            shutil.copyfileobj(f, sys.stdout, BLOCK_BYTES)
+    elif args.command == "import":
+        count = import_files(archive, args.files, remove=not args.keep)
+        print(f"[OK] imported {count} traces into {args.root}")
+    else:
+        count, raw, packed, chunks = archive.stats()
+        ratio = raw / packed if packed else 0.0
+        print(f"{count} traces in {chunks} chunk files: {raw} bytes raw, {packed} bytes archived ({ratio:.1f}x)")
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
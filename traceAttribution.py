@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Full-trace kernel attribution for the bench scripts' batch mode.
+
+The kernel-time collectors keep one launch per kernel pattern and drop the
+rest of the trace. This tool keeps every launch instead. It runs
+`<bench> --batch <shapes> --attribute` under the profiler, so the harness
+marks every op call (and the creation of each shape's inputs) with a
+marker kernel and a ``BENCH_OP`` line. Every launch between two markers
+belongs to the op named by the first one, in trace order.
+
+For every measured op call:
+- the main kernel is the first launch that matches the kernel list;
+- every other launch is auxiliary, e.g. the copy kernel that
+  `B.T.contiguous()` launches ahead of lightop.gemm;
+- the op time is the span from the first launch's start to the last
+  launch's end when the profiler records BeginNs/EndNs counters, otherwise
+  the sum of all launch times.
+
+The launches CSV lists every launch with its op, order and role. The
+summary CSV holds the per-(shape, op) median main-kernel, auxiliary and
+op times. For each shape the fastest op is reported both by main-kernel
+time and end to end.
+
+Options this script does not know are passed to the bench script, e.g.
+the variant options of gemmVariant.py.
+"""
+import argparse
+import csv
+import sys
+
+from getKernelTime import (MARKER_PATTERNS, OP_MARKER_RE, PMC_WAIT_TIMEOUT, launch_hipprof, read_kernel_list,
+                           split_by_markers, wait_for_file)
+from pmcParser import KernelMatcher, iter_records
+from procRunner import to_argv
+from sampleStats import summarize
+from traceArchive import TraceArchive
+
+LAUNCH_COLUMNS = ["Seq", "Phase", "M", "K", "N", "Repeat", "Op", "Launch", "Kernel", "Time(s)", "Role"]
+SUMMARY_COLUMNS = ["M", "K", "N", "Op", "MainPattern", "Calls", "Launches",
+                   "Main_median(s)", "Aux_median(s)", "Op_median(s)", "Op_ci95_low(s)", "Op_ci95_high(s)",
+                   "AuxKernels"]
+
+
+def parse_op_markers(output):
+    """Return [(seq, phase, (M, K, N), repeat, op), ...] in the order the benchmark printed them."""
+    markers = []
+    for m in OP_MARKER_RE.finditer(output):
+        seq, phase, M, K, N, rep, op = m.groups()
+        markers.append((int(seq), phase, (int(M), int(K), int(N)), int(rep), op))
+    return markers
+
+
+def attribute_launches(records, markers, matcher):
+    """Yield one launch row (see LAUNCH_COLUMNS) per kernel record, in trace order.
+
+    The role is 'main' for the first launch of an op call matching the
+    kernel list and 'aux' for every other launch.
+    """
+    seen = {}
+    for seq, phase, shape, rep, op, record in split_by_markers(records, markers, MARKER_PATTERNS):
+        launch, has_main = seen.get(seq, (0, False))
+        role = "aux"
+        if not has_main and matcher.match(record.name):
+            role, has_main = "main", True
+        seen[seq] = (launch + 1, has_main)
+        yield {"seq": seq, "phase": phase, "shape": shape, "repeat": rep, "op": op, "launch": launch,
+               "kernel": record.name, "time": record.time, "role": role, "counters": record.counters}
+
+
+def _call_time(launches):
+    """Span of one op call from BeginNs/EndNs when every launch has them, else the summed launch time."""
+    if launches and all("BeginNs" in l["counters"] and "EndNs" in l["counters"] for l in launches):
+        start = min(l["counters"]["BeginNs"] for l in launches)
+        end = max(l["counters"]["EndNs"] for l in launches)
+        return (end - start) / 1e9
+    return sum(l["time"] or 0.0 for l in launches)
+
+
+def summarize_ops(launches, matcher, markers):
+    """{(shape, op): summary dict} over the measured calls (and the inputs) of every op."""
+    calls = {}
+    for l in launches:
+        calls.setdefault(l["seq"], []).append(l)
+
+    ops = {}
+    for seq, phase, shape, rep, op in markers:
+        if phase not in ("run", "inputs"):
+            continue
+        entry = ops.setdefault((shape, op), {"main": [], "aux": [], "op": [], "launches": 0,
+                                             "aux_kernels": {}, "pattern": ""})
+        launched = calls.get(seq, [])
+        main = [l for l in launched if l["role"] == "main"]
+        aux = [l for l in launched if l["role"] == "aux"]
+        if main:
+            entry["main"].append(main[0]["time"])
+            entry["pattern"] = entry["pattern"] or matcher.match(main[0]["kernel"])[0]
+        entry["aux"].append(sum(l["time"] or 0.0 for l in aux))
+        entry["op"].append(_call_time(launched))
+        entry["launches"] += len(launched)
+        for l in aux:
+            entry["aux_kernels"][l["kernel"]] = entry["aux_kernels"].get(l["kernel"], 0) + 1
+    for entry in ops.values():
+        entry["calls"] = len(entry["op"])
+    return ops
+
+
+def write_launches(path, launches):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(LAUNCH_COLUMNS)
+        for l in launches:
+            writer.writerow([l["seq"], l["phase"], *l["shape"], l["repeat"], l["op"], l["launch"], l["kernel"],
+                             l["time"] if l["time"] is not None else "N/A", l["role"]])
+
+
+def write_summary(path, ops):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_COLUMNS)
+        for (shape, op), e in ops.items():
+            main = summarize([t for t in e["main"] if t is not None])
+            aux = summarize(e["aux"])
+            total = summarize(e["op"])
+            aux_kernels = ";".join(f"{name} x{count}" for name, count in e["aux_kernels"].items())
+            writer.writerow([*shape, op, e["pattern"] or "N/A", e["calls"], e["launches"],
+                             main["median"] if main["median"] is not None else "N/A",
+                             aux["median"] if aux["median"] is not None else "N/A",
+                             total["median"] if total["median"] is not None else "N/A",
+                             total["ci_low"] if total["ci_low"] is not None else "N/A",
+                             total["ci_high"] if total["ci_high"] is not None else "N/A",
+                             aux_kernels])
+
+
+def print_verdicts(ops):
+    """Fastest op per shape by main-kernel time and by end-to-end op time."""
+    shapes = {}
+    for (shape, op), e in ops.items():
+        if op == "inputs":
+            continue
+        main = summarize([t for t in e["main"] if t is not None])["median"]
+        total = summarize(e["op"])["median"]
+        if main is not None and total is not None:
+            shapes.setdefault(shape, []).append((op, main, total))
+    for (m, k, n), rows in shapes.items():
+        by_main = min(rows, key=lambda r: r[1])[0]
+        by_total = min(rows, key=lambda r: r[2])[0]
+        detail = "  ".join(f"{op}: main {main:.6f}s / op {total:.6f}s" for op, main, total in rows)
+        flag = "" if by_main == by_total else "  [WARN] verdict flips end to end"
+        print(f"[{m},{k},{n}]  {detail}  => {by_main} (main) / {by_total} (end to end){flag}")
+
+
+def run_attribution(shape_file, kernel_list, bench_cmd="python benchGemm.py", repeat=10, warmup=1,
+                    profiler="hipprof --pmc", timeout=None, wait_timeout=PMC_WAIT_TIMEOUT, bench_args=(),
+                    ignore_case=()):
+    """Profile shape_file in one `--batch --attribute` process; return (launches, {(shape, op): summary})."""
+    patterns = list(kernel_list) if isinstance(kernel_list, (list, tuple)) else read_kernel_list(kernel_list)
+    if not patterns:
+        raise ValueError("kernel list is empty")
+
+    run_cmd = to_argv(bench_cmd) + ["--batch", shape_file, "--repeat", str(repeat), "--warmup", str(warmup),
+                                    "--attribute"] + list(bench_args)
+    print(f"\n[Attribution] Running: {profiler} {' '.join(run_cmd)}")
+    pid, result = launch_hipprof(run_cmd, profiler, timeout, retries=0, keep=OP_MARKER_RE)
+    if pid is None:
+        print("Error: process id not found.")
+        print("".join(result.tail))
+        return [], {}
+    pmc_file = f"pmc_results_{pid}.txt"
+    if not wait_for_file(pmc_file, wait_timeout):
+        print(f"Error: {pmc_file} not generated.")
+        return [], {}
+
+    markers = parse_op_markers("".join(result.kept))
+    matcher = KernelMatcher(patterns, ignore_case)
+    launches = list(attribute_launches(iter_records(pmc_file), markers, matcher))
+
+    archive = TraceArchive()
+    archive.add(pmc_file, run_id=pid)
+    archive.close()
+    return launches, summarize_ops(launches, matcher, markers)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Attribute every kernel launch of a batch benchmark to its op.",
+        epilog="Unknown options are passed to the bench script (e.g. --dtype fp16 --trans NT).")
+    parser.add_argument("shapes", help="shape list file ('M K N' per line)")
+    parser.add_argument("kernel_list", help="main kernel name patterns, one per line")
+    parser.add_argument("--bench", default="python benchGemm.py", help="benchmark command")
+    parser.add_argument("--profiler", default="hipprof --pmc", help="profiler command (or a stand-in script)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--ignore-case", action="append", default=[],
+                        help="kernel pattern matched case-insensitively (repeatable)")
+    parser.add_argument("--output", default="trace_attribution",
+                        help="output prefix: <prefix>_launches.csv and <prefix>_summary.csv")
+    args, bench_args = parser.parse_known_args()
+
+    try:
+        launches, ops = run_attribution(args.shapes, args.kernel_list, args.bench, args.repeat, args.warmup,
+                                        args.profiler, bench_args=bench_args, ignore_case=args.ignore_case)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not launches:
+        print("Error: no kernel launches attributed.")
+        sys.exit(1)
+
+    write_launches(f"{args.output}_launches.csv", launches)
+    write_summary(f"{args.output}_summary.csv", ops)
+    print_verdicts(ops)
+    print(f"\n{len(launches)} launches saved to: {args.output}_launches.csv")
+    print(f"Per-op summary saved to: {args.output}_summary.csv")
+
+
+if __name__ == "__main__":
+    main()